@@ -13,8 +13,9 @@ First, load an IPython session with this module.
     $ source /reg/g/pcds/pyps/conda/pcds_conda
     $ ipython -i -m transfocate.automated_checkout
 
-If the above times out, re-run the script.  It's ophyd related and will be
-resolved eventually.  Otherwise, continue on.
+Connections to all devices are made concurrently, waiting up to 35 seconds,
+and the slowest PVs are listed.  If they still time out, check the IOC and
+re-run the script.  Otherwise, continue on.
 
 Manual mode
 ===========
@@ -30,11 +31,15 @@ To perform a scan for _all_ XRT lenses, use:
 
     >>> sweep_and_plot_xrt_all(num_steps=100)
 
-Per-lens data and plots will be saved to Excel and PNG/PDF files, respectively.
+Per-lens data and plots will be saved to Parquet and PNG/PDF files, respectively.
 This can be combined into a full checkout report with the following:
 
     >>> generate_report()
 
+If the scans are interrupted, running ``sweep_and_plot_xrt_all`` again will
+resume from the last points recorded in ``checkout_checkpoint.jsonl``.  Use
+``sweep_and_plot_xrt_all(num_steps=100, resume=False)`` to start over.
+
 Automatic mode
 ==============
 
@@ -58,33 +63,28 @@ Now, you'll have the option to perform the steps automatically or manually.
 
 """
 import matplotlib  # isort: skip
-import time
+import os
 
 try:  # noqa
     matplotlib.use("Qt5Agg")  # noqa
 except Exception:  # noqa
     ...  # noqa
 import bluesky
-import databroker
 import matplotlib.pyplot as plt
 from bluesky.callbacks import LiveTable
 
 import transfocate
 import transfocate.checkout
 
+from .connection import connect_devices, slowest_signals
+from .scan_data import ScanDataWriter, read_scan_data, remove_scan_data
+from .sweep_plot import (LiveSweepPlot, SweepPlot,  # noqa: F401
+                         plot_spreadsheet_data)
 from .table import generate_report
-from .table.info import MIN_ENERGY
-from .table.info import data as spreadsheet_data
+from .table.info import xrt_lenses_radii
 
 DESCRIPTION = __doc__
 
-lens_to_spreadsheet_df = {
-    0: spreadsheet_data["NO_LENS"],
-    1: spreadsheet_data["LENS1_750"],
-    2: spreadsheet_data["LENS2_428"],
-    3: spreadsheet_data["LENS3_333"],
-}
-
 fields = [
     "energy",
     "trip_low",
@@ -99,16 +99,17 @@ fields = [
     "xrt_radius",
 ]
 
+# Record of completed scan points, used to resume an interrupted checkout
+CHECKPOINT_FILENAME = "checkout_checkpoint.jsonl"
+
 
-def plot_sweeps():
-    """Plot the databroker results from a `sweep_energy_plan`."""
+def plot_sweeps(filenames):
+    """Plot the saved results from a `sweep_energy_plan` for each XRT lens."""
     fig, axes = plt.subplots(
         ncols=2, nrows=2, constrained_layout=True, figsize=(18, 16)
     )
-    plot_sweep_energy(0, ax=axes[0, 0], dbi=db[-4])
-    plot_sweep_energy(1, ax=axes[0, 1], dbi=db[-3])
-    plot_sweep_energy(2, ax=axes[1, 0], dbi=db[-2])
-    plot_sweep_energy(3, ax=axes[1, 1], dbi=db[-1])
+    for ax, (xrt_lens, filename) in zip(axes.flat, sorted(filenames.items())):
+        plot_sweep_energy(xrt_lens, read_scan_data(filename, columns=fields), ax=ax)
     fig.tight_layout()
 
     fn = "summary"
@@ -116,150 +117,106 @@ def plot_sweeps():
     plt.savefig(f"{fn}.pdf")
 
 
-def plot_sweep_energy(xrt_lens, dbi, ax=None):
-    """Plot the databroker results from a `sweep_energy_plan`."""
-    df = dbi.table()
-    df = df.set_index(df.energy)
-
+def plot_sweep_energy(xrt_lens, df, ax=None):
+    """Plot the results from a `sweep_energy_plan`, as read by `read_scan_data`."""
     if ax is None:
         _, ax = plt.subplots(constrained_layout=True, figsize=(12, 10))
 
-    plot_spreadsheet_data(xrt_lens, ax=ax, df=lens_to_spreadsheet_df[xrt_lens])
-
-    ax.set_yscale("log")
-
-    df = df.copy()
-    # **NOTE** for the purposes of plotting in log scale, set tfs_radius = 1
-    # when zero in actuality
-    df.loc[df.tfs_radius == 0.0, "tfs_radius"] = 1.0
-
-    ax.scatter(
-        df.energy, df.trip_high, label="Trip high [PLC]", color="black", marker="v"
-    )
-    ax.scatter(
-        df.energy, df.trip_low, label="Trip low [PLC]", color="black", marker="^"
-    )
-
-    if False:
-        when_faulted = df.where(df.faulted == 1).dropna()
-        ax.scatter(
-            when_faulted.index,
-            when_faulted.tfs_radius,
-            label="Scan point - fault",
-            color="red",
-            marker="x",
-        )
-    else:
-        when_faulted = df.where(df.min_fault == 1).dropna()
-        ax.scatter(
-            when_faulted.index,
-            when_faulted.tfs_radius,
-            label="Scan point - min energy fault",
-            color="red",
-            marker="x",
-        )
-
-        when_faulted = df.where(df.lens_required_fault == 1).dropna()
-        ax.scatter(
-            when_faulted.index,
-            when_faulted.tfs_radius,
-            label="Scan point - lens required",
-            color="red",
-            marker="D",
-        )
-
-        when_faulted = df.where(df.table_fault == 1).dropna()
-        ax.scatter(
-            when_faulted.index,
-            when_faulted.tfs_radius,
-            label="Scan point - table fault",
-            color="red",
-            marker="+",
-        )
-
-    when_not_faulted = df.where(df.faulted == 0).dropna()
-    ax.scatter(
-        when_not_faulted.index,
-        when_not_faulted.tfs_radius,
-        color="black",
-        marker=".",
-        s=3,
-        label="Scan point - no fault",
-    )
-
-    ax.set_ylim(1, 1e4)
-
-    ax.legend(loc="upper right")
-    xrt_radius, *_ = list(df.xrt_radius)
-    if xrt_radius == 0.0:
-        ax.set_title("No pre-focusing lens")
-    else:
-        ax.set_title(f"Pre-focusing radius = {xrt_radius:.2f}um (Lens #{xrt_lens})")
-    return xrt_radius
-
-
-def plot_spreadsheet_data(xrt_lens, ax, df):
-    ax.fill_between(
-        df.energy,
-        df.trip_min,
-        df.trip_max,
-        where=(df.trip_max > df.trip_min),
-        interpolate=True,
-        color="red",
-        alpha=0.2,
-        hatch="/",
-    )
-
-    ax.plot(df.energy, df.trip_min, lw=1, color="black", label="")
-    ax.plot(df.energy, df.trip_max, lw=1, color="black", label="")
-
-    min_energy = MIN_ENERGY[xrt_lens]
-    if min_energy > 0.0:
-        ax.fill(
-            (0, 0, min_energy, min_energy),
-            (0, 1e4, 1e4, 0),
-            color="red",
-            edgecolor="None",
-            alpha=0.2,
-            hatch="\\",
-        )
-
-    ax.set_yscale("log")
-    ax.set_ylabel("Reff [um]")
-    ax.set_xlabel("Energy [eV]")
-    return df
-
-
-def sweep_and_plot_xrt(xrt_lens, num_steps=100):
+    plot = SweepPlot(xrt_lens, ax, blit=False)
+    plot.add(df)
+    plot.finish()
+    return plot.xrt_radius
+
+
+def sweep_and_plot_xrt(xrt_lens, num_steps=100, checkpoint=None, energy_ranges=None):
+    # The file name depends on the XRT radius, which is only known once read
+    path = f"sweep_lens_{xrt_lens}.parquet"
+    initial = None
+    if checkpoint is not None and os.path.exists(path):
+        initial = read_scan_data(path, columns=fields)
+    live_plot = LiveSweepPlot(xrt_lens, initial=initial)
+    # Points read since the last commit are read again on resume
+    writer = ScanDataWriter(path, fields=fields, append=checkpoint is not None,
+                            keep_failed=checkpoint is None)
+    if checkpoint is not None:
+        # Points are only recorded once their data is durable
+        checkpoint.writer = writer
     RE(
         transfocate.checkout.sweep_energy_plan(
-            tfs, checkout, xrt_lens, num_steps=num_steps
+            tfs, checkout, xrt_lens, num_steps=num_steps, checkpoint=checkpoint,
+            energy_ranges=energy_ranges,
         ),
-        LiveTable(fields),
+        [LiveTable(fields), writer, live_plot],
     )
 
-    xrt_radius = plot_sweep_energy(xrt_lens, db[-1])
+    xrt_radius = live_plot.plot.xrt_radius
+    if xrt_radius is None:
+        # No points were read, e.g. when resuming a finished sweep
+        xrt_radius = xrt_lenses_radii[xrt_lens - 1] if xrt_lens else 0.0
     fn = f"pre_focus_{xrt_radius:.0f}um_lens_{xrt_lens}"
-    plt.savefig(f"{fn}.png")
-    plt.savefig(f"{fn}.pdf")
-    df = db[-1].table()[fields]
-    df.to_excel(f"{fn}.xlsx")
-
-
-def sweep_and_plot_xrt_all(num_steps):
+    if energy_ranges is not None:
+        # Keep the record of the full checkout
+        fn += "_partial"
+    if os.path.exists(path):
+        live_plot.ax.figure.savefig(f"{fn}.png")
+        live_plot.ax.figure.savefig(f"{fn}.pdf")
+        remove_scan_data(f"{fn}.parquet")
+        os.replace(path, f"{fn}.parquet")
+    elif not os.path.exists(f"{fn}.parquet"):
+        print(f"No points were read for XRT lens {xrt_lens}")
+        return None
+    if checkpoint is not None:
+        checkpoint.set_result(xrt_lens, f"{fn}.parquet")
+    return f"{fn}.parquet"
+
+
+def sweep_and_plot_xrt_all(num_steps, resume=True, sweep_ranges=None):
+    """
+    Sweep and plot every XRT lens, resuming an interrupted checkout.
+
+    Points read are recorded in :data:`CHECKPOINT_FILENAME`, so calling
+    this again after a failure continues from the last points recorded.
+    With ``resume=False`` the checkpoint and any partial data are discarded.
+
+    After a spreadsheet revision, ``sweep_ranges`` from
+    :func:`transfocate.table.diff.sweep_ranges`, or read with
+    :func:`transfocate.table.diff.load_sweep_ranges`, limits the checkout to
+    the changed energy ranges of the changed XRT lenses.  These sweeps are
+    saved with a ``_partial`` suffix.
+    """
+    if sweep_ranges is not None:
+        sweep_ranges = {int(lens): ranges for lens, ranges in sweep_ranges.items()}
+    checkpoint = transfocate.checkout.SweepCheckpoint(CHECKPOINT_FILENAME)
+    if not resume:
+        checkpoint.clear()
+        for lens_idx in [0, 1, 2, 3]:
+            remove_scan_data(f"sweep_lens_{lens_idx}.parquet")
+
+    filenames = {}
     for lens_idx in [0, 1, 2, 3]:
-        sweep_and_plot_xrt(lens_idx, num_steps=num_steps)
-
-    plot_sweeps()
+        if sweep_ranges is not None and lens_idx not in sweep_ranges:
+            continue
+        filename = checkpoint.result(lens_idx)
+        if filename is None or not os.path.exists(filename):
+            filename = sweep_and_plot_xrt(
+                lens_idx, num_steps=num_steps, checkpoint=checkpoint,
+                energy_ranges=None if sweep_ranges is None else sweep_ranges[lens_idx],
+            )
+        else:
+            print(f"Using completed sweep for XRT lens {lens_idx}: {filename}")
+        if filename is not None:
+            filenames[lens_idx] = filename
+
+    plot_sweeps(filenames)
+    # The checkout is complete; a new one should start from scratch
+    checkpoint.clear()
 
 
 if __name__ == "__main__":
     plt.ion()
     tfs = transfocate.Transfocator("MFX:LENS", name="tfs")
     checkout = transfocate.checkout.LensInterlockCheckout("MFX:LENS", name="checkout")
-    db = databroker.Broker.named("temp")
     RE = bluesky.RunEngine({})
-    RE.subscribe(db.insert)
     tfs.interlock.limits.low.name = "trip_low"
     tfs.interlock.limits.high.name = "trip_high"
     tfs.interlock.faulted.name = "faulted"
@@ -275,18 +232,19 @@ if __name__ == "__main__":
     print("Connecting to devices...")
 
     try:
-        time.sleep(2)
-        tfs.wait_for_connection(timeout=5.0)
-        checkout.wait_for_connection(timeout=5.0)
-    except Exception as ex:
+        report = connect_devices([tfs, checkout], timeout=35.0)
+    except TimeoutError as ex:
         print(
             """
-Sorry, trouble connecting to some devices. This happens occasionally at initialization.
-Please re-try running this script.
+Sorry, some devices failed to connect in time.
+Check that the IOC is running and re-try running this script.
 """
         )
         raise ex
 
+    print("Slowest connections:")
+    print(slowest_signals(report, count=5)[["pvname", "latency"]])
+
     print(DESCRIPTION)
     print("Run scans and generate report? ('yes' to continue)")
     if input().lower() == "yes":
@@ -0,0 +1,34 @@
+"""
+Location of the on-disk caches shared between processes
+
+The cache lives in ``$TRANSFOCATE_CACHE_DIR`` if set, otherwise in the
+``transfocate`` directory of ``$XDG_CACHE_HOME`` (``~/.cache`` by default).
+Setting ``TRANSFOCATE_CACHE_DIR`` to an empty string disables the cache.
+"""
+import os
+import pathlib
+
+
+def cache_dir(*parts):
+    """
+    Directory for cached data, created if necessary
+
+    Parameters
+    ----------
+    *parts : str
+        Subdirectory of the cache
+
+    Returns
+    -------
+    pathlib.Path or None
+        The directory, or None if caching is disabled
+    """
+    root = os.environ.get("TRANSFOCATE_CACHE_DIR")
+    if root is None:
+        base = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+        root = pathlib.Path(base) / "transfocate"
+    elif not root:
+        return None
+    path = pathlib.Path(root).joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
@@ -3,7 +3,10 @@ import logging
 
 import numpy as np
 
+from transfocate.chromatic import CombinationTable
+from transfocate.combinations import combination_index
 from transfocate.lens import LensConnect
+from transfocate.table.faults import predict_faults
 
 logger = logging.getLogger(__name__)
 
@@ -19,10 +22,17 @@ class Calculator:
 
     tfs_lenses : list
         A list of the transfocator lenses
+
+    xrt_indices : list, optional
+        The index of each xrt lens in the interlock tables. By default the
+        lenses are numbered from 1 in the given order
     """
-    def __init__(self, xrt_lenses, tfs_lenses):
+    def __init__(self, xrt_lenses, tfs_lenses, xrt_indices=None):
         self.xrt_lenses = xrt_lenses
         self.tfs_lenses = tfs_lenses
+        if xrt_indices is None:
+            xrt_indices = range(1, len(xrt_lenses) + 1)
+        self.xrt_indices = list(xrt_indices)
 
     def combinations(self, include_prefocus=True):
         """
@@ -65,8 +75,70 @@ class Calculator:
         logger.debug("Found %s total combinations of lenses", len(combos))
         return combos
 
+    def combination_table(self):
+        """
+        The :class:`.CombinationTable` of the current lens geometry
+        """
+        return CombinationTable.from_lenses(self.xrt_lenses, self.tfs_lenses)
+
+    def allowed_indices(self, table, indices, energy):
+        """
+        Check rows of a combination table against the interlock
+
+        The interlock table index and Transfocator radius of every
+        combination are taken from the columns of the table, so all of the
+        combinations are checked at once, see :func:`.predict_faults`
+
+        Parameters
+        ----------
+        table : CombinationTable
+            Table of the lenses of the calculator
+
+        indices : array_like
+            Flat indices of the combinations to check
+
+        energy : float
+            The photon energy in eV
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array, True for combinations the interlock allows
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        interlock_index = np.array([0] + self.xrt_indices, dtype=np.int64)
+        faults = predict_faults(energy,
+                                interlock_index[table.xrt_index[indices]],
+                                table.tfs_radius[indices])
+        return ~np.asarray(faults["violated"], dtype=bool)
+
+    def allowed(self, combos, energy):
+        """
+        Check combinations against the interlock at a given energy
+
+        The minimum energy, required lens and trip table rules are evaluated
+        for all of the combinations at once, see :meth:`.allowed_indices`
+
+        Parameters
+        ----------
+        combos : list
+            List of LensConnect objects
+
+        energy : float
+            The photon energy in eV
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array, True for combinations the interlock allows
+        """
+        indices = [combination_index(self.xrt_lenses, self.tfs_lenses,
+                                     combo.lenses)
+                   for combo in combos]
+        return self.allowed_indices(self.combination_table(), indices, energy)
+
     def find_solution(self, target, n=4, z_obj=0.0,
-                      include_prefocus=True):
+                      include_prefocus=True, energy=None):
         """
         Find a combination to reach a specific focus
 
@@ -87,6 +159,10 @@ class Calculator:
             Use only combinations that include a prefocusing lens. If False,
             only combinations of Transfocator lenses are returned
 
+        energy : float, optional
+            The photon energy in eV. If given, combinations the interlock
+            would fault on at this energy are not considered
+
         Returns
         -------
         array: LensConnect
@@ -95,22 +171,40 @@ class Calculator:
         """
         solution = None
         solution_diff = np.inf
+        if energy is None:
+            combos = [combo for combo
+                      in self.combinations(include_prefocus=include_prefocus)
+                      if combo.nlens <= n]
+        else:
+            # Remove all of the combinations the interlock would fault on,
+            # among those with few enough lenses
+            table = self.combination_table()
+            if include_prefocus and not self.xrt_lenses:
+                logger.warning("No XRT lens given to calculator, but "
+                               "prefocusing was requested")
+            indices = np.flatnonzero(
+                table.candidates(n=n, include_prefocus=include_prefocus)
+            )
+            indices = indices[self.allowed_indices(table, indices, energy)]
+            combos = [table.to_lens_connect(index, self.xrt_lenses,
+                                            self.tfs_lenses)
+                      for index in indices]
+            logger.debug("%s combinations allowed by the interlock at %s eV",
+                         len(combos), energy)
         # Loop through all possible tfs/xrt combinations
-        for combo in self.combinations(include_prefocus=include_prefocus):
-            # Check to see if the number of lenses is less than the limit
-            if combo.nlens <= n:
-                try:
-                    image = combo.image(z_obj)
-                    diff = np.abs(image - target)
-                except Exception:
-                    logger.exception("Unable to calculate image position")
-                    diff = np.inf
-                # See if we have found a better solution
-                if diff < solution_diff:
-                    logger.debug("Found a combination with image %s, %s "
-                                 "from target %s", image, diff, target)
-                    solution = combo
-                    solution_diff = diff
+        for combo in combos:
+            try:
+                image = combo.image(z_obj)
+                diff = np.abs(image - target)
+            except Exception:
+                logger.exception("Unable to calculate image position")
+                diff = np.inf
+            # See if we have found a better solution
+            if diff < solution_diff:
+                logger.debug("Found a combination with image %s, %s "
+                             "from target %s", image, diff, target)
+                solution = combo
+                solution_diff = diff
         logger.info("Result found with a focal plane {} from the requested "
                     "position".format(solution_diff))
         return solution
@@ -1,21 +1,119 @@
 
+import asyncio
+import json
+import logging
+import os
+
 import bluesky.plan_stubs as bps
 import bluesky.plans as bp
 import bluesky.preprocessors as bpp
+import numpy as np
 import ophyd
 from ophyd import Component as Cpt
 from ophyd import EpicsSignal, EpicsSignalRO
+from ophyd.status import SubscriptionStatus
+
+from .combinations import (bits_to_mask, effective_radius, mask_to_bits,
+                           popcount)
+from .table.info import (MAX_RADIUS, MIN_ENERGY, MIN_RADIUS,
+                         REQUIRES_LENS_RANGE, SWEEP_ENERGY_RANGE,
+                         XRT_LENS_TABLES, tfs_lens_radii)
+from .table.interpolate import default_tables
+from .table.intervals import limit_crossings
+
+logger = logging.getLogger(__name__)
+
+# Effective radii [um] of the transfocator lens sets scanned by default
+DEFAULT_RADIUS_TARGETS = (
+    10.17, 20.0, 30.0, 40.0, 50.0, 81.08, 100.0, 200.0, 250.0, 300.0, 500.0,
+)
+
+# PLC updates to wait for after a write.  The first update may already have
+# been in flight when the write was made, so it is not trusted.
+SETTLE_UPDATES = 2
+# Maximum time [s] to wait for the PLC to settle
+SETTLE_TIMEOUT = 5.0
+
+
+async def wait_status(status):
+    """
+    Await an ophyd status from the RunEngine event loop.
+
+    Parameters
+    ----------
+    status : ophyd.status.StatusBase
+        The status, which may be finished from any thread.
+
+    Returns
+    -------
+    ophyd.status.StatusBase
+        The finished status.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def finished(status):
+        if not future.done():
+            future.set_result(status)
+
+    status.add_callback(
+        lambda status: loop.call_soon_threadsafe(finished, status)
+    )
+    return await future
+
+
+def wait_for_update(signal, since, updates=SETTLE_UPDATES,
+                    timeout=SETTLE_TIMEOUT):
+    """
+    Bluesky plan - wait for a PLC sequence counter to advance.
+
+    Parameters
+    ----------
+    signal : ophyd.Signal
+        Counter incremented on every update, such as
+        :attr:`LensInterlockCheckout.update_seq`.
+    since : int
+        Value of the counter read before the write that is waited on.
+    updates : int, optional
+        Number of updates to wait for.
+    timeout : float, optional
+        Maximum time to wait [s].
+
+    Raises
+    ------
+    TimeoutError
+        If the counter did not advance in time.
+    """
+    def advanced(value, **kwargs):
+        # Any decrease means the counter wrapped or the PLC restarted
+        return value < since or value - since >= updates
+
+    status = SubscriptionStatus(signal, advanced)
+    try:
+        yield from bps.wait_for([lambda: wait_status(status)], timeout=timeout)
+    except Exception:
+        # Recent bluesky releases raise a WaitForTimeoutError on timeout
+        if not status.done:
+            status.set_exception(TimeoutError(f"{signal.name} did not advance"))
+        raise
+    if not status.done:
+        # Older bluesky releases return once the timeout expires
+        error = TimeoutError(f"{signal.name} did not advance in {timeout} s")
+        status.set_exception(error)
+        raise error
 
 
 class LensCheckout(ophyd.Device):
-    state = Cpt(EpicsSignal, ":STATE", kind="normal")  # , string=True)
+    # Monitored, so that unchanged writes can be skipped without a CA get
+    state = Cpt(EpicsSignal, ":STATE", kind="normal",
+                auto_monitor=True)  # , string=True)
     state_bypass = Cpt(
-        EpicsSignal, ":BYP:INS", kind="normal",
+        EpicsSignal, ":BYP:INS", kind="normal", auto_monitor=True,
         doc="Override state in bypass mode with this"
     )
     known = Cpt(EpicsSignal, ":SAFE", kind="normal", string=True)
     known_bypass = Cpt(
-        EpicsSignal, ":BYP:KNOWN", kind="normal",
+        EpicsSignal, ":BYP:KNOWN", kind="normal", auto_monitor=True,
         doc="Override known in bypass mode with this"
     )
 
@@ -82,237 +180,646 @@ class LensInterlockCheckout(ophyd.Device):
         """Transfocator lenses."""
         return [lens for lens in self.lenses if 'TFS' in lens.prefix]
 
-    def set_lens_state(self, xrt, tfs, *, bypass_mode=True):
-        """Bluesky plan - set lens state."""
+    def settle(self, since, **kwargs):
+        """
+        Bluesky plan - wait for the PLC to process writes made after ``since``.
+
+        Parameters
+        ----------
+        since : int
+            Value of :attr:`update_seq` read before the writes.
+        **kwargs
+            Passed to :func:`wait_for_update`.
+        """
+        yield from wait_for_update(self.update_seq, since, **kwargs)
+
+    def set_energy(self, energy, **kwargs):
+        """Bluesky plan - set the bypass energy and wait for the PLC."""
+        since = yield from bps.rd(self.update_seq)
+        yield from bps.mv(self.energy, energy)
+        yield from self.settle(since, **kwargs)
+
+    def lens_state_writes(self, xrt, tfs, *, bypass_mode=True):
+        """
+        Signal and value pairs needed to set a lens state.
+
+        Parameters
+        ----------
+        xrt : int
+            XRT lens index, with 0 meaning no pre-focusing lens.
+        tfs : list
+            State (0 or 1) of each transfocator lens.
+        bypass_mode : bool, optional
+            Write the bypass state rather than the lens state.
+
+        Returns
+        -------
+        list
+            ``(signal, value)`` for every lens.
+        """
         xrt_lenses = {
             0: [0, 0, 0],
             1: [0, 0, 1],
             2: [0, 1, 0],
             3: [1, 0, 0],
         }
-        for lens, state in zip(self.xrt_lenses, xrt_lenses[xrt]):
+        writes = []
+        states = list(zip(self.xrt_lenses, xrt_lenses[xrt]))
+        states += list(zip(self.tfs_lenses, tfs))
+        for lens, state in states:
             if bypass_mode:
-                yield from bps.mv(lens.state_bypass, state)
-                yield from bps.mv(lens.known_bypass, 1)
+                writes.append((lens.state_bypass, state))
+                writes.append((lens.known_bypass, 1))
             else:
-                yield from bps.mv(lens.state, state)
+                writes.append((lens.state, state))
+        return writes
 
-        for lens, state in zip(self.tfs_lenses, tfs):
-            if bypass_mode:
-                yield from bps.mv(lens.state_bypass, state)
-                yield from bps.mv(lens.known_bypass, 1)
-            else:
-                yield from bps.mv(lens.state, state)
+    def set_lens_state(self, xrt, tfs, *, bypass_mode=True):
+        """
+        Bluesky plan - set lens state and wait for the PLC.
+
+        All lenses are moved concurrently, skipping those already in the
+        requested state.
+        """
+        since = yield from bps.rd(self.update_seq)
+        args = []
+        for signal, value in self.lens_state_writes(xrt, tfs,
+                                                    bypass_mode=bypass_mode):
+            current = yield from bps.rd(signal)
+            if current != value:
+                args.extend([signal, value])
+
+        if not args:
+            return
+        yield from bps.mv(*args)
+        yield from self.settle(since)
+
+    def settled_step(self, detectors, step, pos_cache):
+        """Bluesky per-step plan - move, wait for the PLC, then read."""
+        since = yield from bps.rd(self.update_seq)
+        yield from bps.move_per_step(step, pos_cache)
+        yield from self.settle(since)
+        yield from bps.trigger_and_read(list(detectors) + list(step))
+
+
+def unique_lens_sets(tfs_radii=None):
+    """
+    Transfocator lens sets with distinct effective radii.
+
+    Parameters
+    ----------
+    tfs_radii : list of float, optional
+        Radius of each transfocator lens [um].  Defaults to
+        :data:`transfocate.table.info.tfs_lens_radii`.
+
+    Returns
+    -------
+    masks : np.ndarray
+        Bitmask of each lens set, in order of increasing effective radius.
+        Of the lens sets sharing an effective radius, the one with the fewest
+        lenses is kept.
+    radii : np.ndarray
+        Effective radius of each lens set [um].
+    """
+    if tfs_radii is None:
+        tfs_radii = tfs_lens_radii
+    masks = np.arange(1, 2 ** len(tfs_radii))
+    radii = effective_radius(tfs_radii, masks)
+    order = np.lexsort((masks, popcount(masks), radii))
+    masks, radii = masks[order], radii[order]
+    keep = np.concatenate([[True], ~np.isclose(radii[1:], radii[:-1], rtol=1e-9)])
+    return masks[keep], radii[keep]
+
+
+def boundary_radii(tables=None):
+    """
+    Effective radii of the trip limits at every row of the spreadsheet.
+
+    Parameters
+    ----------
+    tables : LimitTables, optional
+        The trip limit tables.  Defaults to the spreadsheet tables.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted unique radii [um] within the range of the transfocator.
+    """
+    if tables is None:
+        tables = default_tables()
+    values = np.concatenate(
+        [tables.trip_min[lens] for lens in XRT_LENS_TABLES]
+        + [tables.trip_max[lens] for lens in XRT_LENS_TABLES]
+    )
+    return np.unique(values[(values >= MIN_RADIUS) & (values <= MAX_RADIUS)])
+
+
+def select_lens_sets(radius_targets=None, rtol=0.0, tfs_radii=None,
+                     include_empty=True):
+    """
+    Select transfocator lens sets covering effective radius targets.
+
+    With ``rtol=0`` the lens set closest to each target is chosen.
+    Otherwise the smallest number of lens sets is chosen such that every
+    target is within ``rtol`` (relative) of a selected effective radius,
+    falling back to the closest lens set for unreachable targets.
+
+    Parameters
+    ----------
+    radius_targets : array_like, optional
+        Effective radii to cover [um].  Defaults to the trip limits of the
+        spreadsheet tables, see :func:`boundary_radii`.
+    rtol : float, optional
+        Relative tolerance on the effective radius.
+    tfs_radii : list of float, optional
+        Radius of each transfocator lens [um].
+    include_empty : bool, optional
+        Include the lens set with no transfocator lenses inserted.
+
+    Returns
+    -------
+    list
+        Lens states (0 or 1 per transfocator lens), in order of increasing
+        effective radius, suitable for :meth:`LensInterlockCheckout.set_lens_state`.
+    """
+    if tfs_radii is None:
+        tfs_radii = tfs_lens_radii
+    if radius_targets is None:
+        radius_targets = boundary_radii()
+    masks, radii = unique_lens_sets(tfs_radii)
+    targets = np.unique(np.asarray(radius_targets, dtype=float))
+
+    selected = set()
+    unreachable = []
+    if rtol == 0.0:
+        selected.update(np.argmin(np.abs(radii[:, None] - targets), axis=0).tolist())
+    else:
+        idx = 0
+        while idx < len(targets):
+            target = targets[idx]
+            within = np.flatnonzero(
+                (radii >= target / (1 + rtol)) & (radii <= target * (1 + rtol))
+            )
+            if not len(within):
+                unreachable.append(target)
+                selected.add(int(np.argmin(np.abs(np.log(radii / target)))))
+                idx += 1
+                continue
+            # The largest radius covering this target covers the most others
+            best = within[-1]
+            selected.add(int(best))
+            while idx < len(targets) and targets[idx] <= radii[best] * (1 + rtol):
+                idx += 1
+    if unreachable:
+        logger.warning("No lens set within %s of %d radius target(s) between "
+                       "%.1f and %.1f um, using the closest lens sets", rtol,
+                       len(unreachable), min(unreachable), max(unreachable))
+
+    lens_sets = mask_to_bits(masks[sorted(selected)], len(tfs_radii)).tolist()
+    if include_empty:
+        lens_sets.insert(0, [0] * len(tfs_radii))
+    return lens_sets
+
+
+def energy_breakpoints(xrt_lens, tfs_radius, tables=None):
+    """
+    Energies at which the interlock state of a lens set may change.
+
+    These are the energies at which the interpolated trip limits cross the
+    transfocator effective radius, along with the :data:`MIN_ENERGY` and
+    :data:`REQUIRES_LENS_RANGE` edges for the XRT lens.
 
-        yield from bps.wait()
-        yield from bps.sleep(0.5)
+    Parameters
+    ----------
+    xrt_lens : int
+        XRT lens index, with 0 meaning no pre-focusing lens.
+    tfs_radius : float
+        Transfocator effective radius [um], 0 when no lens is inserted.
+    tables : LimitTables, optional
+        The trip limit tables.  Defaults to the spreadsheet tables.
 
+    Returns
+    -------
+    np.ndarray
+        Sorted unique energies [eV].
+    """
+    if tables is None:
+        tables = default_tables()
+    energy = tables.energy[xrt_lens]
+    edges = [MIN_ENERGY[xrt_lens]]
+    if REQUIRES_LENS_RANGE[xrt_lens] is not None:
+        edges.extend(REQUIRES_LENS_RANGE[xrt_lens])
+    points = np.concatenate(
+        [edges]
+        + limit_crossings(energy, tables.trip_min[xrt_lens], [tfs_radius])
+        + limit_crossings(energy, tables.trip_max[xrt_lens], [tfs_radius])
+    )
+    return np.unique(points[points > 0.0])
+
+
+def adaptive_energies(xrt_lens, tfs_radius, num_steps, *, energy_range=None,
+                      width=200.0, points_per_edge=6, tables=None):
+    """
+    Energies to scan, concentrated around the interlock breakpoints.
+
+    A coarse uniform grid of ``num_steps`` points covers the whole range, and
+    ``points_per_edge`` points are placed symmetrically around each of the
+    :func:`energy_breakpoints`, with spacing halving towards the breakpoint.
+    The breakpoints themselves are not scanned, as the interlock state
+    exactly at a limit is ambiguous.
+
+    Parameters
+    ----------
+    xrt_lens : int
+        XRT lens index, with 0 meaning no pre-focusing lens.
+    tfs_radius : float
+        Transfocator effective radius [um], 0 when no lens is inserted.
+    num_steps : int
+        Number of points in the coarse uniform grid.
+    energy_range : tuple of float, optional
+        Energy range to scan [eV].  Defaults to :data:`SWEEP_ENERGY_RANGE`.
+    width : float, optional
+        Distance of the outermost points from each breakpoint [eV].
+    points_per_edge : int, optional
+        Number of points around each breakpoint.
+    tables : LimitTables, optional
+        The trip limit tables.  Defaults to the spreadsheet tables.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted unique energies [eV] within ``energy_range``.
+    """
+    low, high = energy_range or SWEEP_ENERGY_RANGE
+    energies = [np.linspace(low, high, num_steps)]
+    per_side = points_per_edge // 2
+    if per_side:
+        offsets = width / 2.0 ** np.arange(per_side)
+        offsets = np.concatenate([-offsets, offsets])
+        for breakpoint in energy_breakpoints(xrt_lens, tfs_radius, tables=tables):
+            energies.append(breakpoint + offsets)
+    energies = np.unique(np.concatenate(energies))
+    return energies[(energies >= low) & (energies <= high)]
+
+
+def sweep_energies(xrt_lens, tfs_radius, num_steps, adaptive=False,
+                   energy_ranges=None):
+    """
+    Energies scanned by :func:`sweep_energy_plan` for one lens set.
+
+    Parameters
+    ----------
+    xrt_lens : int
+        XRT lens index, with 0 meaning no pre-focusing lens.
+    tfs_radius : float
+        Transfocator effective radius [um], 0 when no lens is inserted.
+    num_steps : int
+        Number of energy steps over :data:`SWEEP_ENERGY_RANGE`.
+    adaptive : bool, optional
+        Use :func:`adaptive_energies` instead of a uniform grid.
+    energy_ranges : list of tuple, optional
+        Scan only these ``(low, high)`` energy ranges [eV], with the same
+        density of steps as the whole sweep and at least 2 steps each.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted unique energies [eV].
+    """
+    if energy_ranges is None:
+        ranges = [(SWEEP_ENERGY_RANGE, num_steps)]
+    else:
+        sweep_width = SWEEP_ENERGY_RANGE[1] - SWEEP_ENERGY_RANGE[0]
+        ranges = [
+            ((low, high), max(2, int(np.ceil(num_steps * (high - low) / sweep_width))))
+            for low, high in energy_ranges
+        ]
+    energies = []
+    for energy_range, steps in ranges:
+        if adaptive:
+            energies.append(adaptive_energies(
+                xrt_lens, tfs_radius, steps, energy_range=energy_range
+            ))
+        else:
+            energies.append(np.linspace(*energy_range, steps))
+    if not energies:
+        return np.array([])
+    return np.unique(np.concatenate(energies))
+
+
+def _scan_point(detectors, energy_signal, energy, fault_key, sequence=None):
+    """Bluesky plan - read the detectors at one energy, returning the fault."""
+    if sequence is not None:
+        since = yield from bps.rd(sequence)
+    yield from bps.mv(energy_signal, energy)
+    if sequence is not None:
+        yield from wait_for_update(sequence, since)
+    reading = yield from bps.trigger_and_read(detectors)
+    return bool(reading[fault_key]["value"])
+
+
+def adaptive_energy_scan(detectors, energy_signal, energies, fault_signal,
+                         refine=0, sequence=None, callback=None, initial=None):
+    """
+    Bluesky plan - scan energy, bisecting between points that change fault.
+
+    This does not open a run, and is meant to be used within one.
+
+    Parameters
+    ----------
+    detectors : list
+        Devices to trigger and read at every point.
+    energy_signal : ophyd.Signal
+        Energy setpoint.
+    energies : array_like
+        Energies to scan [eV], in order.
+    fault_signal : ophyd.Signal
+        Fault summary signal, read as part of ``detectors``.
+    refine : int, optional
+        Number of bisection steps between neighbouring points for which the
+        observed fault state differs.
+    sequence : ophyd.Signal, optional
+        PLC sequence counter to wait on after each energy change, see
+        :func:`wait_for_update`.
+    callback : callable, optional
+        Called with ``(energy, faulted)`` after each point is read.
+    initial : list, optional
+        ``(energy, faulted)`` of points read before, e.g. by an interrupted
+        scan, included when looking for changes in fault state.
+
+    Returns
+    -------
+    list
+        ``(energy, faulted)`` for every point scanned, including ``initial``,
+        in energy order.
+    """
+    fault_key = fault_signal.name
+    results = [] if initial is None else list(initial)
+    for energy in energies:
+        faulted = yield from _scan_point(
+            detectors, energy_signal, energy, fault_key, sequence
+        )
+        results.append((float(energy), faulted))
+        if callback is not None:
+            callback(float(energy), faulted)
+
+    results.sort()
+    if refine:
+        transitions = [
+            (left, right) for left, right in zip(results[:-1], results[1:])
+            if left[1] != right[1]
+        ]
+        for (low, low_fault), (high, high_fault) in transitions:
+            for _ in range(refine):
+                middle = (low + high) / 2
+                faulted = yield from _scan_point(
+                    detectors, energy_signal, middle, fault_key, sequence
+                )
+                results.append((middle, faulted))
+                if callback is not None:
+                    callback(middle, faulted)
+                if faulted == low_fault:
+                    low = middle
+                else:
+                    high = middle
+        results.sort()
+    return results
+
+
+class SweepCheckpoint:
+    """
+    Record of the points read by checkout sweeps, for resuming them.
+
+    Points are keyed by XRT lens, transfocator lens set bitmask and energy.
+    They are noted as they are read, and appended to a JSON lines file, and
+    synced to disk, every ``commit_every`` points and when a lens set is
+    complete.  The data is committed by ``writer`` first, so the record
+    never claims points whose data could be lost.  Only the points read
+    since the last commit are read again on resume.  A truncated final line
+    is ignored when loading.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The checkpoint file, created if it does not exist.
+    writer : ScanDataWriter, optional
+        The writer of the sweep data, committed before points are recorded.
+        May also be assigned later.
+    commit_every : int, optional
+        Number of points read between commits.
+    """
+
+    def __init__(self, path, writer=None, commit_every=10):
+        self.path = os.fspath(path)
+        self.writer = writer
+        self.commit_every = commit_every
+        self._pending = []
+        self._points = {}
+        self._complete = set()
+        self._results = {}
+        self._load()
+
+    @staticmethod
+    def _energy_key(energy):
+        # Energies are recomputed on resume; compare them to the meV
+        return round(float(energy), 3)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Ignoring incomplete checkpoint entry: %r", line)
+                    continue
+                self._apply(entry)
+
+    def _apply(self, entry):
+        xrt_lens = entry["xrt_lens"]
+        if "filename" in entry:
+            self._results[xrt_lens] = entry["filename"]
+            return
+        key = (xrt_lens, entry["tfs_mask"])
+        if entry.get("complete"):
+            self._complete.add(key)
+        else:
+            energy = self._energy_key(entry["energy"])
+            self._points.setdefault(key, {})[energy] = entry.get("faulted")
+
+    def _append(self, *entries):
+        for entry in entries:
+            self._apply(entry)
+        with open(self.path, "a") as fp:
+            fp.writelines(json.dumps(entry) + "\n" for entry in entries)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def is_done(self, xrt_lens, tfs_mask, energy):
+        """Check if a point has been read."""
+        points = self._points.get((xrt_lens, int(tfs_mask)), ())
+        return self._energy_key(energy) in points
+
+    def remaining(self, xrt_lens, tfs_mask, energies):
+        """The energies of a lens set which have not yet been read."""
+        return [energy for energy in energies
+                if not self.is_done(xrt_lens, tfs_mask, energy)]
+
+    def results(self, xrt_lens, tfs_mask):
+        """``(energy, faulted)`` of the points of a lens set read so far."""
+        points = self._points.get((xrt_lens, int(tfs_mask)), {})
+        return sorted((energy, faulted) for energy, faulted in points.items()
+                      if faulted is not None)
+
+    def record(self, xrt_lens, tfs_mask, energy, faulted=None):
+        """
+        Note that a point has been read, committing every ``commit_every``.
+
+        Parameters
+        ----------
+        xrt_lens : int
+            XRT lens index.
+        tfs_mask : int
+            Bitmask of the transfocator lens set.
+        energy : float
+            Energy of the point [eV].
+        faulted : bool, optional
+            Fault state read at the point, kept for :meth:`results`.
+        """
+        entry = {"xrt_lens": int(xrt_lens), "tfs_mask": int(tfs_mask),
+                 "energy": float(energy)}
+        if faulted is not None:
+            entry["faulted"] = bool(faulted)
+        self._pending.append(entry)
+        if len(self._pending) >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        """
+        Record the points noted by :meth:`record` since the last commit.
+
+        The data is committed by :attr:`writer` first.
+        """
+        if self.writer is not None:
+            self.writer.commit()
+        entries, self._pending = self._pending, []
+        if entries:
+            self._append(*entries)
+
+    def is_complete(self, xrt_lens, tfs_mask):
+        """Check if every point of a lens set has been read."""
+        return (xrt_lens, int(tfs_mask)) in self._complete
+
+    def mark_complete(self, xrt_lens, tfs_mask):
+        """
+        Record that every point of a lens set has been read.
+
+        The points noted by :meth:`record` are committed along with the
+        completion.
+        """
+        self._pending.append(
+            {"xrt_lens": int(xrt_lens), "tfs_mask": int(tfs_mask),
+             "complete": True}
+        )
+        self.commit()
+
+    def result(self, xrt_lens):
+        """The data file of a finished XRT lens sweep, or None."""
+        return self._results.get(xrt_lens)
+
+    def set_result(self, xrt_lens, filename):
+        """Record the data file of a finished XRT lens sweep."""
+        self._append({"xrt_lens": int(xrt_lens), "filename": os.fspath(filename)})
+
+    def clear(self):
+        """Forget every recorded point, removing the file."""
+        self._pending.clear()
+        self._points.clear()
+        self._complete.clear()
+        self._results.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def sweep_energy_plan(tfs, checkout, xrt_lens, num_steps,
+                      tfs_lens_combinations=None, adaptive=False, refine=0,
+                      checkpoint=None, energy_ranges=None):
+    """
+    Bluesky plan - sweep energy for transfocator lens sets.
+
+    Parameters
+    ----------
+    tfs : Transfocator
+        The transfocator, read at every point.
+    checkout : LensInterlockCheckout
+        The checkout device, used to bypass lens states and energy.
+    xrt_lens : int
+        XRT lens index, with 0 meaning no pre-focusing lens.
+    num_steps : int
+        Number of energy steps per lens set.
+    tfs_lens_combinations : list, optional
+        Lens states of the transfocator lens sets to scan.  Defaults to
+        :func:`select_lens_sets` for :data:`DEFAULT_RADIUS_TARGETS`.
+    adaptive : bool, optional
+        Scan the energies from :func:`adaptive_energies`, with ``num_steps``
+        points in the coarse grid, instead of a uniform grid.
+    refine : int, optional
+        In adaptive mode, the number of bisection steps around each observed
+        change in fault state.
+    checkpoint : SweepCheckpoint, optional
+        Skip the lens sets and points already read in the checkpoint, and
+        record each point as it is read.  The adaptive refinement of an
+        interrupted lens set restarts from the points read so far.
+    energy_ranges : list of tuple, optional
+        Sweep only these ``(low, high)`` energy ranges [eV], e.g. the
+        ranges of a spreadsheet revision from
+        :func:`transfocate.table.diff.sweep_ranges`.
+    """
+    if tfs_lens_combinations is None:
+        tfs_lens_combinations = select_lens_sets(DEFAULT_RADIUS_TARGETS)
 
-def sweep_energy_plan(tfs, checkout, xrt_lens, num_steps):
     yield from bps.open_run()
     yield from bps.stage(checkout)
     yield from bps.stage(tfs)
 
-    tfs_lens_combinations = [
-        [0, 0, 0, 0, 0, 0, 0, 0, 0],  # 0.00
-        [1, 1, 1, 1, 1, 1, 1, 1, 1],  # 10.17
-        # [0, 1, 1, 1, 1, 1, 1, 1, 1],  # 10.38
-        # [1, 0, 1, 1, 1, 1, 1, 1, 1],  # 10.53
-        # [1, 1, 0, 1, 1, 1, 1, 1, 1],  # 10.60
-        # [1, 1, 1, 0, 1, 1, 1, 1, 1],  # 10.71
-        # [0, 0, 1, 1, 1, 1, 1, 1, 1],  # 10.75
-        # [0, 1, 0, 1, 1, 1, 1, 1, 1],  # 10.83
-        # [0, 1, 1, 0, 1, 1, 1, 1, 1],  # 10.95
-        # [1, 0, 0, 1, 1, 1, 1, 1, 1],  # 10.99
-        # [1, 1, 1, 1, 0, 1, 1, 1, 1],  # 11.07
-        # [1, 0, 1, 0, 1, 1, 1, 1, 1],  # 11.11
-        # [1, 1, 0, 0, 1, 1, 1, 1, 1],  # 11.19
-        # [0, 0, 0, 1, 1, 1, 1, 1, 1],  # 11.24
-        # [0, 1, 1, 1, 0, 1, 1, 1, 1],  # 11.32
-        # [0, 0, 1, 0, 1, 1, 1, 1, 1],  # 11.36
-        # [0, 1, 0, 0, 1, 1, 1, 1, 1],  # 11.45
-        # [1, 0, 1, 1, 0, 1, 1, 1, 1],  # 11.49
-        # [1, 1, 0, 1, 0, 1, 1, 1, 1],  # 11.58
-        # [1, 0, 0, 0, 1, 1, 1, 1, 1],  # 11.63
-        # [1, 1, 1, 0, 0, 1, 1, 1, 1],  # 11.72
-        # [0, 0, 1, 1, 0, 1, 1, 1, 1],  # 11.76
-        # [0, 1, 0, 1, 0, 1, 1, 1, 1],  # 11.86
-        # [0, 0, 0, 0, 1, 1, 1, 1, 1],  # 11.90
-        # [0, 1, 1, 0, 0, 1, 1, 1, 1],  # 12.00
-        # [1, 0, 0, 1, 0, 1, 1, 1, 1],  # 12.05
-        # [1, 1, 1, 1, 1, 0, 1, 1, 1],  # 12.15
-        # [1, 0, 1, 0, 0, 1, 1, 1, 1],  # 12.20
-        # [1, 1, 0, 0, 0, 1, 1, 1, 1],  # 12.30
-        # [0, 0, 0, 1, 0, 1, 1, 1, 1],  # 12.35
-        # [0, 1, 1, 1, 1, 0, 1, 1, 1],  # 12.45
-        # [0, 0, 1, 0, 0, 1, 1, 1, 1],  # 12.50
-        # [0, 1, 0, 0, 0, 1, 1, 1, 1],  # 12.61
-        # [1, 0, 1, 1, 1, 0, 1, 1, 1],  # 12.66
-        # [1, 1, 1, 1, 1, 1, 1, 1, 0],  # 12.77
-        # [1, 0, 0, 0, 0, 1, 1, 1, 1],  # 12.82
-        # [1, 1, 1, 0, 1, 0, 1, 1, 1],  # 12.93
-        # [0, 0, 1, 1, 1, 0, 1, 1, 1],  # 12.99
-        # [0, 1, 1, 1, 1, 1, 1, 1, 0],  # 13.10
-        # [0, 0, 0, 0, 0, 1, 1, 1, 1],  # 13.16
-        # [0, 1, 1, 0, 1, 0, 1, 1, 1],  # 13.27
-        # [1, 0, 1, 1, 1, 1, 1, 1, 0],  # 13.33
-        # [1, 1, 1, 1, 0, 0, 1, 1, 1],  # 13.45
-        # [1, 0, 1, 0, 1, 0, 1, 1, 1],  # 13.51
-        # [1, 1, 1, 0, 1, 1, 1, 1, 0],  # 13.64
-        # [0, 0, 1, 1, 1, 1, 1, 1, 0],  # 13.70
-        # [0, 1, 1, 1, 0, 0, 1, 1, 1],  # 13.82
-        # [0, 1, 0, 1, 1, 1, 1, 1, 0],  # 13.82
-        # [0, 0, 1, 0, 1, 0, 1, 1, 1],  # 13.89
-        # [0, 1, 1, 0, 1, 1, 1, 1, 0],  # 14.02
-        # [1, 0, 1, 1, 0, 0, 1, 1, 1],  # 14.08
-        # [1, 1, 1, 1, 0, 1, 1, 1, 0],  # 14.22
-        # [1, 0, 1, 0, 1, 1, 1, 1, 0],  # 14.29
-        # [1, 1, 1, 0, 0, 0, 1, 1, 1],  # 14.42
-        # [0, 0, 1, 1, 0, 0, 1, 1, 1],  # 14.49
-        # [0, 1, 1, 1, 0, 1, 1, 1, 0],  # 14.63
-        # [0, 0, 1, 0, 1, 1, 1, 1, 0],  # 14.71
-        # [0, 1, 1, 0, 0, 0, 1, 1, 1],  # 14.85
-        # [1, 0, 1, 1, 0, 1, 1, 1, 0],  # 14.93
-        # [1, 1, 0, 1, 0, 1, 1, 1, 0],  # 15.08
-        # [1, 0, 1, 0, 0, 0, 1, 1, 1],  # 15.15
-        # [1, 1, 1, 0, 0, 1, 1, 1, 0],  # 15.31
-        # [0, 0, 1, 1, 0, 1, 1, 1, 0],  # 15.38
-        # [0, 1, 0, 1, 0, 1, 1, 1, 0],  # 15.54
-        # [0, 0, 1, 0, 0, 0, 1, 1, 1],  # 15.62
-        # [0, 1, 1, 0, 0, 1, 1, 1, 0],  # 15.79
-        # [1, 0, 0, 1, 0, 1, 1, 1, 0],  # 15.87
-        # [1, 1, 1, 1, 1, 0, 1, 1, 0],  # 16.04
-        # [1, 0, 1, 0, 0, 1, 1, 1, 0],  # 16.13
-        # [1, 1, 0, 0, 0, 1, 1, 1, 0],  # 16.30
-        # [0, 0, 0, 1, 0, 1, 1, 1, 0],  # 16.39
-        # [0, 1, 1, 1, 1, 0, 1, 1, 0],  # 16.57
-        # [0, 0, 1, 0, 0, 1, 1, 1, 0],  # 16.67
-        # [0, 1, 0, 0, 0, 1, 1, 1, 0],  # 16.85
-        # [1, 0, 1, 1, 1, 0, 1, 1, 0],  # 16.95
-        # [1, 1, 1, 1, 1, 1, 1, 0, 0],  # 17.14
-        # [1, 0, 0, 0, 0, 1, 1, 1, 0],  # 17.24
-        # [1, 1, 1, 0, 1, 0, 1, 1, 0],  # 17.44
-        # [0, 0, 1, 1, 1, 0, 1, 1, 0],  # 17.54
-        # [0, 1, 1, 1, 1, 1, 1, 0, 0],  # 17.75
-        # [0, 0, 0, 0, 0, 1, 1, 1, 0],  # 17.86
-        # [0, 1, 1, 0, 1, 0, 1, 1, 0],  # 18.07
-        # [1, 0, 1, 1, 1, 1, 1, 0, 0],  # 18.18
-        # [1, 1, 1, 1, 0, 0, 1, 1, 0],  # 18.40
-        # [1, 0, 1, 0, 1, 0, 1, 1, 0],  # 18.52
-        # [1, 1, 1, 0, 1, 1, 1, 0, 0],  # 18.75
-        # [0, 0, 1, 1, 1, 1, 1, 0, 0],  # 18.87
-        # [0, 1, 1, 1, 0, 0, 1, 1, 0],  # 19.11
-        # [0, 1, 0, 1, 1, 1, 1, 0, 0],  # 19.11
-        # [0, 0, 1, 0, 1, 0, 1, 1, 0],  # 19.23
-        # [0, 1, 1, 0, 1, 1, 1, 0, 0],  # 19.48
-        # [1, 0, 1, 1, 0, 0, 1, 1, 0],  # 19.61
-        # [1, 1, 1, 1, 0, 1, 1, 0, 0],  # 19.87
-        [1, 0, 1, 0, 1, 1, 1, 0, 0],  # 20.00
-        # [1, 1, 1, 0, 0, 0, 1, 1, 0],  # 20.27
-        # [0, 0, 1, 1, 0, 0, 1, 1, 0],  # 20.41
-        # [0, 1, 1, 1, 0, 1, 1, 0, 0],  # 20.69
-        # [0, 0, 1, 0, 1, 1, 1, 0, 0],  # 20.83
-        # [0, 1, 1, 0, 0, 0, 1, 1, 0],  # 21.13
-        # [1, 0, 1, 1, 0, 1, 1, 0, 0],  # 21.28
-        # [1, 1, 0, 1, 0, 1, 1, 0, 0],  # 21.58
-        # [1, 0, 1, 0, 0, 0, 1, 1, 0],  # 21.74
-        # [1, 1, 1, 0, 0, 1, 1, 0, 0],  # 22.06
-        # [0, 0, 1, 1, 0, 1, 1, 0, 0],  # 22.22
-        # [0, 1, 0, 1, 0, 1, 1, 0, 0],  # 22.56
-        # [0, 0, 1, 0, 0, 0, 1, 1, 0],  # 22.73
-        # [0, 1, 1, 0, 0, 1, 1, 0, 0],  # 23.08
-        # [1, 0, 0, 1, 0, 1, 1, 0, 0],  # 23.26
-        # [1, 1, 1, 1, 1, 0, 1, 0, 0],  # 23.62
-        # [1, 0, 1, 0, 0, 1, 1, 0, 0],  # 23.81
-        # [1, 1, 0, 0, 0, 1, 1, 0, 0],  # 24.19
-        # [0, 0, 0, 1, 0, 1, 1, 0, 0],  # 24.39
-        # [0, 1, 1, 1, 1, 0, 1, 0, 0],  # 24.79
-        # [0, 0, 1, 0, 0, 1, 1, 0, 0],  # 25.00
-        # [0, 1, 0, 0, 0, 1, 1, 0, 0],  # 25.42
-        # [1, 0, 1, 1, 1, 0, 1, 0, 0],  # 25.64
-        # [1, 1, 1, 1, 1, 1, 0, 0, 0],  # 26.09
-        # [1, 0, 0, 0, 0, 1, 1, 0, 0],  # 26.32
-        # [1, 1, 1, 0, 1, 0, 1, 0, 0],  # 26.79
-        # [0, 0, 1, 1, 1, 0, 1, 0, 0],  # 27.03
-        # [0, 1, 1, 1, 1, 1, 0, 0, 0],  # 27.52
-        # [0, 1, 0, 1, 1, 0, 1, 0, 0],  # 27.52
-        # [0, 0, 0, 0, 0, 1, 1, 0, 0],  # 27.78
-        # [0, 1, 1, 0, 1, 0, 1, 0, 0],  # 28.30
-        # [1, 0, 1, 1, 1, 1, 0, 0, 0],  # 28.57
-        # [1, 1, 1, 1, 0, 0, 1, 0, 0],  # 29.13
-        # [1, 0, 1, 0, 1, 0, 1, 0, 0],  # 29.41
-        [1, 1, 1, 0, 1, 1, 0, 0, 0],  # 30.00
-        # [0, 0, 1, 1, 1, 1, 0, 0, 0],  # 30.30
-        # [0, 1, 1, 1, 0, 0, 1, 0, 0],  # 30.93
-        # [0, 1, 0, 1, 1, 1, 0, 0, 0],  # 30.93
-        # [0, 0, 1, 0, 1, 0, 1, 0, 0],  # 31.25
-        # [0, 1, 1, 0, 1, 1, 0, 0, 0],  # 31.91
-        # [1, 0, 1, 1, 0, 0, 1, 0, 0],  # 32.26
-        # [1, 1, 1, 1, 0, 1, 0, 0, 0],  # 32.97
-        # [1, 0, 1, 0, 1, 1, 0, 0, 0],  # 33.33
-        # [1, 1, 1, 0, 0, 0, 1, 0, 0],  # 34.09
-        # [0, 0, 1, 1, 0, 0, 1, 0, 0],  # 34.48
-        # [0, 1, 1, 1, 0, 1, 0, 0, 0],  # 35.29
-        # [0, 0, 1, 0, 1, 1, 0, 0, 0],  # 35.71
-        # [0, 1, 1, 0, 0, 0, 1, 0, 0],  # 36.59
-        # [1, 0, 1, 1, 0, 1, 0, 0, 0],  # 37.04
-        # [1, 1, 0, 1, 0, 1, 0, 0, 0],  # 37.97
-        # [1, 0, 1, 0, 0, 0, 1, 0, 0],  # 38.46
-        # [1, 1, 1, 0, 0, 1, 0, 0, 0],  # 39.47
-        [0, 0, 1, 1, 0, 1, 0, 0, 0],  # 40.00
-        # [0, 1, 0, 1, 0, 1, 0, 0, 0],  # 41.10
-        # [0, 0, 1, 0, 0, 0, 1, 0, 0],  # 41.67
-        # [0, 1, 1, 0, 0, 1, 0, 0, 0],  # 42.86
-        # [1, 0, 0, 1, 0, 1, 0, 0, 0],  # 43.48
-        # [1, 1, 1, 1, 1, 0, 0, 0, 0],  # 44.78
-        # [1, 0, 1, 0, 0, 1, 0, 0, 0],  # 45.45
-        # [1, 1, 0, 0, 0, 1, 0, 0, 0],  # 46.87
-        # [0, 0, 0, 1, 0, 1, 0, 0, 0],  # 47.62
-        # [0, 1, 1, 1, 1, 0, 0, 0, 0],  # 49.18
-        [0, 0, 1, 0, 0, 1, 0, 0, 0],  # 50.00
-        # [0, 1, 0, 0, 0, 1, 0, 0, 0],  # 51.72
-        # [1, 0, 1, 1, 1, 0, 0, 0, 0],  # 52.63
-        # [1, 1, 0, 1, 1, 0, 0, 0, 0],  # 54.55
-        # [1, 0, 0, 0, 0, 1, 0, 0, 0],  # 55.56
-        # [1, 1, 1, 0, 1, 0, 0, 0, 0],  # 57.69
-        # [0, 0, 1, 1, 1, 0, 0, 0, 0],  # 58.82
-        # [0, 1, 0, 1, 1, 0, 0, 0, 0],  # 61.22
-        # [0, 0, 0, 0, 0, 1, 0, 0, 0],  # 62.50
-        # [0, 1, 1, 0, 1, 0, 0, 0, 0],  # 65.22
-        # [1, 0, 0, 1, 1, 0, 0, 0, 0],  # 66.67
-        # [1, 1, 1, 1, 0, 0, 0, 0, 0],  # 69.77
-        # [1, 0, 1, 0, 1, 0, 0, 0, 0],  # 71.43
-        # [1, 1, 0, 0, 1, 0, 0, 0, 0],  # 75.00
-        # [0, 0, 0, 1, 1, 0, 0, 0, 0],  # 76.92
-        [0, 1, 1, 1, 0, 0, 0, 0, 0],  # 81.08
-        # [0, 0, 1, 0, 1, 0, 0, 0, 0],  # 83.33
-        # [0, 1, 0, 0, 1, 0, 0, 0, 0],  # 88.24
-        # [1, 0, 1, 1, 0, 0, 0, 0, 0],  # 90.91
-        # [1, 1, 0, 1, 0, 0, 0, 0, 0],  # 96.77
-        [1, 0, 0, 0, 1, 0, 0, 0, 0],  # 100.00
-        # [1, 1, 1, 0, 0, 0, 0, 0, 0],  # 107.14
-        # [0, 0, 1, 1, 0, 0, 0, 0, 0],  # 111.11
-        # [0, 1, 0, 1, 0, 0, 0, 0, 0],  # 120.00
-        # [0, 0, 0, 0, 1, 0, 0, 0, 0],  # 125.00
-        # [0, 1, 1, 0, 0, 0, 0, 0, 0],  # 136.36
-        # [1, 0, 0, 1, 0, 0, 0, 0, 0],  # 142.86
-        # [1, 0, 1, 0, 0, 0, 0, 0, 0],  # 166.67
-        # [1, 1, 0, 0, 0, 0, 0, 0, 0],  # 187.50
-        [0, 0, 0, 1, 0, 0, 0, 0, 0],  # 200.00
-        [0, 0, 1, 0, 0, 0, 0, 0, 0],  # 250.00
-        [0, 1, 0, 0, 0, 0, 0, 0, 0],  # 300.00
-        [1, 0, 0, 0, 0, 0, 0, 0, 0],  # 500.00
-    ]
     for tfs_lens_combo in tfs_lens_combinations:
-        # Put us at the beginning of the range prior to lens insertion
-        # (TODO: This being required may indicate a bug at fast rates...)
-        yield from bps.mv(checkout.energy, 0.0)
-
-        yield from checkout.set_lens_state(xrt_lens, tfs_lens_combo)
-        yield from bpp.stub_wrapper(bp.grid_scan(
-            [tfs, checkout],
-            checkout.energy, 0, 38000, num_steps,
-            # snake_axes=False,
-        ))
+        tfs_mask = int(bits_to_mask(tfs_lens_combo))
+        if checkpoint is not None and checkpoint.is_complete(xrt_lens, tfs_mask):
+            logger.info("Skipping completed lens set %s", tfs_lens_combo)
+            continue
+
+        tfs_radius = float(effective_radius(tfs_lens_radii, tfs_mask))
+        energies = sweep_energies(xrt_lens, tfs_radius, num_steps,
+                                  adaptive=adaptive, energy_ranges=energy_ranges)
+        previous = []
+        if checkpoint is not None:
+            previous = checkpoint.results(xrt_lens, tfs_mask)
+            energies = checkpoint.remaining(xrt_lens, tfs_mask, energies)
+
+        def record(energy, faulted=None, mask=tfs_mask):
+            if checkpoint is not None:
+                checkpoint.record(xrt_lens, mask, energy, faulted)
+
+        if len(energies) or (adaptive and refine and previous):
+            yield from checkout.set_lens_state(xrt_lens, tfs_lens_combo)
+        if adaptive:
+            yield from adaptive_energy_scan(
+                [tfs, checkout], checkout.energy, energies,
+                tfs.interlock.faulted, refine=refine,
+                sequence=checkout.update_seq, callback=record, initial=previous,
+            )
+        elif len(energies):
+            def per_step(detectors, step, pos_cache):
+                yield from checkout.settled_step(detectors, step, pos_cache)
+                record(step[checkout.energy])
+
+            yield from bpp.stub_wrapper(bp.list_scan(
+                [tfs, checkout], checkout.energy, list(energies),
+                per_step=per_step,
+            ))
+
+        if checkpoint is not None:
+            checkpoint.mark_complete(xrt_lens, tfs_mask)
 
     yield from bps.close_run()
@@ -0,0 +1,605 @@
+"""
+Energy dependence of the focal plane of every lens combination
+
+The focal length of a beryllium lens with apex radius ``R`` is
+``f = R / (2 * delta(E))``, where the refractive index decrement ``delta``
+scales with the inverse square of the photon energy. The focal power of every
+lens is therefore proportional to ``u = 1 / E**2``, and each element of the
+ray transfer matrix of a combination of lenses is a polynomial in ``u``. The
+coefficients of these polynomials only depend on the lens geometry, so they
+are computed once for every combination and the image position at any photon
+energy is found with a vectorized polynomial evaluation.
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+
+import numpy as np
+
+from .cache import cache_dir
+from .combinations import combination_masks, effective_radius, popcount
+from .lens import LensConnect
+
+logger = logging.getLogger(__name__)
+
+# delta(E) * E**2 for beryllium [eV**2]
+BERYLLIUM_DELTA = 340.5
+
+
+def refractive_decrement(energy):
+    """
+    Refractive index decrement of beryllium
+
+    Parameters
+    ----------
+    energy : array_like
+        Photon energy in eV
+
+    Returns
+    -------
+    np.ndarray
+        The refractive index decrement ``delta``
+    """
+    return BERYLLIUM_DELTA / np.square(np.asarray(energy, dtype=float))
+
+
+def focal_length(radius, energy):
+    """
+    Focal length of a beryllium lens
+
+    Parameters
+    ----------
+    radius : array_like
+        Radius of the lens in microns
+
+    energy : array_like
+        Photon energy in eV
+
+    Returns
+    -------
+    np.ndarray
+        Focal length of the lens in meters
+    """
+    return np.asarray(radius, dtype=float) * 1e-6 / (2 * refractive_decrement(energy))
+
+
+def lens_geometry(lenses):
+    """
+    Hashable description of the radius and position of a list of lenses
+
+    Parameters
+    ----------
+    lenses : list
+        Lens objects with ``radius`` and ``z`` attributes
+
+    Returns
+    -------
+    tuple
+        Tuple of ``(radius, z)`` pairs
+    """
+    return tuple((float(lens.radius), float(lens.z)) for lens in lenses)
+
+
+def geometry_hash(xrt_geometry, tfs_geometry, z_obj=0.0):
+    """
+    Hash identifying a lens geometry
+
+    Parameters
+    ----------
+    xrt_geometry : tuple
+        ``(radius, z)`` of each XRT lens
+
+    tfs_geometry : tuple
+        ``(radius, z)`` of each Transfocator lens
+
+    z_obj : float, optional
+        The source point of the beam
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 digest
+    """
+    description = json.dumps({
+        "xrt": [list(map(float, lens)) for lens in xrt_geometry],
+        "tfs": [list(map(float, lens)) for lens in tfs_geometry],
+        "z_obj": float(z_obj),
+        "delta": BERYLLIUM_DELTA,
+    })
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def _polyval(coefficients, u):
+    """Evaluate polynomials with coefficients in increasing order of degree"""
+    u = np.asarray(u)
+    expand = (slice(None),) * (coefficients.ndim - 1) + (np.newaxis,) * u.ndim
+    result = np.zeros(coefficients.shape[:-1] + u.shape)
+    for idx in range(coefficients.shape[-1] - 1, -1, -1):
+        result = result * u + coefficients[..., idx][expand]
+    return result
+
+
+class CombinationTable:
+    """
+    Energy independent description of every combination of lenses
+
+    Combinations are indexed as described in :mod:`transfocate.combinations`.
+
+    Parameters
+    ----------
+    xrt_geometry : tuple
+        ``(radius, z)`` of each XRT lens, radius in microns and z in meters
+
+    tfs_geometry : tuple
+        ``(radius, z)`` of each Transfocator lens
+
+    z_obj : float, optional
+        The source point of the beam
+
+    Attributes
+    ----------
+    xrt_index : np.ndarray
+        XRT lens index of each combination, ``0`` meaning no XRT lens
+
+    tfs_mask : np.ndarray
+        Bitmask of the Transfocator lenses in each combination
+
+    nlens : np.ndarray
+        Total number of lenses in each combination
+
+    effective_radius : np.ndarray
+        Effective radius of all lenses in each combination
+
+    tfs_radius : np.ndarray
+        Effective radius of the Transfocator lenses in each combination
+
+    coefficients : np.ndarray
+        Polynomial coefficients in ``u = (1 keV / E)**2`` of the ``B`` and ``D``
+        elements of the ray transfer matrix from ``z_obj`` to ``z_ref``, with
+        shape ``(n_combinations, 2, degree + 1)``
+
+    z_ref : float
+        Position of the reference plane used for ``coefficients``
+    """
+    def __init__(self, xrt_geometry, tfs_geometry, z_obj=0.0):
+        self.xrt_geometry = tuple(xrt_geometry)
+        self.tfs_geometry = tuple(tfs_geometry)
+        self.z_obj = float(z_obj)
+        n_xrt = len(self.xrt_geometry)
+        n_tfs = len(self.tfs_geometry)
+        self.xrt_index, self.tfs_mask = combination_masks(n_xrt, n_tfs)
+        self.nlens = popcount(self.tfs_mask) + (self.xrt_index > 0)
+        tfs_radii = [radius for radius, _ in self.tfs_geometry]
+        xrt_radii = np.array([np.inf] + [radius for radius, _ in self.xrt_geometry])
+        self.tfs_radius = effective_radius(tfs_radii, self.tfs_mask)
+        with np.errstate(divide="ignore"):
+            inverse = (np.where(self.tfs_radius > 0, 1 / self.tfs_radius, 0.0)
+                       + 1 / xrt_radii[self.xrt_index])
+            self.effective_radius = np.where(inverse > 0, 1 / inverse, 0.0)
+        self.coefficients, self.z_ref = self._compute_coefficients()
+        logger.debug("Computed coefficients for %s combinations of lenses",
+                     len(self))
+
+    @classmethod
+    def from_lenses(cls, xrt_lenses, tfs_lenses, z_obj=0.0):
+        """
+        Create or reuse the table for the current geometry of the given lenses
+
+        Tables are cached per lens geometry, so repeated calls with unchanged
+        lenses return the same object. Tables are also kept in an on-disk
+        cache, see :mod:`transfocate.cache`, and memory-mapped read-only so
+        processes on the same host share a single copy.
+
+        Parameters
+        ----------
+        xrt_lenses : list
+            The XRT pre-focusing lenses
+
+        tfs_lenses : list
+            The Transfocator lenses
+
+        z_obj : float, optional
+            The source point of the beam
+        """
+        return cached_combination_table(lens_geometry(xrt_lenses),
+                                        lens_geometry(tfs_lenses),
+                                        float(z_obj))
+
+    # Arrays stored in the on-disk cache
+    _cache_arrays = ("xrt_index", "tfs_mask", "nlens", "effective_radius",
+                     "tfs_radius", "coefficients")
+
+    def save(self, path):
+        """
+        Save the table as a directory of ``.npy`` files
+
+        The table is written to a temporary directory first and renamed into
+        place, so concurrent readers never see a partially written table.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            Directory to create
+        """
+        path = pathlib.Path(path)
+        staging = pathlib.Path(tempfile.mkdtemp(dir=path.parent,
+                                                prefix=f".{path.name}."))
+        try:
+            for name in self._cache_arrays:
+                np.save(staging / f"{name}.npy", getattr(self, name))
+            with open(staging / "metadata.json", "w") as fp:
+                json.dump({"xrt_geometry": self.xrt_geometry,
+                           "tfs_geometry": self.tfs_geometry,
+                           "z_obj": self.z_obj,
+                           "z_ref": self.z_ref}, fp)
+            os.rename(staging, path)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            # Another process may have saved the same table first
+            if not (path / "metadata.json").exists():
+                raise
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a table saved with :meth:`.save`
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            Directory of the saved table
+
+        mmap : bool, optional
+            Memory-map the arrays read-only instead of reading them
+        """
+        path = pathlib.Path(path)
+        with open(path / "metadata.json") as fp:
+            metadata = json.load(fp)
+        table = cls.__new__(cls)
+        table.xrt_geometry = tuple(map(tuple, metadata["xrt_geometry"]))
+        table.tfs_geometry = tuple(map(tuple, metadata["tfs_geometry"]))
+        table.z_obj = metadata["z_obj"]
+        table.z_ref = metadata["z_ref"]
+        for name in cls._cache_arrays:
+            setattr(table, name, np.load(path / f"{name}.npy",
+                                         mmap_mode="r" if mmap else None))
+        return table
+
+    def __len__(self):
+        return len(self.tfs_mask)
+
+    @property
+    def geometry_hash(self):
+        """Hash identifying the lens geometry and source point of the table"""
+        return geometry_hash(self.xrt_geometry, self.tfs_geometry, self.z_obj)
+
+    def _compute_coefficients(self):
+        """Build the ray transfer matrix polynomials of every combination"""
+        n_combo = len(self)
+        n_xrt = len(self.xrt_geometry)
+        degree = len(self.tfs_geometry) + (1 if n_xrt else 0)
+        # Each lens with its power at 1 keV and a membership mask
+        lenses = [(radius, z, self.xrt_index == idx)
+                  for idx, (radius, z) in enumerate(self.xrt_geometry, 1)]
+        lenses.extend((radius, z, (self.tfs_mask >> idx) & 1 == 1)
+                      for idx, (radius, z) in enumerate(self.tfs_geometry))
+        lenses.sort(key=lambda lens: lens[1])
+        # Ray transfer matrix elements as polynomials in u
+        a, b, c, d = (np.zeros((n_combo, degree + 1)) for _ in range(4))
+        a[:, 0] = 1.0
+        d[:, 0] = 1.0
+        z_prev = self.z_obj
+        for radius, z, member in lenses:
+            # Free space propagation to the lens
+            distance = z - z_prev
+            a += distance * c
+            b += distance * d
+            z_prev = z
+            # Thin lens with power proportional to u
+            power = 2 * BERYLLIUM_DELTA / radius
+            c[member, 1:] -= power * a[member, :-1]
+            d[member, 1:] -= power * b[member, :-1]
+        return np.stack([b, d], axis=1), z_prev
+
+    def image(self, energy):
+        """
+        Image position of every combination
+
+        Parameters
+        ----------
+        energy : float or array_like
+            Photon energy in eV
+
+        Returns
+        -------
+        np.ndarray
+            Image position in accelerator coordinates with shape
+            ``(n_combinations,) + np.shape(energy)``. Combinations with an
+            image at infinity are reported as ``np.inf``
+        """
+        u = np.square(1e3 / np.asarray(energy, dtype=float))
+        b = _polyval(self.coefficients[:, 0], u)
+        d = _polyval(self.coefficients[:, 1], u)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            image = self.z_ref - b / d
+        return np.where(d == 0.0, np.inf, image)
+
+    def candidates(self, n=None, include_prefocus=True):
+        """
+        Mask of combinations considered by :meth:`.Calculator.find_solution`
+
+        Parameters
+        ----------
+        n : int, optional
+            The maximum number of lenses in a valid combination
+
+        include_prefocus : bool, optional
+            Use only combinations that include a prefocusing lens. If False,
+            only combinations of Transfocator lenses are used
+
+        Returns
+        -------
+        np.ndarray
+            Boolean mask over all combinations
+        """
+        mask = self.tfs_mask > 0
+        if include_prefocus and self.xrt_geometry:
+            mask &= self.xrt_index > 0
+        else:
+            mask &= self.xrt_index == 0
+        if n is not None:
+            mask &= self.nlens <= n
+        return mask
+
+    def to_lens_connect(self, index, xrt_lenses, tfs_lenses):
+        """
+        Create the LensConnect for a combination
+
+        Parameters
+        ----------
+        index : int
+            Flat index of the combination
+
+        xrt_lenses : list
+            The XRT lenses used to build this table
+
+        tfs_lenses : list
+            The Transfocator lenses used to build this table
+
+        Returns
+        -------
+        LensConnect
+        """
+        xrt_index = self.xrt_index[index]
+        tfs_mask = self.tfs_mask[index]
+        lenses = [lens for idx, lens in enumerate(tfs_lenses)
+                  if (tfs_mask >> idx) & 1]
+        if xrt_index:
+            lenses.append(xrt_lenses[xrt_index - 1])
+        return LensConnect(*lenses)
+
+
+@functools.lru_cache(maxsize=8)
+def cached_combination_table(xrt_geometry, tfs_geometry, z_obj):
+    """
+    The :class:`CombinationTable` of a lens geometry, using the disk cache
+
+    Parameters
+    ----------
+    xrt_geometry : tuple
+        The XRT lens geometry, as from :func:`lens_geometry`
+
+    tfs_geometry : tuple
+        The Transfocator lens geometry, as from :func:`lens_geometry`
+
+    z_obj : float
+        The source point of the beam
+
+    Returns
+    -------
+    CombinationTable
+    """
+    try:
+        directory = cache_dir("combinations-v1")
+    except OSError:
+        logger.warning("Combination table cache is not available",
+                       exc_info=True)
+        directory = None
+    if directory is None:
+        return CombinationTable(xrt_geometry, tfs_geometry, z_obj=z_obj)
+    path = directory / geometry_hash(xrt_geometry, tfs_geometry, z_obj)
+    if path.exists():
+        try:
+            return CombinationTable.load(path)
+        except (OSError, ValueError, KeyError):
+            logger.warning("Unable to load cached combination table %s", path,
+                           exc_info=True)
+            shutil.rmtree(path, ignore_errors=True)
+    table = CombinationTable(xrt_geometry, tfs_geometry, z_obj=z_obj)
+    try:
+        table.save(path)
+    except OSError:
+        logger.warning("Unable to cache combination table in %s", path,
+                       exc_info=True)
+        return table
+    return CombinationTable.load(path)
+
+
+class ChromaticTable:
+    """
+    Image position of every combination of lenses over a grid of energies
+
+    Parameters
+    ----------
+    combinations : CombinationTable
+        Precomputed table of lens combinations
+
+    energies : array_like
+        Increasing photon energies in eV
+
+    Attributes
+    ----------
+    image : np.ndarray
+        Image position with shape ``(n_combinations, n_energies)``
+    """
+    def __init__(self, combinations, energies):
+        self.combinations = combinations
+        self.energies = np.asarray(energies, dtype=float)
+        if np.any(np.diff(self.energies) <= 0):
+            raise ValueError("Energies must be strictly increasing")
+        self.image = combinations.image(self.energies)
+
+    @classmethod
+    def from_lenses(cls, xrt_lenses, tfs_lenses, energies, z_obj=0.0):
+        """
+        Create a table from the current geometry of the given lenses
+
+        Parameters
+        ----------
+        xrt_lenses : list
+            The XRT pre-focusing lenses
+
+        tfs_lenses : list
+            The Transfocator lenses
+
+        energies : array_like
+            Increasing photon energies in eV
+
+        z_obj : float, optional
+            The source point of the beam
+        """
+        combinations = CombinationTable.from_lenses(xrt_lenses, tfs_lenses,
+                                                    z_obj=z_obj)
+        return cls(combinations, energies)
+
+    def best_combo(self, energy, target, n=None, include_prefocus=True,
+                   allowed=None):
+        """
+        Find the combination with the image closest to a target
+
+        Energies on the grid of the table use its precomputed image
+        positions; others are evaluated exactly, so they need not lie on the
+        grid.
+
+        Parameters
+        ----------
+        energy : float or array_like
+            Photon energy in eV
+
+        target : float or array_like
+            The desired position of the focal plane, broadcast against
+            ``energy``
+
+        n : int, optional
+            The maximum number of lenses in a valid combination
+
+        include_prefocus : bool, optional
+            Use only combinations that include a prefocusing lens. If False,
+            only combinations of Transfocator lenses are used
+
+        allowed : np.ndarray, optional
+            Additional boolean mask of combinations to consider
+
+        Returns
+        -------
+        index : int or np.ndarray
+            Flat index of the best combination. ``-1`` if no combination is
+            available
+
+        residual : float or np.ndarray
+            Distance between the image of the combination and the target
+        """
+        energy, target = np.broadcast_arrays(np.asarray(energy, dtype=float),
+                                             np.asarray(target, dtype=float))
+        mask = self.combinations.candidates(n=n,
+                                            include_prefocus=include_prefocus)
+        if allowed is not None:
+            mask = mask & allowed
+        residual = np.abs(self.image_at(energy) - target)
+        residual[~mask] = np.inf
+        residual = np.where(np.isnan(residual), np.inf, residual)
+        index = np.argmin(residual, axis=0)
+        best = np.take_along_axis(residual, index[np.newaxis], axis=0)[0]
+        index = np.where(np.isfinite(best), index, -1)
+        if index.ndim == 0:
+            return int(index), float(best)
+        return index, best
+
+    def image_at(self, energy):
+        """
+        Image position of every combination at the given energies
+
+        Parameters
+        ----------
+        energy : float or array_like
+            Photon energy in eV
+
+        Returns
+        -------
+        np.ndarray
+            Image position with shape ``(n_combinations,) + np.shape(energy)``,
+            taken from :attr:`image` for energies on the grid
+        """
+        energy = np.asarray(energy, dtype=float)
+        flat = energy.ravel()
+        column = np.clip(np.searchsorted(self.energies, flat), 0,
+                         len(self.energies) - 1)
+        on_grid = self.energies[column] == flat
+        image = np.empty((len(self.image), len(flat)))
+        image[:, on_grid] = self.image[:, column[on_grid]]
+        if not on_grid.all():
+            image[:, ~on_grid] = self.combinations.image(flat[~on_grid])
+        return image.reshape((len(self.image),) + energy.shape)
+
+    def energy_range(self, index, target, tolerance):
+        """
+        Energy ranges over which a combination stays focused near a target
+
+        Parameters
+        ----------
+        index : int
+            Flat index of the combination
+
+        target : float
+            The desired position of the focal plane
+
+        tolerance : float
+            Allowed distance between the image and the target
+
+        Returns
+        -------
+        list
+            List of ``(low, high)`` energy ranges in eV. Boundaries between
+            grid points are linearly interpolated
+        """
+        excess = np.abs(self.image[index] - target) - tolerance
+        excess = np.where(np.isnan(excess), np.inf, excess)
+        inside = excess <= 0
+        ranges = []
+        edges = np.flatnonzero(np.diff(inside.astype(np.int8)))
+        starts = list(edges[~inside[edges]] + 1)
+        stops = list(edges[inside[edges]])
+        if inside[0]:
+            starts.insert(0, 0)
+        if inside[-1]:
+            stops.append(len(inside) - 1)
+        for start, stop in zip(starts, stops):
+            low = self._crossing(start - 1, start, excess)
+            high = self._crossing(stop + 1, stop, excess)
+            ranges.append((low, high))
+        return ranges
+
+    def _crossing(self, outside, inside, excess):
+        """Interpolate the energy at which the excess crosses zero"""
+        if outside < 0 or outside >= len(self.energies):
+            return float(self.energies[inside])
+        if not np.isfinite(excess[outside]):
+            return float(self.energies[inside])
+        fraction = excess[inside] / (excess[inside] - excess[outside])
+        return float(self.energies[inside]
+                     + fraction * (self.energies[outside] - self.energies[inside]))
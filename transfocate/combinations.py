@@ -0,0 +1,182 @@
+"""
+Vectorized helpers for enumerating combinations of lenses
+
+A combination of lenses is encoded by two integers: the index of the inserted
+XRT lens (``0`` for no pre-focusing lens, ``k`` for the ``k``-th XRT lens) and
+a bitmask of the inserted Transfocator lenses (bit ``i`` set when the ``i``-th
+Transfocator lens is inserted). Every combination is also given a flat index,
+``xrt_index * 2**n_tfs + tfs_mask``, which is used to address rows of the
+precomputed tables.
+"""
+import numpy as np
+
+
+def combination_masks(n_xrt, n_tfs):
+    """
+    Enumerate every combination of at most one XRT lens and any subset of the
+    Transfocator lenses
+
+    Parameters
+    ----------
+    n_xrt : int
+        Number of XRT pre-focusing lenses
+
+    n_tfs : int
+        Number of Transfocator lenses
+
+    Returns
+    -------
+    xrt_index : np.ndarray
+        XRT lens index of each combination, ``0`` meaning no XRT lens
+
+    tfs_mask : np.ndarray
+        Bitmask of the inserted Transfocator lenses of each combination
+    """
+    n_subsets = 2 ** n_tfs
+    xrt_index = np.repeat(np.arange(n_xrt + 1, dtype=np.int64), n_subsets)
+    tfs_mask = np.tile(np.arange(n_subsets, dtype=np.int64), n_xrt + 1)
+    return xrt_index, tfs_mask
+
+
+def mask_to_bits(tfs_mask, n_tfs):
+    """
+    Expand Transfocator bitmasks into an array of lens states
+
+    Parameters
+    ----------
+    tfs_mask : array_like
+        Bitmask(s) of inserted Transfocator lenses
+
+    n_tfs : int
+        Number of Transfocator lenses
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape ``(..., n_tfs)`` with ``1`` for each inserted lens
+    """
+    tfs_mask = np.asarray(tfs_mask, dtype=np.int64)
+    return ((tfs_mask[..., np.newaxis] >> np.arange(n_tfs)) & 1).astype(np.uint8)
+
+
+def bits_to_mask(bits):
+    """
+    Pack arrays of lens states into Transfocator bitmasks
+
+    Parameters
+    ----------
+    bits : array_like
+        Array of shape ``(..., n_tfs)`` with a truthy value for each inserted
+        lens
+
+    Returns
+    -------
+    np.ndarray
+        Bitmask(s) of the inserted Transfocator lenses
+    """
+    bits = np.asarray(bits).astype(bool)
+    weights = np.left_shift(1, np.arange(bits.shape[-1], dtype=np.int64))
+    return (bits * weights).sum(axis=-1)
+
+
+def popcount(mask):
+    """
+    Number of set bits in each element of an integer array
+
+    Parameters
+    ----------
+    mask : array_like
+        Non-negative integer bitmask(s)
+
+    Returns
+    -------
+    np.ndarray
+        Number of lenses represented by each bitmask
+    """
+    mask = np.asarray(mask, dtype=np.int64)
+    count = np.zeros(mask.shape, dtype=np.int64)
+    while np.any(mask):
+        count += mask & 1
+        mask = mask >> 1
+    return count
+
+
+def actuations(xrt_a, mask_a, xrt_b, mask_b):
+    """
+    Number of lens motions required to change from one combination to another
+
+    Each Transfocator lens that changes state counts as one motion, and any
+    change of the XRT lens counts as one motion of the XRT stage.
+
+    Parameters
+    ----------
+    xrt_a, mask_a : array_like
+        XRT index and Transfocator bitmask of the initial combination(s)
+
+    xrt_b, mask_b : array_like
+        XRT index and Transfocator bitmask of the final combination(s)
+
+    Returns
+    -------
+    np.ndarray
+        Number of lens actuations, broadcast over the inputs
+    """
+    xrt_change = np.not_equal(xrt_a, xrt_b).astype(np.int64)
+    return popcount(np.bitwise_xor(mask_a, mask_b)) + xrt_change
+
+
+def effective_radius(radii, tfs_mask):
+    """
+    Effective radius of the Transfocator lenses in each bitmask
+
+    Parameters
+    ----------
+    radii : array_like
+        Radius of each Transfocator lens
+
+    tfs_mask : array_like
+        Bitmask(s) of inserted Transfocator lenses
+
+    Returns
+    -------
+    np.ndarray
+        Effective radius of each combination. Combinations without any lenses
+        are reported as ``0.0``, matching :attr:`.LensConnect.effective_radius`
+    """
+    radii = np.asarray(radii, dtype=float)
+    bits = mask_to_bits(tfs_mask, len(radii))
+    inverse = bits @ np.reciprocal(radii)
+    with np.errstate(divide="ignore"):
+        return np.where(inverse > 0.0, 1.0 / inverse, 0.0)
+
+
+def combination_index(xrt_lenses, tfs_lenses, inserted):
+    """
+    Flat combination index of a set of inserted lenses
+
+    Parameters
+    ----------
+    xrt_lenses : list
+        The XRT pre-focusing lenses, in the order used for the combination
+        tables
+
+    tfs_lenses : list
+        The Transfocator lenses, in the order used for the combination tables
+
+    inserted : iterable
+        The lenses that are inserted. If several XRT lenses are given only the
+        first one is considered
+
+    Returns
+    -------
+    int
+        Flat index of the combination
+    """
+    inserted = list(inserted)
+    xrt_index = 0
+    for idx, lens in enumerate(xrt_lenses, 1):
+        if lens in inserted:
+            xrt_index = idx
+            break
+    tfs_mask = bits_to_mask([lens in inserted for lens in tfs_lenses])
+    return int(xrt_index * 2 ** len(tfs_lenses) + tfs_mask)
@@ -0,0 +1,117 @@
+"""
+Concurrent connection of ophyd devices, with timing
+
+Channel Access searches for every PV as soon as a device is created, so the
+signals of all devices connect in parallel; this module waits on all of
+them at once, rather than one device at a time, and records when each one
+connected.  The Channel Access client library keeps repeating the search
+for a PV until it connects, so a single timeout covers slow IOCs.
+"""
+import logging
+import time
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def _device_signals(devices):
+    """(device, signal) for every instantiated signal of the devices."""
+    for device in devices:
+        if not hasattr(device, "walk_signals"):
+            yield device, device
+            continue
+        for walk in device.walk_signals():
+            yield device, walk.item
+
+
+def connect_devices(devices, timeout=5.0, poll_period=0.01,
+                    raise_on_failure=True):
+    """
+    Wait for the signals of several devices to connect, concurrently.
+
+    Parameters
+    ----------
+    devices : list of ophyd.Device or ophyd.Signal
+        The devices to connect.
+    timeout : float, optional
+        Time to wait for all of the signals [s].
+    poll_period : float, optional
+        Time between checks of the connection state [s].  This is the
+        resolution of the reported latencies.
+    raise_on_failure : bool, optional
+        Raise if any signal is still disconnected after the timeout.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per signal, with the ``device`` and ``signal`` names, the
+        ``pvname`` (if any), whether it is ``connected`` and the ``latency``
+        [s] from the start of the wait until it connected.
+
+    Raises
+    ------
+    TimeoutError
+        If ``raise_on_failure`` and some signals did not connect.
+    """
+    signals = list(_device_signals(devices))
+    latency = [None] * len(signals)
+    pending = list(range(len(signals)))
+
+    t0 = time.monotonic()
+    deadline = t0 + timeout
+    while pending:
+        now = time.monotonic()
+        still_pending = []
+        for idx in pending:
+            if signals[idx][1].connected:
+                latency[idx] = now - t0
+            else:
+                still_pending.append(idx)
+        pending = still_pending
+        if not pending or now >= deadline:
+            break
+        time.sleep(poll_period)
+
+    report = pd.DataFrame(
+        {
+            "device": [device.name for device, _ in signals],
+            "signal": [signal.name for _, signal in signals],
+            "pvname": [getattr(signal, "pvname", None) for _, signal in signals],
+            "connected": [value is not None for value in latency],
+            "latency": [float("nan") if value is None else value
+                        for value in latency],
+        }
+    )
+    logger.info(
+        "Connected %d of %d signals in %.3f s",
+        report.connected.sum(), len(report), time.monotonic() - t0,
+    )
+    if pending and raise_on_failure:
+        missing = ", ".join(
+            str(report.pvname[idx] or report.signal[idx]) for idx in pending
+        )
+        raise TimeoutError(f"Signals failed to connect: {missing}")
+    return report
+
+
+def slowest_signals(report, count=10):
+    """
+    The slowest connecting signals of a :func:`connect_devices` report.
+
+    Signals which did not connect are listed first.
+
+    Parameters
+    ----------
+    report : pd.DataFrame
+        The connection report.
+    count : int, optional
+        Number of signals to list.
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    return report.sort_values(
+        ["connected", "latency"], ascending=[True, False], na_position="first"
+    ).head(count)
@@ -0,0 +1,322 @@
+"""
+Precomputed map of the best lens combination over energy and target position
+
+The map is a dense two dimensional array over photon energy and target
+position holding the index of the best combination and its residual distance
+from the target. It is stored as a structured ``.npy`` array, so it can be
+memory-mapped instead of read into memory, with the axes and the lens geometry
+it was computed for in a JSON file alongside it. Rows of the map are computed
+in parallel by worker processes writing directly into the memory-mapped file.
+
+Build a map for the live Transfocator with::
+
+    $ python -m transfocate.focus_map MFX:LENS focus_map.npy
+
+and use it with :meth:`.Transfocator.load_focus_map`.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+
+import numpy as np
+
+from .chromatic import cached_combination_table, geometry_hash, lens_geometry
+
+logger = logging.getLogger(__name__)
+
+FOCUS_MAP_DTYPE = np.dtype([("combo", "<i2"), ("residual", "<f4")])
+
+
+def metadata_path(path):
+    """Path of the JSON metadata stored alongside a focus map"""
+    path = pathlib.Path(path)
+    return path.with_name(path.name + ".json")
+
+
+def _fill_rows(path, xrt_geometry, tfs_geometry, z_obj, n, include_prefocus,
+               energies, targets, start, stop):
+    """Compute the rows ``start:stop`` of a focus map and write them to disk"""
+    table = cached_combination_table(xrt_geometry, tfs_geometry, z_obj)
+    candidates = table.candidates(n=n, include_prefocus=include_prefocus)
+    images = table.image(energies[start:stop])[candidates]
+    indices = np.flatnonzero(candidates)
+    cells = np.lib.format.open_memmap(path, mode="r+")
+    for row, image in enumerate(images.T, start):
+        residual = np.abs(image[:, np.newaxis] - targets)
+        residual = np.where(np.isnan(residual), np.inf, residual)
+        best = np.argmin(residual, axis=0)
+        cells["combo"][row] = indices[best]
+        cells["residual"][row] = residual[best, np.arange(len(targets))]
+    cells.flush()
+    del cells
+    return stop - start
+
+
+def build_focus_map(path, xrt_lenses, tfs_lenses, energies, targets, z_obj=0.0,
+                    n=None, include_prefocus=True, processes=None):
+    """
+    Build a focus map file for the current geometry of the given lenses
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        File to write the map to. The metadata is written to the same path
+        with a ``.json`` suffix appended
+
+    xrt_lenses : list
+        The XRT pre-focusing lenses
+
+    tfs_lenses : list
+        The Transfocator lenses
+
+    energies : array_like
+        Increasing photon energies in eV
+
+    targets : array_like
+        Increasing target positions of the focal plane in accelerator
+        coordinates
+
+    z_obj : float, optional
+        The source point of the beam
+
+    n : int, optional
+        The maximum number of lenses in a valid combination
+
+    include_prefocus : bool, optional
+        Use only combinations that include a prefocusing lens. If False, only
+        combinations of Transfocator lenses are used
+
+    processes : int, optional
+        Number of worker processes. By default one per CPU, and ``1`` computes
+        the map in the current process
+
+    Returns
+    -------
+    FocusMap
+        The memory-mapped map
+    """
+    path = pathlib.Path(path)
+    energies = np.asarray(energies, dtype=float)
+    targets = np.asarray(targets, dtype=float)
+    for name, axis in (("Energies", energies), ("Targets", targets)):
+        if np.any(np.diff(axis) <= 0):
+            raise ValueError(f"{name} must be strictly increasing")
+    xrt_geometry = lens_geometry(xrt_lenses)
+    tfs_geometry = lens_geometry(tfs_lenses)
+    metadata = {
+        "energies": energies.tolist(),
+        "targets": targets.tolist(),
+        "xrt_geometry": xrt_geometry,
+        "tfs_geometry": tfs_geometry,
+        "z_obj": float(z_obj),
+        "n": n,
+        "include_prefocus": include_prefocus,
+        "geometry_hash": geometry_hash(xrt_geometry, tfs_geometry, z_obj),
+    }
+    cells = np.lib.format.open_memmap(path, mode="w+", dtype=FOCUS_MAP_DTYPE,
+                                      shape=(len(energies), len(targets)))
+    del cells
+
+    processes = processes or os.cpu_count() or 1
+    chunk = max(1, -(-len(energies) // (4 * processes)))
+    args = (path, xrt_geometry, tfs_geometry, float(z_obj), n,
+            include_prefocus, energies, targets)
+    bounds = [(start, min(start + chunk, len(energies)))
+              for start in range(0, len(energies), chunk)]
+    if processes == 1:
+        for start, stop in bounds:
+            _fill_rows(*args, start, stop)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(_fill_rows, *args, start, stop)
+                       for start, stop in bounds]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+    with open(metadata_path(path), "w") as fp:
+        json.dump(metadata, fp)
+    logger.info("Wrote %s x %s focus map to %s", len(energies), len(targets),
+                path)
+    return FocusMap.load(path)
+
+
+class FocusMap:
+    """
+    Best lens combination over a grid of energies and target positions
+
+    Parameters
+    ----------
+    cells : np.ndarray
+        Structured array with ``combo`` and ``residual`` fields of shape
+        ``(n_energies, n_targets)``
+
+    metadata : dict
+        Axes and lens geometry of the map, see :func:`build_focus_map`
+    """
+    def __init__(self, cells, metadata):
+        self.cells = cells
+        self.metadata = metadata
+        self.energies = np.asarray(metadata["energies"], dtype=float)
+        self.targets = np.asarray(metadata["targets"], dtype=float)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a focus map file
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            File written by :func:`build_focus_map`
+
+        mmap : bool, optional
+            Memory-map the file read-only instead of reading it into memory
+        """
+        with open(metadata_path(path)) as fp:
+            metadata = json.load(fp)
+        cells = np.load(path, mmap_mode="r" if mmap else None)
+        return cls(cells, metadata)
+
+    @property
+    def geometry_hash(self):
+        """Hash of the lens geometry the map was computed for"""
+        return self.metadata["geometry_hash"]
+
+    @property
+    def combinations(self):
+        """The :class:`.CombinationTable` the combination indices refer to"""
+        return cached_combination_table(
+            tuple(map(tuple, self.metadata["xrt_geometry"])),
+            tuple(map(tuple, self.metadata["tfs_geometry"])),
+            self.metadata["z_obj"],
+        )
+
+    def covers(self, energy, target):
+        """
+        Whether each energy and target lies within the axes of the map
+
+        Parameters
+        ----------
+        energy : float or array_like
+            Photon energy in eV
+
+        target : float or array_like
+            The desired position of the focal plane
+
+        Returns
+        -------
+        bool or np.ndarray
+        """
+        energy = np.asarray(energy, dtype=float)
+        target = np.asarray(target, dtype=float)
+        return ((self.energies[0] <= energy) & (energy <= self.energies[-1])
+                & (self.targets[0] <= target) & (target <= self.targets[-1]))
+
+    def _cell(self, energy, target):
+        """Indices of the cells nearest to the given points"""
+        return (_nearest(self.energies, energy), _nearest(self.targets, target))
+
+    def lookup(self, energy, target):
+        """
+        Best combination at the cell nearest to each energy and target
+
+        Points outside of the axes of the map use the cell at its edge, and
+        log a warning, see :meth:`covers`.
+
+        Parameters
+        ----------
+        energy : float or array_like
+            Photon energy in eV
+
+        target : float or array_like
+            The desired position of the focal plane
+
+        Returns
+        -------
+        combo : int or np.ndarray
+            Flat index of the best combination, ``-1`` if there is none
+
+        residual : float or np.ndarray
+            Distance between the image and the target at the cell
+        """
+        outside = ~self.covers(energy, target)
+        if np.any(outside):
+            logger.warning("%d point(s) outside of the focus map (%s-%s eV, "
+                           "%s-%s m) use the nearest edge cell",
+                           np.count_nonzero(outside), self.energies[0],
+                           self.energies[-1], self.targets[0],
+                           self.targets[-1])
+        cell = self.cells[self._cell(energy, target)]
+        combo = np.where(np.isfinite(cell["residual"]), cell["combo"], -1)
+        if combo.ndim == 0:
+            return int(combo), float(cell["residual"])
+        return combo, cell["residual"]
+
+    def neighbours(self, energy, target):
+        """
+        Combinations of the cells surrounding an energy and target
+
+        Parameters
+        ----------
+        energy : float
+            Photon energy in eV
+
+        target : float
+            The desired position of the focal plane
+
+        Returns
+        -------
+        list
+            Unique flat combination indices
+        """
+        row, col = self._cell(energy, target)
+        rows = slice(max(row - 1, 0), row + 2)
+        cols = slice(max(col - 1, 0), col + 2)
+        cells = self.cells[rows, cols]
+        return sorted(set(cells["combo"][np.isfinite(cells["residual"])].tolist()))
+
+
+def _nearest(axis, values):
+    """Index of the nearest point of an increasing axis"""
+    values = np.asarray(values, dtype=float)
+    idx = np.clip(np.searchsorted(axis, values), 1, max(len(axis) - 1, 1))
+    below = axis[idx - 1]
+    above = axis[np.minimum(idx, len(axis) - 1)]
+    return np.where(np.abs(values - below) <= np.abs(above - values),
+                    idx - 1, idx)
+
+
+def main():
+    """
+    Build a focus map for the Transfocator
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("prefix", help="Transfocator PV prefix, e.g. MFX:LENS")
+    parser.add_argument("path", help="Output file")
+    parser.add_argument("--energy", nargs=3, type=float,
+                        default=[4000.0, 25000.0, 2101],
+                        metavar=("START", "STOP", "NUM"),
+                        help="Photon energy grid [eV]")
+    parser.add_argument("--target", nargs=3, type=float,
+                        default=[300.0, 500.0, 2001],
+                        metavar=("START", "STOP", "NUM"),
+                        help="Target position grid [m]")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of worker processes")
+    args = parser.parse_args()
+
+    from .transfocator import Transfocator
+    tfs = Transfocator(args.prefix, name="tfs")
+    tfs.wait_for_connection(timeout=10.0)
+    energy_start, energy_stop, energy_num = args.energy
+    target_start, target_stop, target_num = args.target
+    build_focus_map(args.path, tfs.xrt_lenses, tfs.tfs_lenses,
+                    np.linspace(energy_start, energy_stop, int(energy_num)),
+                    np.linspace(target_start, target_stop, int(target_num)),
+                    processes=args.processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark of how quickly the interlock responds to bypass changes
+
+:func:`interlock_latency_plan` repeatedly writes bypass energies and lens
+states with a :class:`~transfocate.checkout.LensInterlockCheckout`, and
+times how long each watched PV takes to change afterwards.
+:func:`latency_statistics` reduces the samples to percentiles, which can be
+saved and compared between PLC releases.
+"""
+import asyncio
+import logging
+import time
+
+import bluesky.plan_stubs as bps
+import numpy as np
+import pandas as pd
+from ophyd.status import SubscriptionStatus
+
+from .checkout import SETTLE_TIMEOUT, wait_status
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 99)
+
+
+async def _wait_all(statuses, timeout):
+    """Wait for statuses to finish, giving up on the rest after a timeout."""
+    if statuses:
+        tasks = [asyncio.ensure_future(wait_status(status)) for status in statuses]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+
+def _watch_change(signal, changes):
+    """Status finishing when a signal changes, recording the time in changes."""
+    initial = signal.get()
+
+    def changed(value, **kwargs):
+        if np.all(value == initial):
+            return False
+        changes[signal.name] = time.monotonic()
+        return True
+
+    return SubscriptionStatus(signal, changed)
+
+
+def interlock_latency_plan(checkout, watch, states, num=10,
+                           timeout=SETTLE_TIMEOUT):
+    """
+    Bluesky plan - time the response of the interlock to bypass writes.
+
+    The states are written in turn, ``num`` times over.  For each write,
+    the time until each watched signal changes is recorded, along with the
+    number of PLC cycles and updates in that time.  Signals which do not
+    change within ``timeout`` have a latency of NaN.  The PLC is allowed to
+    settle before each write.
+
+    This does not open a run.
+
+    Parameters
+    ----------
+    checkout : LensInterlockCheckout
+        The checkout device.
+    watch : list of ophyd.Signal
+        Signals to time, e.g. the interlock fault and trip limit signals.
+    states : list of dict
+        States to cycle through, each with an ``energy`` [eV] and/or the
+        ``xrt`` index and ``tfs`` lens states of
+        :meth:`~transfocate.checkout.LensInterlockCheckout.set_lens_state`.
+        Consecutive states should differ in a way that changes the watched
+        signals.
+    num : int, optional
+        Number of cycles through the states.
+    timeout : float, optional
+        Time to wait for the watched signals to change after each write [s].
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per write and watched signal with the ``repeat``, ``state``
+        index, ``signal`` name, ``latency`` [s], ``plc_cycles`` and
+        ``updates``.
+
+    Examples
+    --------
+    Toggle the energy across the minimum energy of XRT lens 3::
+
+        states = [dict(energy=9000.0, xrt=3, tfs=[1] + [0] * 8),
+                  dict(energy=20000.0)]
+        samples = RE(interlock_latency_plan(
+            checkout, [tfs.interlock.faulted, tfs.interlock.min_fault],
+            states, num=100)).plan_result
+        print(latency_statistics(samples))
+    """
+    samples = []
+    for repeat in range(num):
+        for state_index, state in enumerate(states):
+            args = []
+            if "energy" in state:
+                args.extend([checkout.energy, state["energy"]])
+            if "xrt" in state:
+                for signal, value in checkout.lens_state_writes(
+                        state["xrt"], state["tfs"]):
+                    args.extend([signal, value])
+
+            cycles = yield from bps.rd(checkout.plc_cycles)
+            since = yield from bps.rd(checkout.update_seq)
+            changes = {}
+            statuses = [_watch_change(signal, changes) for signal in watch]
+            t0 = time.monotonic()
+            yield from bps.mv(*args)
+            yield from bps.wait_for([lambda: _wait_all(statuses, timeout)])
+            for status in statuses:
+                if not status.done:
+                    status.set_exception(TimeoutError("No change"))
+            cycles_after = yield from bps.rd(checkout.plc_cycles)
+            updates_after = yield from bps.rd(checkout.update_seq)
+
+            for signal in watch:
+                changed_at = changes.get(signal.name)
+                samples.append(
+                    {
+                        "repeat": repeat,
+                        "state": state_index,
+                        "signal": signal.name,
+                        "latency": np.nan if changed_at is None else changed_at - t0,
+                        "plc_cycles": cycles_after - cycles,
+                        "updates": updates_after - since,
+                    }
+                )
+            yield from checkout.settle(updates_after, timeout=timeout)
+
+    samples = pd.DataFrame(samples)
+    logger.info("Recorded %d latency samples", len(samples))
+    return samples
+
+
+def latency_statistics(samples, percentiles=PERCENTILES, by=("signal",)):
+    """
+    Percentiles of the latencies from :func:`interlock_latency_plan`.
+
+    Parameters
+    ----------
+    samples : pd.DataFrame
+        The latency samples.
+    percentiles : tuple of float, optional
+        Percentiles to compute.
+    by : tuple of str, optional
+        Columns to group the samples by, e.g. ``("signal", "state")``.
+
+    Returns
+    -------
+    pd.DataFrame
+        Per group, the ``count`` of samples, the number ``missed`` (no
+        change seen), the ``mean``, each ``p<percentile>`` and the ``max``
+        latency [s], and the median number of PLC cycles.
+    """
+    grouped = samples.groupby(list(by))
+    latency = grouped["latency"]
+    stats = pd.DataFrame(
+        {
+            "count": latency.size(),
+            "missed": latency.apply(lambda values: int(values.isna().sum())),
+            "mean": latency.mean(),
+        }
+    )
+    for percentile in percentiles:
+        stats[f"p{percentile:g}"] = latency.quantile(percentile / 100.0)
+    stats["max"] = latency.max()
+    stats["plc_cycles"] = grouped["plc_cycles"].median()
+    return stats
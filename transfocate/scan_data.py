@@ -0,0 +1,283 @@
+"""
+Streaming storage of checkout scan data in Parquet datasets
+
+Events are appended in row groups as they arrive, so a sweep never needs to
+be held in memory, and the columns needed for plots and reports can be read
+back without parsing the rest of the data.  The events of a run are stored
+in a dataset directory, with one Parquet part file per :meth:`commit
+<ScanDataWriter.commit>`, so committed data is never rewritten.
+"""
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from bluesky.callbacks import CallbackBase
+
+logger = logging.getLogger(__name__)
+
+# Key of the run metadata in the Parquet schema metadata
+METADATA_KEY = b"transfocate.run"
+
+# Column type for each event model data key dtype
+ARROW_TYPES = {
+    "number": pa.float64(),
+    "integer": pa.int64(),
+    "boolean": pa.bool_(),
+    "string": pa.string(),
+}
+
+# Name of the part files of a dataset, numbered in the order written
+PART_FORMAT = "part-{:05d}.parquet"
+PART_PATTERN = re.compile(r"^part-(\d+)\.parquet$")
+
+
+def _parts(path):
+    """The part files of a dataset directory, in the order written."""
+    if not os.path.isdir(path):
+        return []
+    names = [name for name in os.listdir(path) if PART_PATTERN.match(name)]
+    return sorted(names, key=lambda name: int(PART_PATTERN.match(name)[1]))
+
+
+class ScanDataWriter(CallbackBase):
+    """
+    Bluesky callback appending the events of a run to a Parquet dataset.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The dataset directory to write.  Each part file is written under a
+        hidden temporary name and moved into place when the run stops, or
+        when the rows so far are made durable with :meth:`commit`, so a file
+        without its footer is never mistaken for a readable one.  The parts
+        of an earlier run are removed once the first part of a new run is
+        committed, unless ``append`` is set.
+    fields : list of str, optional
+        Data keys to store.  Defaults to all of them.
+    stream_name : str, optional
+        The event stream to store.
+    batch_size : int, optional
+        Number of events per row group.
+    append : bool, optional
+        Keep the rows of an existing dataset at ``path``, adding new events
+        after them, e.g. when resuming an interrupted sweep.
+    keep_failed : bool, optional
+        Keep the events received after the last :meth:`commit` of a run
+        that fails.  Disable this when the uncommitted events are read again
+        on resume.
+    """
+
+    def __init__(self, path, fields=None, stream_name="primary", batch_size=64,
+                 append=False, keep_failed=True):
+        super().__init__()
+        self.path = os.fspath(path)
+        self.fields = None if fields is None else list(fields)
+        self.stream_name = stream_name
+        self.batch_size = batch_size
+        self.append = append
+        self.keep_failed = keep_failed
+        self._descriptors = set()
+        self._data_keys = {}
+        self._start = None
+        self._rows = []
+        self._writer = None
+        self._schema = None
+        self._part = None
+        self._committed = False
+        self.rows_written = 0
+
+    @property
+    def part_path(self):
+        """The part file in progress, once committed."""
+        return os.path.join(self.path, PART_FORMAT.format(self._part))
+
+    @property
+    def partial_path(self):
+        """The path written to while the part is in progress."""
+        return os.path.join(self.path,
+                            "." + PART_FORMAT.format(self._part) + ".partial")
+
+    def start(self, doc):
+        self._start = doc
+        self._descriptors.clear()
+        self._data_keys.clear()
+        self._rows.clear()
+        self._schema = None
+        self._committed = False
+        self.rows_written = 0
+
+    def descriptor(self, doc):
+        if doc.get("name") == self.stream_name:
+            self._descriptors.add(doc["uid"])
+            self._data_keys.update(doc["data_keys"])
+
+    def event(self, doc):
+        if doc["descriptor"] not in self._descriptors:
+            return
+        data = doc["data"]
+        if self.fields is not None:
+            data = {key: data.get(key) for key in self.fields}
+        self._rows.append({"time": doc["time"], "seq_num": doc["seq_num"], **data})
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def stop(self, doc):
+        if not self.keep_failed and doc.get("exit_status") != "success":
+            self.discard()
+            return
+        self.flush()
+        if self._writer is None and not self._committed:
+            logger.warning("No events in run %s; %s not written",
+                           doc["run_start"], self.path)
+            return
+        self.commit()
+        logger.info("Wrote %d events to %s", self.rows_written, self.path)
+
+    def commit(self):
+        """
+        Make the events received so far durable and readable at ``path``.
+
+        The part file in progress is closed with its footer, synced to disk
+        and moved into place.  Later events are written to a new part file.
+        """
+        self.flush()
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        with open(self.partial_path, "rb") as fp:
+            os.fsync(fp.fileno())
+        os.replace(self.partial_path, self.part_path)
+        if not self.append and not self._committed:
+            # The first commit of this run replaces the data of an earlier one
+            for name in _parts(self.path):
+                if name != os.path.basename(self.part_path):
+                    os.remove(os.path.join(self.path, name))
+        self._committed = True
+
+    def discard(self):
+        """Drop the events received since the last :meth:`commit`."""
+        self._rows.clear()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.remove(self.partial_path)
+        logger.info("Discarded uncommitted events of %s", self.path)
+
+    def _column_type(self, key):
+        """Arrow type of a data key, inferred from the data if unknown."""
+        dtype = self._data_keys.get(key, {}).get("dtype")
+        if dtype in ARROW_TYPES:
+            return ARROW_TYPES[dtype]
+        return pa.array([row[key] for row in self._rows]).type
+
+    def flush(self):
+        """Write out the buffered events as a row group."""
+        if not self._rows:
+            return
+        if self._writer is None:
+            self._open()
+        batch = pa.RecordBatch.from_pylist(
+            self._rows, schema=self._writer.schema
+        )
+        self._writer.write_batch(batch)
+        self.rows_written += len(self._rows)
+        self._rows.clear()
+
+    def _open(self):
+        """Start a new part file, numbered after the existing ones."""
+        parts = _parts(self.path)
+        if self._schema is None and self.append and parts:
+            # Resumed runs keep the columns and run metadata of the dataset
+            self._schema = pq.read_schema(os.path.join(self.path, parts[0]))
+        if self._schema is None:
+            schema = pa.schema(
+                [("time", pa.float64()), ("seq_num", pa.int64())]
+                + [(key, self._column_type(key)) for key in self._rows[0]
+                   if key not in ("time", "seq_num")]
+            )
+            metadata = {
+                METADATA_KEY: json.dumps(
+                    {
+                        "uid": self._start["uid"],
+                        "time": self._start["time"],
+                        "plan_name": self._start.get("plan_name"),
+                    }
+                ).encode(),
+            }
+            self._schema = schema.with_metadata(metadata)
+        self._part = int(PART_PATTERN.match(parts[-1])[1]) + 1 if parts else 0
+        os.makedirs(self.path, exist_ok=True)
+        self._writer = pq.ParquetWriter(self.partial_path, self._schema)
+
+
+def read_scan_data(path, columns=None, with_metadata=False):
+    """
+    Read scan data written by :class:`ScanDataWriter`.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The dataset directory, or a single Parquet file.
+    columns : list of str, optional
+        Columns to read.  Defaults to all of them.
+    with_metadata : bool, optional
+        Also return the run metadata, as from :func:`scan_metadata`.
+
+    Returns
+    -------
+    df : pd.DataFrame
+    metadata : dict
+        Only if ``with_metadata`` is set.
+    """
+    table = pq.read_table(path, columns=columns)
+    if with_metadata:
+        return table.to_pandas(), _run_metadata(table.schema)
+    return table.to_pandas()
+
+
+def _run_metadata(schema):
+    metadata = schema.metadata or {}
+    info = json.loads(metadata.get(METADATA_KEY, b"{}"))
+    if "time" in info:
+        info["created"] = datetime.datetime.fromtimestamp(info["time"])
+    return info
+
+
+def scan_metadata(path):
+    """
+    Metadata of the run stored in a scan data file.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The dataset directory, or a single Parquet file.
+
+    Returns
+    -------
+    dict
+        The run ``uid``, ``plan_name`` and start ``time``, along with the
+        start time as ``created`` (a `datetime.datetime`).
+    """
+    return _run_metadata(ds.dataset(path, format="parquet").schema)
+
+
+def remove_scan_data(path):
+    """
+    Remove scan data written by :class:`ScanDataWriter`, if it exists.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The dataset directory, or a single Parquet file.
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
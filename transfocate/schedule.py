@@ -0,0 +1,255 @@
+"""
+Plan lens combinations for energy scans with a minimal number of lens motions
+
+Running :meth:`.Transfocator.focus_at` independently at each step of an energy
+scan may change many lenses between neighbouring energies, even though a
+single combination often keeps the focus within tolerance over a large range.
+:func:`plan_focus_schedule` instead chooses the sequence of combinations for
+the whole scan at once, minimizing the total number of lens actuations with
+dynamic programming over the chromatic tables.
+"""
+import logging
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+import prettytable
+
+from .combinations import actuations, mask_to_bits
+
+logger = logging.getLogger(__name__)
+
+
+class FocusSchedule:
+    """
+    Sequence of lens combinations for a list of energies
+
+    Parameters
+    ----------
+    combinations : CombinationTable
+        The table the combination indices refer to
+
+    energies : array_like
+        Photon energy of each step in eV
+
+    indices : array_like
+        Flat combination index of each step
+
+    residuals : array_like
+        Distance between the image and the target at each step
+
+    actuations : array_like
+        Number of lens motions required to reach each step
+    """
+    def __init__(self, combinations, energies, indices, residuals,
+                 actuations):
+        self.combinations = combinations
+        self.energies = np.asarray(energies, dtype=float)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.residuals = np.asarray(residuals, dtype=float)
+        self.actuations = np.asarray(actuations, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def xrt_index(self):
+        """XRT lens index of each step, ``0`` meaning no XRT lens"""
+        return self.combinations.xrt_index[self.indices]
+
+    @property
+    def tfs_mask(self):
+        """Transfocator bitmask of each step"""
+        return self.combinations.tfs_mask[self.indices]
+
+    @property
+    def total_actuations(self):
+        """Total number of lens motions required by the schedule"""
+        return int(self.actuations.sum())
+
+    def _info(self):
+        """
+        Create a table with the schedule
+        """
+        n_tfs = len(self.combinations.tfs_geometry)
+        pt = prettytable.PrettyTable(['Energy', 'XRT', 'TFS', 'Residual',
+                                      'Actuations'])
+        pt.align = 'l'
+        pt.float_format = '8.5'
+        for energy, xrt, bits, residual, moves in zip(
+                self.energies, self.xrt_index,
+                mask_to_bits(self.tfs_mask, n_tfs), self.residuals,
+                self.actuations):
+            pt.add_row([energy, xrt, ''.join(str(bit) for bit in bits),
+                        residual, moves])
+        return pt
+
+    def show_info(self):
+        """
+        Show a table of the schedule
+        """
+        print(self._info())
+
+
+def plan_focus_schedule(combinations, energies, target, tolerance, n=None,
+                        include_prefocus=True, initial=None, allowed=None):
+    """
+    Find the combinations for an energy scan with the fewest lens motions
+
+    Every step of the schedule keeps the image within ``tolerance`` of
+    ``target``. Among the schedules with the fewest lens actuations the one
+    with the smallest total distance from the target is chosen.
+
+    Parameters
+    ----------
+    combinations : CombinationTable
+        Precomputed table of lens combinations
+
+    energies : array_like
+        Photon energy of each step of the scan in eV, in scan order
+
+    target : float
+        The desired position of the focal plane in accelerator coordinates
+
+    tolerance : float
+        Allowed distance between the image and the target
+
+    n : int, optional
+        The maximum number of lenses in a valid combination
+
+    include_prefocus : bool, optional
+        Use only combinations that include a prefocusing lens. If False, only
+        combinations of Transfocator lenses are used
+
+    initial : int, optional
+        Flat index of the combination inserted before the scan. Motions
+        needed to reach the first step are counted if given
+
+    allowed : np.ndarray, optional
+        Boolean mask of allowed combinations, either over all combinations or
+        with shape ``(n_combinations, n_energies)`` for a mask per step
+
+    Returns
+    -------
+    FocusSchedule
+
+    Raises
+    ------
+    ValueError
+        If no combination reaches the target at one of the energies
+    """
+    energies = np.atleast_1d(np.asarray(energies, dtype=float))
+    residual = np.abs(combinations.image(energies) - target)
+    valid = residual <= tolerance
+    valid &= combinations.candidates(n=n,
+                                     include_prefocus=include_prefocus)[:, None]
+    if allowed is not None:
+        allowed = np.asarray(allowed, dtype=bool)
+        valid &= allowed if allowed.ndim == 2 else allowed[:, None]
+    unreachable = energies[~valid.any(axis=0)]
+    if len(unreachable):
+        raise ValueError(f"No combination is within {tolerance} of {target} "
+                         f"at energies {unreachable.tolist()}")
+
+    xrt, mask = combinations.xrt_index, combinations.tfs_mask
+    states = np.flatnonzero(valid[:, 0])
+    if initial is None:
+        cost = np.zeros(len(states), dtype=np.int64)
+    else:
+        cost = actuations(xrt[initial], mask[initial], xrt[states], mask[states])
+    error = residual[states, 0]
+    history = [(states, np.full(len(states), -1))]
+    # Forward pass, keeping the best predecessor of every valid combination
+    for step in range(1, len(energies)):
+        current = np.flatnonzero(valid[:, step])
+        moves = actuations(xrt[states, None], mask[states, None],
+                           xrt[None, current], mask[None, current])
+        total = cost[:, None] + moves
+        best = total.min(axis=0)
+        ties = np.where(total == best, error[:, None], np.inf)
+        previous = np.argmin(ties, axis=0)
+        cost = best
+        error = error[previous] + residual[current, step]
+        history.append((current, previous))
+        states = current
+    # Backtrack from the best final combination
+    position = int(np.lexsort((error, cost))[0])
+    indices = []
+    for states, previous in reversed(history):
+        indices.append(states[position])
+        position = previous[position]
+    indices = np.array(indices[::-1])
+    before = np.concatenate([[initial if initial is not None else indices[0]],
+                             indices[:-1]])
+    steps = actuations(xrt[before], mask[before], xrt[indices], mask[indices])
+    logger.info("Planned %s steps requiring %s lens actuations",
+                len(indices), steps.sum())
+    return FocusSchedule(combinations, energies, indices,
+                         residual[indices, np.arange(len(indices))], steps)
+
+
+def focus_schedule_scan(detectors, energy, transfocator, schedule, *,
+                        md=None):
+    """
+    Bluesky plan - scan energy following a precomputed lens schedule
+
+    At every step the energy and any lenses that change state are moved
+    together before reading the detectors. Lenses are moved the same way as
+    :meth:`.Transfocator.focus_at`.
+
+    Parameters
+    ----------
+    detectors : list
+        Readable devices to read at every step
+
+    energy : ophyd.Device
+        Movable setting the photon energy
+
+    transfocator : Transfocator
+        The Transfocator the schedule was planned for
+
+    schedule : FocusSchedule
+        Result of :func:`plan_focus_schedule`
+
+    md : dict, optional
+        Additional metadata for the run
+    """
+    detectors = list(detectors)
+    xrt_lenses = transfocator.xrt_lenses
+    tfs_lenses = transfocator.tfs_lenses
+    _md = {
+        'detectors': [det.name for det in detectors],
+        'motors': [energy.name],
+        'num_points': len(schedule),
+        'num_intervals': len(schedule) - 1,
+        'plan_args': {'detectors': list(map(repr, detectors)),
+                      'energy': repr(energy),
+                      'transfocator': repr(transfocator),
+                      'energies': list(schedule.energies)},
+        'plan_name': 'focus_schedule_scan',
+        'hints': {'dimensions': [([energy.name], 'primary')]},
+    }
+    _md.update(md or {})
+    bits = mask_to_bits(schedule.tfs_mask, len(tfs_lenses))
+
+    @bpp.stage_decorator(detectors + [energy])
+    @bpp.run_decorator(md=_md)
+    def inner():
+        previous_xrt, previous_bits = None, None
+        for step, value in enumerate(schedule.energies):
+            args = [energy, value]
+            xrt_index = schedule.xrt_index[step]
+            if xrt_index != previous_xrt:
+                # Only tell one XRT lens to move
+                if xrt_index:
+                    args.extend([xrt_lenses[xrt_index - 1], 'IN'])
+                else:
+                    args.extend([xrt_lenses[0], 'OUT'])
+            for idx, lens in enumerate(tfs_lenses):
+                if previous_bits is None or bits[step, idx] != previous_bits[idx]:
+                    args.extend([lens, 'IN' if bits[step, idx] else 'OUT'])
+            previous_xrt, previous_bits = xrt_index, bits[step]
+            yield from bps.mv(*args)
+            yield from bps.trigger_and_read(detectors + [energy])
+
+    return (yield from inner())
@@ -0,0 +1,477 @@
+"""
+Simulated transfocator PLC and IOC
+
+A caproto server serving the ``MFX:LENS`` PV tree used by
+:class:`~transfocate.transfocator.Transfocator`,
+:class:`~transfocate.transfocator.TransfocatorInterlock` and
+:class:`~transfocate.checkout.LensInterlockCheckout`, so that checkouts and
+focusing can be run without the MFX IOC.
+
+The PLC is modelled as a cycle which reads the lens states and energy, and
+every few cycles publishes the interlock outputs and increments
+``:PLC:UPDATE_SEQ``.  The trip limits and faults are those of the offline
+interlock model, :func:`~transfocate.table.faults.predict_faults`.  Lenses
+take a while to move, during which their state is unknown.  All times are
+divided by ``speedup``, to run checkouts faster than in real time.
+
+The translation stage of the transfocator is served as a minimal IMS
+motor, which moves at its velocity but does not change the focus.
+
+Usage::
+
+    python -m transfocate.sim_ioc --speedup 10
+
+then, with ``EPICS_CA_ADDR_LIST`` reaching the server::
+
+    tfs = Transfocator("MFX:LENS", name="tfs")
+
+Within Python, :func:`sim_pvdb` creates the PVs to serve.
+"""
+import argparse
+import asyncio
+import logging
+
+from caproto import ChannelType
+from caproto.server import PVGroup, SubGroup, pvproperty, run
+
+from .chromatic import focal_length
+from .table.faults import FAULT_FIELDS, predict_faults
+from .table.info import tfs_lens_radii, xrt_lenses_radii
+from .table.interpolate import LimitTables
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIX = "MFX:LENS"
+TRANSLATION_PREFIX = "MFX:TFS:MMS:21"
+# PLC cycle time [s] and number of cycles between published updates
+CYCLE_TIME = 0.01
+UPDATE_CYCLES = 10
+# Time for a lens to insert or remove [s]
+MOTION_TIME = 2.0
+# Initial beam energy [eV]
+BEAM_ENERGY = 9500.0
+# Approximate positions of the lenses along the beamline [m]
+XRT_Z = 285.0
+TFS_Z = 397.5
+TFS_SPACING = 0.1
+
+
+class SimLens(PVGroup):
+    """
+    Simulated lens, with its bypass state for the checkout.
+
+    The lens is inserted or removed by writing 1 to ``:INSERT`` or
+    ``:REMOVE``, or its requested state to ``:STATE``.  It then moves for
+    the motion time of the IOC, with ``:STATE`` and ``:OUT`` both 0.
+    """
+
+    state = pvproperty(value=0, name=":STATE", doc="Inserted")
+    out = pvproperty(value=1, name=":OUT", read_only=True, doc="Removed")
+    insert = pvproperty(value=0, name=":INSERT", doc="Insert the lens")
+    remove = pvproperty(value=0, name=":REMOVE", doc="Remove the lens")
+    radius = pvproperty(value=0.0, name=":RADIUS", read_only=True,
+                        doc="Radius [um]")
+    z = pvproperty(value=0.0, name=":Z", read_only=True,
+                   doc="Position along the beamline [m]")
+    focus = pvproperty(value=0.0, name=":FOCUS", read_only=True,
+                       doc="Focal length at the beam energy [m]")
+    req_focus = pvproperty(value=0.0, name=":REQ_FOCUS",
+                           doc="Requested focus [m]")
+    known = pvproperty(value=1, name=":SAFE", read_only=True,
+                       doc="State known to the PLC")
+    bypass_state = pvproperty(value=0, name=":BYP:INS",
+                              doc="Inserted, in bypass mode")
+    bypass_known = pvproperty(value=0, name=":BYP:KNOWN",
+                              doc="State known, in bypass mode")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.inserted = False
+        self.moving = False
+        self._motion = None
+
+    @property
+    def plc(self):
+        return self.parent
+
+    def move(self, inserted):
+        """Start inserting or removing the lens."""
+        if self._motion is not None:
+            self._motion.cancel()
+        self.moving = True
+        self._motion = asyncio.ensure_future(self._move(bool(inserted)))
+
+    async def _move(self, inserted):
+        await self.state.write(0, verify_value=False)
+        await self.out.write(0, verify_value=False)
+        await asyncio.sleep(self.plc.motion_time / self.plc.speedup)
+        self.inserted = inserted
+        self.moving = False
+        await self.state.write(int(inserted), verify_value=False)
+        await self.out.write(int(not inserted), verify_value=False)
+
+    @state.putter
+    async def state(self, instance, value):
+        self.move(value)
+        # The readback follows the motion
+        return instance.value
+
+    @insert.putter
+    async def insert(self, instance, value):
+        if value:
+            self.move(True)
+        return 0
+
+    @remove.putter
+    async def remove(self, instance, value):
+        if value:
+            self.move(False)
+        return 0
+
+
+class SimIMS(PVGroup):
+    """
+    Minimal IMS motor record, with the fields used by
+    :class:`pcdsdevices.epics_motor.IMS` to stage, read and move.
+
+    Parameters
+    ----------
+    prefix : str
+        Motor record name.
+    speedup : float, optional
+        Factor by which motion is faster than its velocity.
+    **kwargs
+        Passed to :class:`caproto.server.PVGroup`.
+    """
+
+    user_readback = pvproperty(value=0.0, name=".RBV", read_only=True)
+    user_setpoint = pvproperty(value=0.0, name=".VAL")
+    dial_position = pvproperty(value=0.0, name=".DRBV", read_only=True)
+    user_offset = pvproperty(value=0.0, name=".OFF")
+    user_offset_dir = pvproperty(value=0, name=".DIR")
+    offset_freeze_switch = pvproperty(value=0, name=".FOFF")
+    set_use_switch = pvproperty(value=0, name=".SET")
+    velocity = pvproperty(value=1.0, name=".VELO")
+    velocity_base = pvproperty(value=0.0, name=".VBAS")
+    velocity_max = pvproperty(value=10.0, name=".VMAX")
+    acceleration = pvproperty(value=0.1, name=".ACCL")
+    motor_egu = pvproperty(value="mm", name=".EGU", dtype=ChannelType.STRING)
+    motor_is_moving = pvproperty(value=0, name=".MOVN", read_only=True)
+    motor_done_move = pvproperty(value=1, name=".DMOV", read_only=True)
+    high_limit_switch = pvproperty(value=0, name=".HLS", read_only=True)
+    low_limit_switch = pvproperty(value=0, name=".LLS", read_only=True)
+    high_limit_travel = pvproperty(value=100.0, name=".HLM")
+    low_limit_travel = pvproperty(value=-100.0, name=".LLM")
+    motor_stop = pvproperty(value=0, name=".STOP")
+    home_forward = pvproperty(value=0, name=".HOMF")
+    home_reverse = pvproperty(value=0, name=".HOMR")
+    disabled = pvproperty(value=0, name=".DISP")
+    description = pvproperty(value="Transfocator translation", name=".DESC",
+                             dtype=ChannelType.STRING)
+    motor_status = pvproperty(value=0, name=".MSTA", read_only=True)
+    motor_spg = pvproperty(value=2, name=".SPG")
+    reinit_command = pvproperty(value=0, name=".RINI")
+    seq_seln = pvproperty(value=0, name=":SEQ_SELN")
+    error_severity = pvproperty(value=0, name=".SEVR", read_only=True)
+    part_number = pvproperty(value="SIM", name=".PN", read_only=True,
+                             dtype=ChannelType.STRING)
+
+    def __init__(self, prefix=TRANSLATION_PREFIX, *, speedup=1.0, **kwargs):
+        self.speedup = float(speedup)
+        self._motion = None
+        super().__init__(prefix, **kwargs)
+
+    async def _move(self, target):
+        start = self.user_readback.value
+        await self.motor_done_move.write(0, verify_value=False)
+        await self.motor_is_moving.write(1, verify_value=False)
+        duration = abs(target - start) / max(self.velocity.value, 1e-9)
+        await asyncio.sleep(duration / self.speedup)
+        await self.user_readback.write(target, verify_value=False)
+        await self.dial_position.write(target, verify_value=False)
+        await self.motor_is_moving.write(0, verify_value=False)
+        await self.motor_done_move.write(1, verify_value=False)
+
+    @user_setpoint.putter
+    async def user_setpoint(self, instance, value):
+        if self._motion is not None:
+            self._motion.cancel()
+        self._motion = asyncio.ensure_future(self._move(value))
+        return value
+
+    @motor_stop.putter
+    async def motor_stop(self, instance, value):
+        if value and self._motion is not None:
+            self._motion.cancel()
+            await self.motor_is_moving.write(0, verify_value=False)
+            await self.motor_done_move.write(1, verify_value=False)
+        return 0
+
+
+def _lens(prefix, doc):
+    return SubGroup(SimLens, prefix=prefix, doc=doc)
+
+
+class TransfocatorSimIOC(PVGroup):
+    """
+    Simulated transfocator PLC and IOC.
+
+    Parameters
+    ----------
+    prefix : str
+        PV prefix, e.g. ``MFX:LENS``.
+    tables : LimitTables, optional
+        The trip limit tables.  Defaults to the spreadsheet tables.
+    speedup : float, optional
+        Factor by which the PLC cycle and lens motion are faster than in
+        reality.
+    cycle_time : float, optional
+        PLC cycle time [s].
+    update_cycles : int, optional
+        Number of PLC cycles between published updates.
+    motion_time : float, optional
+        Time for a lens to move [s].
+    **kwargs
+        Passed to :class:`caproto.server.PVGroup`.
+    """
+
+    # Interlock
+    trip_low = pvproperty(value=0.0, name=":ACTIVE:LOW", read_only=True,
+                          doc="Trip region low [um]")
+    trip_high = pvproperty(value=0.0, name=":ACTIVE:HIGH", read_only=True,
+                           doc="Trip region high [um]")
+    bypass = pvproperty(value=0, name=":BYPASS:STATUS", read_only=True,
+                        doc="Energy bypass in use")
+    bypass_set = pvproperty(value=0, name=":BYPASS:SET",
+                            doc="Use the energy bypass")
+    bypass_energy = pvproperty(value=0.0, name=":BYPASS:ENERGY",
+                               doc="Bypass energy [eV]")
+    bypass_positions = pvproperty(value=0, name=":BYPASS:INSERTED:SET",
+                                  doc="Use the bypass lens states")
+    ioc_alive = pvproperty(value=1, name=":BEAM:ALIVE", read_only=True)
+    faulted = pvproperty(value=0, name=":BEAM:FAULTED", read_only=True)
+    state_fault = pvproperty(value=0, name=":BEAM:UNKNOWN", read_only=True)
+    violated = pvproperty(value=0, name=":BEAM:VIOLATED", read_only=True)
+    min_fault = pvproperty(value=0, name=":BEAM:MIN_FAULT", read_only=True)
+    lens_required_fault = pvproperty(value=0, name=":BEAM:REQ_TFS_FAULT",
+                                     read_only=True)
+    table_fault = pvproperty(value=0, name=":BEAM:TAB_FAULT", read_only=True)
+    violated_latch = pvproperty(value=0, name=":BEAM:VIOLATED_LT",
+                                read_only=True)
+    min_fault_latch = pvproperty(value=0, name=":BEAM:MIN_FAULT_LT",
+                                 read_only=True)
+    lens_required_fault_latch = pvproperty(
+        value=0, name=":BEAM:REQ_TFS_FAULT_LT", read_only=True
+    )
+    table_fault_latch = pvproperty(value=0, name=":BEAM:TAB_FAULT_LT",
+                                   read_only=True)
+
+    # Beam
+    xrt_radius = pvproperty(value=0.0, name=":BEAM:XRT_RADIUS", read_only=True,
+                            doc="XRT effective radius [um]")
+    tfs_radius = pvproperty(value=0.0, name=":BEAM:TFS_RADIUS", read_only=True,
+                            doc="TFS effective radius [um]")
+    req_energy = pvproperty(value=BEAM_ENERGY, name=":BEAM:REQ_ENERGY",
+                            doc="Requested energy [eV]")
+    beam_energy = pvproperty(value=BEAM_ENERGY, name=":BEAM:ENERGY",
+                             doc="Beam energy [eV]")
+
+    # PLC
+    energy = pvproperty(value=BEAM_ENERGY, name=":PLC:ENERGY_RBV",
+                        read_only=True, doc="Energy used by the PLC [eV]")
+    plc_cycles = pvproperty(value=0, name=":PLC:CYCLE", read_only=True)
+    update_seq = pvproperty(value=0, name=":PLC:UPDATE_SEQ", read_only=True)
+
+    # XRT lenses
+    xrt_01 = _lens(":DIA:01", "XRT lens 1")
+    xrt_02 = _lens(":DIA:02", "XRT lens 2")
+    xrt_03 = _lens(":DIA:03", "XRT lens 3")
+
+    # TFS lenses
+    tfs_02 = _lens(":TFS:02", "TFS lens 2")
+    tfs_03 = _lens(":TFS:03", "TFS lens 3")
+    tfs_04 = _lens(":TFS:04", "TFS lens 4")
+    tfs_05 = _lens(":TFS:05", "TFS lens 5")
+    tfs_06 = _lens(":TFS:06", "TFS lens 6")
+    tfs_07 = _lens(":TFS:07", "TFS lens 7")
+    tfs_08 = _lens(":TFS:08", "TFS lens 8")
+    tfs_09 = _lens(":TFS:09", "TFS lens 9")
+    tfs_10 = _lens(":TFS:10", "TFS lens 10")
+
+    def __init__(self, prefix=DEFAULT_PREFIX, *, tables=None, speedup=1.0,
+                 cycle_time=CYCLE_TIME, update_cycles=UPDATE_CYCLES,
+                 motion_time=MOTION_TIME, **kwargs):
+        self.tables = tables or LimitTables()
+        self.speedup = float(speedup)
+        self.cycle_time = cycle_time
+        self.update_cycles = update_cycles
+        self.motion_time = motion_time
+        super().__init__(prefix, **kwargs)
+        self.xrt_lenses = [self.xrt_01, self.xrt_02, self.xrt_03]
+        self.tfs_lenses = [self.tfs_02, self.tfs_03, self.tfs_04, self.tfs_05,
+                           self.tfs_06, self.tfs_07, self.tfs_08, self.tfs_09,
+                           self.tfs_10]
+        self._latched = dict.fromkeys(FAULT_FIELDS, False)
+        self._cycles = 0
+
+    async def configure_lenses(self):
+        """Write the static lens properties."""
+        geometry = [(lens, radius, XRT_Z)
+                    for lens, radius in zip(self.xrt_lenses, xrt_lenses_radii)]
+        geometry += [(lens, radius, TFS_Z + index * TFS_SPACING)
+                     for index, (lens, radius)
+                     in enumerate(zip(self.tfs_lenses, tfs_lens_radii))]
+        for lens, radius, z in geometry:
+            await lens.radius.write(radius)
+            await lens.z.write(z)
+
+    def lens_states(self):
+        """
+        Lens states seen by the PLC, in bypass mode or not.
+
+        Returns
+        -------
+        xrt : list of bool
+            Inserted state of each XRT lens.
+        tfs : list of bool
+            Inserted state of each TFS lens.
+        known : bool
+            Every lens state is known.
+        """
+        lenses = self.xrt_lenses + self.tfs_lenses
+        if self.bypass_positions.value:
+            inserted = [bool(lens.bypass_state.value) for lens in lenses]
+            known = all(lens.bypass_known.value for lens in lenses)
+        else:
+            inserted = [lens.inserted for lens in lenses]
+            known = not any(lens.moving for lens in lenses)
+        return inserted[:3], inserted[3:], known
+
+    def evaluate(self):
+        """
+        Evaluate the interlock for the current inputs.
+
+        Returns
+        -------
+        dict
+            Value of each published output, by PV property name.
+        """
+        bypass = bool(self.bypass_set.value)
+        energy = self.bypass_energy.value if bypass else self.beam_energy.value
+        xrt, tfs, known = self.lens_states()
+        # The smallest inserted XRT lens, numbered as in the tables
+        xrt_lens = max((index + 1 for index, inserted in enumerate(xrt)
+                        if inserted), default=0)
+        radii = [radius for radius, inserted in zip(tfs_lens_radii, tfs)
+                 if inserted]
+        tfs_radius = 1.0 / sum(1.0 / radius for radius in radii) if radii else 0.0
+        faults = predict_faults(energy, xrt_lens, tfs_radius, tables=self.tables)
+        outputs = {
+            "bypass": int(bypass),
+            "energy": float(energy),
+            "xrt_radius": xrt_lenses_radii[xrt_lens - 1] if xrt_lens else 0.0,
+            "tfs_radius": float(tfs_radius),
+            "trip_low": float(faults["trip_low"]),
+            "trip_high": float(faults["trip_high"]),
+            "state_fault": int(not known),
+        }
+        for name in FAULT_FIELDS:
+            outputs[name] = int(faults[name])
+        outputs["faulted"] = int(bool(faults["violated"]) or not known)
+        return outputs
+
+    async def publish(self):
+        """Publish the interlock outputs, and increment the update sequence."""
+        outputs = self.evaluate()
+        for name, active in self._latched.items():
+            self._latched[name] = active or bool(outputs[name])
+            outputs[f"{name}_latch"] = int(self._latched[name])
+        for name, value in outputs.items():
+            prop = getattr(self, name)
+            if prop.value != value:
+                await prop.write(value, verify_value=False)
+        for lens in self.xrt_lenses + self.tfs_lenses:
+            known = int(not lens.moving)
+            if lens.known.value != known:
+                await lens.known.write(known, verify_value=False)
+        await self.update_seq.write(self.update_seq.value + 1, verify_value=False)
+
+    async def cycle(self):
+        """Run one PLC cycle."""
+        self._cycles += 1
+        await self.plc_cycles.write(self._cycles, verify_value=False)
+        if self._cycles % self.update_cycles == 0:
+            await self.publish()
+
+    @beam_energy.putter
+    async def beam_energy(self, instance, value):
+        for lens in self.xrt_lenses + self.tfs_lenses:
+            await lens.focus.write(
+                float(focal_length(lens.radius.value, value)), verify_value=False
+            )
+        return value
+
+    @plc_cycles.startup
+    async def plc_cycles(self, instance, async_lib):
+        await self.configure_lenses()
+        await self.beam_energy.write(self.beam_energy.value)
+        while True:
+            await async_lib.library.sleep(self.cycle_time / self.speedup)
+            try:
+                await self.cycle()
+            except Exception:
+                logger.exception("PLC cycle failed")
+
+
+def sim_pvdb(prefix=DEFAULT_PREFIX, translation_prefix=TRANSLATION_PREFIX,
+             **kwargs):
+    """
+    Create the simulated IOC and translation motor.
+
+    Parameters
+    ----------
+    prefix : str, optional
+        PV prefix of the transfocator.
+    translation_prefix : str, optional
+        Record name of the translation motor.
+    **kwargs
+        Passed to :class:`TransfocatorSimIOC`.
+
+    Returns
+    -------
+    ioc : TransfocatorSimIOC
+    translation : SimIMS
+    pvdb : dict
+        The PVs of both, to serve with :func:`caproto.server.run`.
+    """
+    ioc = TransfocatorSimIOC(prefix, **kwargs)
+    translation = SimIMS(translation_prefix, speedup=ioc.speedup)
+    return ioc, translation, {**ioc.pvdb, **translation.pvdb}
+
+
+def main(args=None):
+    """
+    Run a simulated transfocator PLC and IOC
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX, help="PV prefix")
+    parser.add_argument("--translation-prefix", default=TRANSLATION_PREFIX,
+                        help="Record name of the translation motor")
+    parser.add_argument("--speedup", type=float, default=1.0,
+                        help="Run the PLC and lens motion faster by this factor")
+    parser.add_argument("--interfaces", nargs="+", default=["0.0.0.0"],
+                        help="Network interfaces to serve on")
+    parser.add_argument("--list-pvs", action="store_true",
+                        help="Log the PVs served")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+    _, _, pvdb = sim_pvdb(args.prefix, args.translation_prefix,
+                          speedup=args.speedup)
+    logger.info("Serving %d PVs under %s", len(pvdb), args.prefix)
+    run(pvdb, interfaces=args.interfaces, log_pv_names=args.list_pvs,
+        module_name="caproto.asyncio.server")
+
+
+if __name__ == "__main__":
+    main()
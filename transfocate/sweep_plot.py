@@ -0,0 +1,278 @@
+"""
+Plots of checkout sweeps, drawn incrementally as scan points arrive
+
+Each point is classified once when it is added, and appended to one
+pre-created line per category.  While a sweep is running, only those lines
+are redrawn over a saved background (blitting), so the cost of an update
+does not grow with the number of points already plotted.
+"""
+import logging
+import time
+
+import numpy as np
+from bluesky.callbacks import CallbackBase
+
+from .table.info import MIN_ENERGY, SWEEP_ENERGY_RANGE, XRT_LENS_TABLES
+from .table.info import data as spreadsheet_data
+
+logger = logging.getLogger(__name__)
+
+# Plotted series, drawn in this order.  Scatter sizes of the original plots
+# are converted to marker sizes (the square root of the area).
+SERIES = {
+    "trip_high": dict(label="Trip high [PLC]", color="black", marker="v"),
+    "trip_low": dict(label="Trip low [PLC]", color="black", marker="^"),
+    "min_fault": dict(label="Scan point - min energy fault", color="red",
+                      marker="x"),
+    "lens_required_fault": dict(label="Scan point - lens required", color="red",
+                                marker="D"),
+    "table_fault": dict(label="Scan point - table fault", color="red",
+                        marker="+"),
+    "no_fault": dict(label="Scan point - no fault", color="black", marker=".",
+                     markersize=np.sqrt(3)),
+}
+
+# Columns needed to classify scan points
+POINT_FIELDS = [
+    "energy", "tfs_radius", "trip_low", "trip_high", "faulted", "min_fault",
+    "lens_required_fault", "table_fault",
+]
+
+
+def classify_points(points):
+    """
+    Coordinates of scan points in each plotted series.
+
+    Parameters
+    ----------
+    points : dict or pd.DataFrame
+        Arrays of each of :data:`POINT_FIELDS`.
+
+    Returns
+    -------
+    dict
+        ``(energy, value)`` arrays for each series in :data:`SERIES`.
+    """
+    energy = np.asarray(points["energy"], dtype=float)
+    radius = np.asarray(points["tfs_radius"], dtype=float)
+    # For the purposes of plotting in log scale, show tfs_radius = 1 when
+    # zero in actuality
+    radius = np.where(radius == 0.0, 1.0, radius)
+    series = {
+        "trip_high": (energy, np.asarray(points["trip_high"], dtype=float)),
+        "trip_low": (energy, np.asarray(points["trip_low"], dtype=float)),
+    }
+    masks = {
+        name: np.asarray(points[name]) == 1
+        for name in ("min_fault", "lens_required_fault", "table_fault")
+    }
+    masks["no_fault"] = np.asarray(points["faulted"]) == 0
+    for name, mask in masks.items():
+        series[name] = (energy[mask], radius[mask])
+    return series
+
+
+def plot_spreadsheet_data(xrt_lens, ax, df=None):
+    """Plot the disallowed regions of the spreadsheet for an XRT lens."""
+    if df is None:
+        df = spreadsheet_data[XRT_LENS_TABLES[xrt_lens]]
+    ax.fill_between(
+        df.energy,
+        df.trip_min,
+        df.trip_max,
+        where=(df.trip_max > df.trip_min),
+        interpolate=True,
+        color="red",
+        alpha=0.2,
+        hatch="/",
+    )
+
+    ax.plot(df.energy, df.trip_min, lw=1, color="black", label="")
+    ax.plot(df.energy, df.trip_max, lw=1, color="black", label="")
+
+    min_energy = MIN_ENERGY[xrt_lens]
+    if min_energy > 0.0:
+        ax.fill(
+            (0, 0, min_energy, min_energy),
+            (0, 1e4, 1e4, 0),
+            color="red",
+            edgecolor="None",
+            alpha=0.2,
+            hatch="\\",
+        )
+
+    ax.set_yscale("log")
+    ax.set_ylabel("Reff [um]")
+    ax.set_xlabel("Energy [eV]")
+    return df
+
+
+class SweepPlot:
+    """
+    Plot of the scan points of a sweep over the spreadsheet regions.
+
+    Parameters
+    ----------
+    xrt_lens : int
+        XRT lens index, with 0 meaning no pre-focusing lens.
+    ax : matplotlib.axes.Axes
+        The axes to draw on.
+    blit : bool, optional
+        Redraw only the scan points in :meth:`update` while points are being
+        added, if supported by the canvas.
+    capacity : int, optional
+        Initial number of points allocated per series.
+    """
+
+    def __init__(self, xrt_lens, ax, blit=True, capacity=1024):
+        self.xrt_lens = xrt_lens
+        self.ax = ax
+        self.xrt_radius = None
+        plot_spreadsheet_data(xrt_lens, ax=ax)
+        ax.set_xlim(*SWEEP_ENERGY_RANGE)
+        ax.set_ylim(1, 1e4)
+
+        self.blit = blit and getattr(ax.figure.canvas, "supports_blit", False)
+        self._buffers = {name: np.empty((2, capacity)) for name in SERIES}
+        self._counts = dict.fromkeys(SERIES, 0)
+        self.lines = {
+            name: ax.plot([], [], linestyle="", animated=self.blit, **kwargs)[0]
+            for name, kwargs in SERIES.items()
+        }
+        ax.legend(loc="upper right")
+        self._background = None
+        self._draw_cid = None
+        if self.blit:
+            self._draw_cid = ax.figure.canvas.mpl_connect(
+                "draw_event", self._on_draw
+            )
+
+    def __len__(self):
+        return max(self._counts["trip_high"], self._counts["trip_low"])
+
+    def _on_draw(self, event):
+        canvas = self.ax.figure.canvas
+        self._background = canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for line in self.lines.values():
+            self.ax.draw_artist(line)
+
+    def set_xrt_radius(self, xrt_radius):
+        """Title the plot with the radius of the XRT lens."""
+        self.xrt_radius = xrt_radius
+        if xrt_radius == 0.0:
+            self.ax.set_title("No pre-focusing lens")
+        else:
+            self.ax.set_title(
+                f"Pre-focusing radius = {xrt_radius:.2f}um (Lens #{self.xrt_lens})"
+            )
+        # The title is outside of the blitted region
+        self._background = None
+
+    def add(self, points):
+        """
+        Add scan points, without redrawing.
+
+        Parameters
+        ----------
+        points : dict or pd.DataFrame
+            Arrays of each of :data:`POINT_FIELDS`, and optionally
+            ``xrt_radius``.
+        """
+        if self.xrt_radius is None and "xrt_radius" in points:
+            xrt_radius = np.atleast_1d(points["xrt_radius"])
+            if len(xrt_radius):
+                self.set_xrt_radius(float(xrt_radius[0]))
+
+        for name, (x, y) in classify_points(points).items():
+            count = self._counts[name]
+            buffer = self._buffers[name]
+            if count + len(x) > buffer.shape[1]:
+                size = max(2 * buffer.shape[1], count + len(x))
+                grown = np.empty((2, size))
+                grown[:, :count] = buffer[:, :count]
+                self._buffers[name] = buffer = grown
+            buffer[0, count:count + len(x)] = x
+            buffer[1, count:count + len(x)] = y
+            count += len(x)
+            self._counts[name] = count
+            self.lines[name].set_data(buffer[0, :count], buffer[1, :count])
+
+    def update(self):
+        """Redraw the scan points."""
+        canvas = self.ax.figure.canvas
+        if self.blit and self._background is not None:
+            canvas.restore_region(self._background)
+            self._draw_lines()
+            canvas.blit(self.ax.bbox)
+            canvas.flush_events()
+        else:
+            canvas.draw_idle()
+
+    def finish(self):
+        """Stop blitting, leaving a figure ready to be saved."""
+        if self._draw_cid is not None:
+            self.ax.figure.canvas.mpl_disconnect(self._draw_cid)
+            self._draw_cid = None
+        for line in self.lines.values():
+            line.set_animated(False)
+        self.blit = False
+        self._background = None
+        self.ax.figure.canvas.draw_idle()
+
+
+class LiveSweepPlot(CallbackBase):
+    """
+    Bluesky callback plotting the points of a checkout sweep as they arrive.
+
+    Parameters
+    ----------
+    xrt_lens : int
+        XRT lens index of the sweep.
+    ax : matplotlib.axes.Axes, optional
+        The axes to draw on.  A new figure is created by default.
+    initial : pd.DataFrame, optional
+        Scan points read previously, e.g. when resuming a sweep.
+    min_interval : float, optional
+        Minimum time between redraws [s].
+    """
+
+    def __init__(self, xrt_lens, ax=None, initial=None, min_interval=0.1):
+        super().__init__()
+        self.xrt_lens = xrt_lens
+        self.ax = ax
+        self.initial = initial
+        self.min_interval = min_interval
+        self.plot = None
+        self._last_update = 0.0
+
+    def start(self, doc):
+        if self.ax is None:
+            import matplotlib.pyplot as plt
+            _, self.ax = plt.subplots(constrained_layout=True, figsize=(12, 10))
+        self.plot = SweepPlot(self.xrt_lens, self.ax)
+        if self.initial is not None and len(self.initial):
+            self.plot.add(self.initial)
+        self.ax.figure.canvas.draw()
+
+    def event(self, doc):
+        data = doc["data"]
+        missing = [name for name in POINT_FIELDS if name not in data]
+        if missing:
+            logger.debug("Event %s is missing %s", doc["seq_num"], missing)
+            return
+        point = {name: [data[name]] for name in POINT_FIELDS}
+        if "xrt_radius" in data:
+            point["xrt_radius"] = [data["xrt_radius"]]
+        self.plot.add(point)
+
+        now = time.monotonic()
+        if now - self._last_update >= self.min_interval:
+            self._last_update = now
+            self.plot.update()
+
+    def stop(self, doc):
+        if self.plot is not None:
+            self.plot.finish()
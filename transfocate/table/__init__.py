@@ -1,12 +1,26 @@
-from .info import data, read_spreadsheet
+from .faults import predict_faults, sweep_faults
+from .info import data, load_spreadsheet, read_spreadsheet
+from .interpolate import LimitTables, find_limits
+from .intervals import AllowedEnergyIndex, allowed_intervals, limit_crossings
 from .ioc import generate_header as create_ioc_header
 from .plc_table import generate_source as create_plc_code
+from .reconcile import reconcile, reconciliation_summary
 from .report import generate_report
 
 __all__ = [
     "generate_report",
     "data",
     "read_spreadsheet",
+    "load_spreadsheet",
     "create_ioc_header",
     "create_plc_code",
+    "find_limits",
+    "LimitTables",
+    "predict_faults",
+    "sweep_faults",
+    "AllowedEnergyIndex",
+    "allowed_intervals",
+    "limit_crossings",
+    "reconcile",
+    "reconciliation_summary",
 ]
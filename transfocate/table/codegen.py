@@ -0,0 +1,218 @@
+"""
+Generate the IOC header and PLC source code from the spreadsheet tables
+
+Both outputs are generated in one pass from the same formatted table
+columns.  A stamp file next to the outputs records the content hash of the
+tables and code templates they were generated from, so that running the
+generator again with unchanged inputs does nothing.
+
+Usage::
+
+    python -m transfocate.table.codegen --header mfx_range_table.h \\
+        --plc FB_EnergyTables.TcPOU
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pathlib
+
+import numpy as np
+
+from .info import COLUMNS, load_spreadsheet
+
+logger = logging.getLogger(__name__)
+
+# Name of the file recording the inputs of the generated code
+STAMP_NAME = ".transfocate-codegen.json"
+
+
+def format_columns(df, precision=6):
+    """
+    Format the columns of a table as fixed precision strings, vectorized.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Table with ``energy``, ``trip_min`` and ``trip_max`` columns.
+    precision : int, optional
+        Number of decimal places.
+
+    Returns
+    -------
+    dict
+        Array of strings for each column.
+    """
+    return {
+        column: np.char.mod(f"%.{precision}f", df[column].to_numpy(dtype=float))
+        for column in COLUMNS
+    }
+
+
+def format_tables(tables, precision=6):
+    """Format the columns of each table, see :func:`format_columns`."""
+    return {name: format_columns(df, precision) for name, df in tables.items()}
+
+
+def tables_hash(tables, uniform=False):
+    """
+    Content hash of the tables and the code templates.
+
+    Parameters
+    ----------
+    tables : dict
+        Table for each region name.
+    uniform : bool, optional
+        Include the uniform lookup templates, see :func:`generate`.
+
+    Returns
+    -------
+    str
+        SHA-256 hex digest.
+    """
+    from . import ioc, plc_table
+
+    templates = [ioc.HEADER, ioc.FOOTER, ioc.TABLE_FORMAT,
+                 plc_table.CODE_FORMAT, plc_table.DECLARATION_FORMAT,
+                 plc_table.TABLE_FORMAT]
+    if uniform:
+        templates += [ioc.UNIFORM_HEADER, ioc.UNIFORM_TABLE_FORMAT,
+                      plc_table.BUCKETS_DECLARATION_FORMAT,
+                      plc_table.METHOD_FORMAT, plc_table.CASE_FORMAT]
+    digest = hashlib.sha256()
+    for template in templates:
+        digest.update(template.encode())
+    for name, df in tables.items():
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(df[COLUMNS].to_numpy(dtype=float)))
+    return digest.hexdigest()
+
+
+def _write(path, text):
+    """Write a file atomically."""
+    path = pathlib.Path(path)
+    staging = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    staging.write_text(text)
+    os.replace(staging, path)
+
+
+def _read_stamp(path):
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def generate(header=None, plc=None, tables=None, force=False, uniform=False):
+    """
+    Generate the IOC header and/or PLC source code, if out of date.
+
+    Parameters
+    ----------
+    header : str or pathlib.Path, optional
+        Path of the C header to write.
+    plc : str or pathlib.Path, optional
+        Path of the TwinCAT POU to write.
+    tables : dict, optional
+        Table for each region name.  Defaults to the spreadsheet tables.
+    force : bool, optional
+        Regenerate even if the inputs are unchanged.
+    uniform : bool, optional
+        Include constant time lookups on a uniform energy grid, see
+        :mod:`transfocate.table.uniform`.
+
+    Returns
+    -------
+    dict
+        For each output path, True if it was written or False if it was
+        up to date.
+    """
+    from . import ioc, plc_table
+
+    if tables is None:
+        tables = load_spreadsheet()
+    outputs = {
+        path: generator
+        for path, generator in ((header, ioc.generate_header),
+                                (plc, plc_table.generate_source))
+        if path is not None
+    }
+    content_hash = tables_hash(tables, uniform=uniform)
+
+    written = {}
+    formatted = None
+    for path, generator in outputs.items():
+        path = pathlib.Path(path)
+        stamp_path = path.parent / STAMP_NAME
+        stamp = _read_stamp(stamp_path)
+        if (not force and path.exists()
+                and stamp.get(path.name) == content_hash):
+            logger.info("%s is up to date", path)
+            written[str(path)] = False
+            continue
+
+        if formatted is None:
+            formatted = format_tables(tables)
+        _write(path, generator(tables=tables, formatted=formatted,
+                               uniform=uniform))
+        stamp[path.name] = content_hash
+        _write(stamp_path, json.dumps(stamp, indent=2, sort_keys=True))
+        logger.info("Wrote %s", path)
+        written[str(path)] = True
+    return written
+
+
+def plot_regions(filename, tables=None):
+    """Plot the disallowed regions of every table to a file."""
+    import matplotlib  # noqa
+    matplotlib.use("Agg")  # noqa
+    import matplotlib.pyplot as plt  # noqa
+
+    from .ioc import plot_data
+
+    if tables is None:
+        tables = load_spreadsheet()
+    fig, axes = plt.subplots(
+        ncols=2, nrows=2, constrained_layout=True, dpi=120, figsize=(11, 8)
+    )
+    for ax, key in zip(axes.flat, tables):
+        plot_data(ax, key, tables)
+    fig.suptitle("Disallowed Effective Radius Regions")
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def main(args=None):
+    """
+    Generate the IOC header and PLC source code from the spreadsheet
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--spreadsheet", default=None,
+                        help="Spreadsheet to read, instead of the default")
+    parser.add_argument("--header", default=None,
+                        help="Path of the IOC C header to write")
+    parser.add_argument("--plc", default=None,
+                        help="Path of the PLC FB_EnergyTables POU to write")
+    parser.add_argument("--force", action="store_true",
+                        help="Regenerate even if the tables are unchanged")
+    parser.add_argument("--uniform", action="store_true",
+                        help="Include constant time uniform grid lookups")
+    parser.add_argument("--plot", default=None, metavar="PNG",
+                        help="Also plot the disallowed regions to this file")
+    args = parser.parse_args(args)
+    if args.header is None and args.plc is None and args.plot is None:
+        parser.error("Nothing to do: give --header, --plc and/or --plot")
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    tables = load_spreadsheet(args.spreadsheet)
+    written = generate(header=args.header, plc=args.plc, tables=tables,
+                       force=args.force, uniform=args.uniform)
+    if args.plot is not None:
+        plot_regions(args.plot, tables)
+    return written
+
+
+if __name__ == "__main__":
+    main()
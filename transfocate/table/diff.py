@@ -0,0 +1,323 @@
+"""
+Differences between two revisions of the spreadsheet tables
+
+When the interlock spreadsheet is revised, only the energies at which the
+interpolated trip limits changed need to be checked out again, and only the
+tables whose rows changed need to be updated in the IOC and PLC code.
+
+Usage::
+
+    python -m transfocate.table.diff old.xlsx new.xlsx --output-dir changes
+"""
+import argparse
+import json
+import logging
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from .codegen import format_columns
+from .info import SWEEP_ENERGY_RANGE, XRT_LENS_TABLES, load_spreadsheet
+from .ioc import table_code
+from .plc_table import DECLARATION_FORMAT, row_assignments
+
+logger = logging.getLogger(__name__)
+
+LIMIT_COLUMNS = ["trip_min", "trip_max"]
+
+# Region name of each XRT lens table
+TABLE_XRT_LENS = {name: xrt_lens for xrt_lens, name in XRT_LENS_TABLES.items()}
+
+
+def _merge(ranges):
+    """Merge overlapping or touching ``(low, high)`` ranges."""
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(high, merged[-1][1]))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def changed_ranges(old, new, rtol=1e-6, atol=1e-6):
+    """
+    Energy ranges in which the interpolated limits of a table changed.
+
+    Both tables are interpolated as by the interlock, using the first or
+    last row outside of the table.  The difference of two piecewise linear
+    functions is largest at their knots, so the tables are compared at the
+    rows of both, and a change at a row affects the energies up to the
+    neighbouring rows.
+
+    Parameters
+    ----------
+    old, new : pd.DataFrame
+        The two revisions of the table.
+    rtol, atol : float, optional
+        Relative and absolute [um] tolerance on the limits.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per changed ``(energy_low, energy_high)`` range [eV], with
+        the largest change of each limit [um] in it.
+    """
+    energy = np.union1d(old.energy.to_numpy(dtype=float),
+                        new.energy.to_numpy(dtype=float))
+    changed = np.zeros(len(energy), dtype=bool)
+    delta = {}
+    for column in LIMIT_COLUMNS:
+        before = np.interp(energy, old.energy, old[column])
+        after = np.interp(energy, new.energy, new[column])
+        delta[column] = np.abs(after - before)
+        changed |= ~np.isclose(after, before, rtol=rtol, atol=atol)
+
+    rows = []
+    where = np.flatnonzero(changed)
+    # Runs of changed knots, each extending to the neighbouring knots
+    runs = np.split(where, np.flatnonzero(np.diff(where) > 1) + 1) if len(where) else []
+    for run in runs:
+        first = max(run[0] - 1, 0)
+        last = min(run[-1] + 1, len(energy) - 1)
+        low, high = energy[first], energy[last]
+        # Changes at the ends of the tables extend beyond them
+        if run[0] == 0:
+            low = 0.0
+        if run[-1] == len(energy) - 1:
+            high = np.inf
+        row = {"energy_low": float(low), "energy_high": float(high)}
+        for column in LIMIT_COLUMNS:
+            row[f"{column}_change"] = float(delta[column][first:last + 1].max())
+        rows.append(row)
+    return pd.DataFrame(
+        rows,
+        columns=["energy_low", "energy_high"]
+        + [f"{column}_change" for column in LIMIT_COLUMNS],
+    )
+
+
+def diff_tables(old, new, rtol=1e-6, atol=1e-6):
+    """
+    Changed energy ranges of every region, see :func:`changed_ranges`.
+
+    Regions only in one of the revisions change over all energies.
+
+    Parameters
+    ----------
+    old, new : dict
+        Table for each region name of the two revisions.
+    rtol, atol : float, optional
+        Relative and absolute [um] tolerance on the limits.
+
+    Returns
+    -------
+    pd.DataFrame
+        The changed ranges with their ``region`` and ``xrt_lens``.
+    """
+    frames = []
+    for name in list(old) + [name for name in new if name not in old]:
+        if name in old and name in new:
+            ranges = changed_ranges(old[name], new[name], rtol=rtol, atol=atol)
+        else:
+            ranges = pd.DataFrame(
+                [{"energy_low": 0.0, "energy_high": np.inf,
+                  "trip_min_change": np.nan, "trip_max_change": np.nan}]
+            )
+        ranges.insert(0, "region", name)
+        ranges.insert(1, "xrt_lens", TABLE_XRT_LENS.get(name, -1))
+        frames.append(ranges)
+    return pd.concat(frames, ignore_index=True)
+
+
+def sweep_ranges(diff, margin=200.0, energy_range=SWEEP_ENERGY_RANGE):
+    """
+    Energy ranges to check out again for each XRT lens.
+
+    Parameters
+    ----------
+    diff : pd.DataFrame
+        Result of :func:`diff_tables`.
+    margin : float, optional
+        Extent of the sweeps beyond the changed ranges [eV].
+    energy_range : tuple of float, optional
+        Range of the full checkout sweep [eV].
+
+    Returns
+    -------
+    dict
+        Merged ``(low, high)`` ranges for each XRT lens with changes, to
+        pass as the ``energy_ranges`` of
+        :func:`~transfocate.checkout.sweep_energy_plan`.
+    """
+    low, high = energy_range
+    result = {}
+    for xrt_lens, group in diff[diff.xrt_lens >= 0].groupby("xrt_lens"):
+        ranges = [
+            (max(start - margin, low), min(stop + margin, high))
+            for start, stop in zip(group.energy_low, group.energy_high)
+        ]
+        ranges = _merge([(start, stop) for start, stop in ranges if start < stop])
+        if ranges:
+            result[int(xrt_lens)] = ranges
+    return result
+
+
+def load_sweep_ranges(path):
+    """
+    Read the sweep ranges written by :func:`write_updates`.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The ``sweep_ranges.json`` file, or the directory containing it.
+
+    Returns
+    -------
+    dict
+        ``(low, high)`` ranges for each XRT lens, as from
+        :func:`sweep_ranges`.
+    """
+    path = pathlib.Path(path)
+    if path.is_dir():
+        path = path / "sweep_ranges.json"
+    with open(path) as fp:
+        # JSON object keys are always strings
+        return {int(lens): [tuple(bounds) for bounds in ranges]
+                for lens, ranges in json.load(fp).items()}
+
+
+def changed_rows(old, new):
+    """
+    Rows of a table which differ in the generated code.
+
+    Parameters
+    ----------
+    old, new : pd.DataFrame
+        The two revisions of the table.
+
+    Returns
+    -------
+    np.ndarray or None
+        Indices of the rows with any formatted value changed, or None if the
+        number of rows changed.
+    """
+    if len(old) != len(new):
+        return None
+    before = format_columns(old)
+    after = format_columns(new)
+    changed = np.zeros(len(new), dtype=bool)
+    for column, values in after.items():
+        changed |= values != before[column]
+    return np.flatnonzero(changed)
+
+
+def code_updates(old, new):
+    """
+    Sections of the generated code to update for a revision of the tables.
+
+    Parameters
+    ----------
+    old, new : dict
+        Table for each region name of the two revisions.
+
+    Returns
+    -------
+    dict
+        For each region with changed rows, the ``rows`` changed (None for a
+        changed number of rows), its ``header`` table code and the ``plc``
+        statements of the changed rows, preceded by its declaration if the
+        number of rows changed.
+    """
+    updates = {}
+    for name, df in new.items():
+        rows = changed_rows(old[name], df) if name in old else None
+        if rows is not None and not len(rows):
+            continue
+        columns = format_columns(df)
+        table_name = f"st{name}"
+        plc = row_assignments(table_name, columns, rows)
+        if rows is None:
+            plc.insert(0, DECLARATION_FORMAT.format(table_name=table_name,
+                                                    row_count=len(df) - 1))
+        updates[name] = {
+            "rows": None if rows is None else rows.tolist(),
+            "header": table_code(name, columns),
+            "plc": "\n".join(plc),
+        }
+    return updates
+
+
+def write_updates(directory, diff, updates, margin=200.0):
+    """
+    Write the sweep ranges and code sections to update to a directory.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        Output directory, created if needed.
+    diff : pd.DataFrame
+        Result of :func:`diff_tables`.
+    updates : dict
+        Result of :func:`code_updates`.
+    margin : float, optional
+        See :func:`sweep_ranges`.  The ranges are read back with
+        :func:`load_sweep_ranges`.
+
+    Returns
+    -------
+    list of pathlib.Path
+        The files written.
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    written = [directory / "changed_ranges.csv", directory / "sweep_ranges.json"]
+    diff.to_csv(written[0], index=False)
+    with open(written[1], "w") as fp:
+        json.dump({str(lens): ranges
+                   for lens, ranges in sweep_ranges(diff, margin).items()},
+                  fp, indent=2)
+    for name, update in updates.items():
+        for key, suffix in (("header", "h"), ("plc", "st")):
+            path = directory / f"{name}.{suffix}"
+            path.write_text(update[key])
+            written.append(path)
+    return written
+
+
+def main(args=None):
+    """
+    Compare two revisions of the interlock spreadsheet
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("old", help="Previous spreadsheet")
+    parser.add_argument("new", help="Revised spreadsheet")
+    parser.add_argument("--margin", type=float, default=200.0,
+                        help="Extent of the sweeps beyond changed ranges [eV]")
+    parser.add_argument("--output-dir", default=None,
+                        help="Write the sweep ranges and code sections here")
+    args = parser.parse_args(args)
+
+    old = load_spreadsheet(args.old)
+    new = load_spreadsheet(args.new)
+    diff = diff_tables(old, new)
+    updates = code_updates(old, new)
+    if diff.empty:
+        print("The tables are unchanged")
+    else:
+        print(diff.to_string(index=False))
+        for xrt_lens, ranges in sweep_ranges(diff, args.margin).items():
+            text = ", ".join(f"{low:.1f}-{high:.1f}" for low, high in ranges)
+            print(f"Sweep XRT lens {xrt_lens}: {text} eV")
+        for name, update in updates.items():
+            rows = "all" if update["rows"] is None else len(update["rows"])
+            print(f"Regenerate {name}: {rows} rows changed")
+    if args.output_dir is not None:
+        for path in write_updates(args.output_dir, diff, updates, args.margin):
+            logger.info("Wrote %s", path)
+    return diff
+
+
+if __name__ == "__main__":
+    main()
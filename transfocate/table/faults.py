@@ -0,0 +1,125 @@
+"""Offline model of the interlock faults reported by the PLC."""
+import numpy as np
+import pandas as pd
+
+from ..combinations import effective_radius
+from .info import (MIN_ENERGY, REQUIRES_LENS_RANGE, XRT_LENS_TABLES,
+                   tfs_lens_radii)
+from .interpolate import find_limits
+
+FAULT_FIELDS = ["min_fault", "lens_required_fault", "table_fault", "violated"]
+
+
+def _per_lens(values, xrt_lens):
+    """Look up a per-XRT-lens setting for an array of lens indices."""
+    lookup = np.array([values[lens] for lens in sorted(XRT_LENS_TABLES)])
+    return lookup[xrt_lens]
+
+
+def predict_faults(energy, xrt_lens, tfs_radius, tables=None):
+    """
+    Predict the interlock faults for arrays of lens states and energies.
+
+    The model follows the PLC logic:
+
+    * ``min_fault``: the energy is below :data:`MIN_ENERGY` for the XRT lens.
+    * ``lens_required_fault``: the energy is in :data:`REQUIRES_LENS_RANGE`
+      for the XRT lens, but no transfocator lens is inserted.
+    * ``table_fault``: the transfocator effective radius is strictly between
+      the interpolated trip limits of the table for the XRT lens.
+    * ``violated``: any of the above.
+
+    Parameters
+    ----------
+    energy : float or array_like
+        Photon energy [eV].
+    xrt_lens : int or array_like
+        XRT lens index, with 0 meaning no pre-focusing lens.
+    tfs_radius : float or array_like
+        Transfocator effective radius [um], 0 when no lens is inserted.
+    tables : LimitTables, optional
+        The trip limit tables.  Defaults to the spreadsheet tables.
+
+    Returns
+    -------
+    dict
+        Arrays of ``trip_low``, ``trip_high``, ``min_fault``,
+        ``lens_required_fault``, ``table_fault`` and ``violated``, broadcast
+        over the inputs.
+    """
+    energy, xrt_lens, tfs_radius = np.broadcast_arrays(
+        np.asarray(energy, dtype=float),
+        np.asarray(xrt_lens, dtype=np.int64),
+        np.asarray(tfs_radius, dtype=float),
+    )
+    trip_low, trip_high = find_limits(energy, xrt_lens, tables=tables)
+
+    min_fault = energy < _per_lens(MIN_ENERGY, xrt_lens)
+
+    ranges = {
+        lens: (np.nan, np.nan) if range_ is None else range_
+        for lens, range_ in REQUIRES_LENS_RANGE.items()
+    }
+    range_low = _per_lens({lens: low for lens, (low, _) in ranges.items()}, xrt_lens)
+    range_high = _per_lens({lens: high for lens, (_, high) in ranges.items()}, xrt_lens)
+    lens_required_fault = (
+        (energy >= range_low) & (energy <= range_high) & (tfs_radius == 0.0)
+    )
+
+    table_fault = (tfs_radius > trip_low) & (tfs_radius < trip_high)
+    return {
+        "trip_low": trip_low,
+        "trip_high": trip_high,
+        "min_fault": min_fault,
+        "lens_required_fault": lens_required_fault,
+        "table_fault": table_fault,
+        "violated": min_fault | lens_required_fault | table_fault,
+    }
+
+
+def sweep_faults(energies, xrt_lenses=None, tfs_radii=None, tables=None):
+    """
+    Predict the faults over the full state space.
+
+    Parameters
+    ----------
+    energies : array_like
+        Photon energies [eV].
+    xrt_lenses : list of int, optional
+        XRT lens indices.  Defaults to all of them.
+    tfs_radii : array_like, optional
+        Transfocator effective radii [um].  Defaults to the unique effective
+        radii of every subset of :data:`tfs_lens_radii`.
+    tables : LimitTables, optional
+        The trip limit tables.  Defaults to the spreadsheet tables.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per (energy, XRT lens, effective radius) with the predicted
+        limits and faults.
+    """
+    if xrt_lenses is None:
+        xrt_lenses = sorted(XRT_LENS_TABLES)
+    if tfs_radii is None:
+        masks = np.arange(2 ** len(tfs_lens_radii))
+        tfs_radii = np.unique(effective_radius(tfs_lens_radii, masks))
+
+    energy, xrt_lens, tfs_radius = (
+        grid.ravel()
+        for grid in np.meshgrid(
+            np.asarray(energies, dtype=float),
+            np.asarray(xrt_lenses),
+            np.asarray(tfs_radii, dtype=float),
+            indexing="ij",
+        )
+    )
+    predicted = predict_faults(energy, xrt_lens, tfs_radius, tables=tables)
+    return pd.DataFrame(
+        {
+            "energy": energy,
+            "xrt_lens": xrt_lens,
+            "tfs_radius": tfs_radius,
+            **predicted,
+        }
+    )
@@ -0,0 +1,366 @@
+"""
+Check and benchmark the generated IOC header with a C compiler
+
+The header from :func:`~transfocate.table.ioc.generate_header` is compiled
+with a small driver, which looks up a dense grid of energies in every table
+with ``find_limits`` and ``find_limits_uniform``.  The results are compared
+with :func:`numpy.interp` of the tables as written to the header, and the
+driver times the lookups.
+
+The header only declares ``find_limits``; it is implemented by the IOC.  A
+reference implementation of the documented behavior is used unless the
+source of the IOC implementation is given.
+
+Usage::
+
+    python -m transfocate.table.harness [--source find_limits.c]
+"""
+import argparse
+import logging
+import os
+import pathlib
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .codegen import format_tables
+from .info import load_spreadsheet
+from .ioc import generate_header
+
+logger = logging.getLogger(__name__)
+
+HEADER_NAME = "mfx_range_table.h"
+
+# Lookup functions of the driver, in order
+FUNCTIONS = ["find_limits", "find_limits_uniform"]
+
+REFERENCE_SOURCE = """
+bool find_limits(RangeRow *result, const RangeTable *table, double find_energy)
+{
+    if (!result || !table || table->num_rows < 2 ||
+            find_energy != find_energy) {
+        return false;
+    }
+    const RangeRow *rows = table->rows;
+    const int last = table->num_rows - 1;
+    if (find_energy <= rows[0].energy) {
+        *result = rows[0];
+        return true;
+    }
+    if (find_energy >= rows[last].energy) {
+        *result = rows[last];
+        return true;
+    }
+
+    /* Last row at or below the energy */
+    int low_row = 0, high_row = last;
+    while (high_row - low_row > 1) {
+        int middle = (low_row + high_row) / 2;
+        if (rows[middle].energy <= find_energy) {
+            low_row = middle;
+        } else {
+            high_row = middle;
+        }
+    }
+
+    const RangeRow *low = &rows[low_row];
+    const RangeRow *high = &rows[low_row + 1];
+    const double offset = find_energy - low->energy;
+    const double width = high->energy - low->energy;
+    result->low = (high->low - low->low) / width * offset + low->low;
+    result->high = (high->high - low->high) / width * offset + low->high;
+    result->energy = (offset < width / 2) ? low->energy : high->energy;
+    return true;
+}
+"""
+
+DRIVER_FORMAT = """
+#define _POSIX_C_SOURCE 199309L
+#include <math.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#include "{header}"
+
+{reference}
+
+static const RangeTable *TABLES[] = {{ {tables} }};
+static const UniformRangeTable *UNIFORM[] = {{ {uniform} }};
+#define NUM_TABLES {count}
+
+static bool lookup(int function, int table, RangeRow *row, double energy)
+{{
+    if (function == 0) {{
+        return find_limits(row, TABLES[table], energy);
+    }}
+    return find_limits_uniform(row, UNIFORM[table], energy);
+}}
+
+static double now(void)
+{{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + 1e-9 * ts.tv_nsec;
+}}
+
+/* Usage: driver energies.bin results.bin repeats */
+int main(int argc, char **argv)
+{{
+    if (argc != 4) {{
+        fprintf(stderr, "Usage: %s energies results repeats\\n", argv[0]);
+        return 2;
+    }}
+    FILE *fp = fopen(argv[1], "rb");
+    if (!fp) {{
+        perror(argv[1]);
+        return 1;
+    }}
+    fseek(fp, 0, SEEK_END);
+    long count = ftell(fp) / sizeof(double);
+    rewind(fp);
+    double *energies = malloc(count * sizeof(double));
+    if (fread(energies, sizeof(double), count, fp) != (size_t)count) {{
+        perror(argv[1]);
+        return 1;
+    }}
+    fclose(fp);
+
+    FILE *out = fopen(argv[2], "wb");
+    if (!out) {{
+        perror(argv[2]);
+        return 1;
+    }}
+    const int repeats = atoi(argv[3]);
+    for (int table = 0; table < NUM_TABLES; table++) {{
+        for (int function = 0; function < 2; function++) {{
+            RangeRow row;
+            for (long i = 0; i < count; i++) {{
+                if (!lookup(function, table, &row, energies[i])) {{
+                    row.energy = row.low = row.high = NAN;
+                }}
+                fwrite(&row, sizeof(row), 1, out);
+            }}
+
+            volatile double sink = 0.0;
+            const double start = now();
+            for (int repeat = 0; repeat < repeats; repeat++) {{
+                for (long i = 0; i < count; i++) {{
+                    lookup(function, table, &row, energies[i]);
+                    sink += row.low;
+                }}
+            }}
+            const double elapsed = now() - start;
+            printf("%s %d %.9g\\n", TABLES[table]->table_name, function,
+                   elapsed > 0.0 ? repeats * count / elapsed : INFINITY);
+        }}
+    }}
+    fclose(out);
+    free(energies);
+    return 0;
+}}
+"""
+
+
+def find_compiler():
+    """The C compiler to use: ``$CC``, or ``cc`` or ``gcc`` if installed."""
+    for candidate in (os.environ.get("CC"), "cc", "gcc"):
+        if candidate and shutil.which(candidate):
+            return candidate
+    return None
+
+
+def dense_energies(tables, step=1.0, margin=1000.0):
+    """
+    Energies checked by default: a regular grid over all of the tables,
+    extending beyond them, and every row and midpoint between rows.
+
+    Parameters
+    ----------
+    tables : dict
+        Table for each region name.
+    step : float, optional
+        Grid spacing [eV].
+    margin : float, optional
+        Extent of the grid beyond the tables [eV].
+
+    Returns
+    -------
+    np.ndarray
+    """
+    knots = np.concatenate([df.energy.to_numpy(dtype=float)
+                            for df in tables.values()])
+    grid = np.arange(max(knots.min() - margin, 0.0), knots.max() + margin, step)
+    midpoints = np.concatenate([
+        (df.energy.to_numpy()[:-1] + df.energy.to_numpy()[1:]) / 2
+        for df in tables.values()
+    ])
+    return np.unique(np.concatenate([grid, knots, midpoints]))
+
+
+def build_driver(directory, tables=None, source=None, compiler=None,
+                 flags=("-O2", "-std=c99")):
+    """
+    Write the header and driver to a directory and compile them.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        Where to write the sources and executable.
+    tables : dict, optional
+        Table for each region name.  Defaults to the spreadsheet tables.
+    source : str or pathlib.Path, optional
+        C source of ``find_limits``, instead of the reference
+        implementation.
+    compiler : str, optional
+        The C compiler.  Defaults to :func:`find_compiler`.
+    flags : sequence of str, optional
+        Compiler flags.
+
+    Returns
+    -------
+    pathlib.Path
+        The driver executable.
+    """
+    if tables is None:
+        tables = load_spreadsheet()
+    compiler = compiler or find_compiler()
+    if compiler is None:
+        raise RuntimeError("No C compiler found; set the CC environment variable")
+
+    directory = pathlib.Path(directory)
+    (directory / HEADER_NAME).write_text(generate_header(tables, uniform=True))
+    reference = REFERENCE_SOURCE
+    if source is not None:
+        reference = pathlib.Path(source).read_text()
+    driver = DRIVER_FORMAT.format(
+        header=HEADER_NAME,
+        reference=reference,
+        tables=", ".join(f"&TABLE_{name}" for name in tables),
+        uniform=", ".join(f"&UNIFORM_{name}" for name in tables),
+        count=len(tables),
+    )
+    driver_source = directory / "driver.c"
+    driver_source.write_text(driver)
+    executable = directory / "driver"
+    command = [compiler, *flags, "-o", str(executable), str(driver_source), "-lm"]
+    logger.debug("Compiling: %s", " ".join(command))
+    subprocess.run(command, check=True, capture_output=True, text=True,
+                   cwd=directory)
+    return executable
+
+
+def check_header(tables=None, energies=None, source=None, repeats=10,
+                 rtol=1e-12, compiler=None):
+    """
+    Compare the lookups of the compiled header with the Python
+    interpolation, and time them.
+
+    Expected values are interpolated from the tables as written to the
+    header, i.e. rounded to its precision, with the first or last row used
+    outside of a table.
+
+    Parameters
+    ----------
+    tables : dict, optional
+        Table for each region name.  Defaults to the spreadsheet tables.
+    energies : array_like, optional
+        Energies to look up [eV].  Defaults to :func:`dense_energies`.
+    source : str or pathlib.Path, optional
+        C source of ``find_limits``, instead of the reference
+        implementation.
+    repeats : int, optional
+        Number of times the energies are looked up for the timing.
+    rtol : float, optional
+        Relative tolerance of the comparison.
+    compiler : str, optional
+        The C compiler.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per table and lookup function, with the number of
+        ``lookups``, the ``max_error`` and ``max_relative_error`` of the
+        limits, the number of ``mismatches`` outside of the tolerance and the
+        ``lookups_per_second``.
+    """
+    if tables is None:
+        tables = load_spreadsheet()
+    if energies is None:
+        energies = dense_energies(tables)
+    energies = np.ascontiguousarray(energies, dtype=np.float64)
+
+    with tempfile.TemporaryDirectory(prefix="transfocate-harness-") as directory:
+        directory = pathlib.Path(directory)
+        executable = build_driver(directory, tables, source=source,
+                                  compiler=compiler)
+        energies.tofile(directory / "energies.bin")
+        result = subprocess.run(
+            [str(executable), "energies.bin", "results.bin", str(repeats)],
+            check=True, capture_output=True, text=True, cwd=directory,
+        )
+        rows = np.fromfile(directory / "results.bin", dtype=np.float64)
+    rows = rows.reshape(len(tables), len(FUNCTIONS), len(energies), 3)
+    speeds = [float(line.split()[-1]) for line in result.stdout.splitlines()]
+
+    formatted = format_tables(tables)
+    report = []
+    for table_index, name in enumerate(tables):
+        written = {column: values.astype(float)
+                   for column, values in formatted[name].items()}
+        expected = np.stack([
+            np.interp(energies, written["energy"], written[column])
+            for column in ("trip_min", "trip_max")
+        ], axis=-1)
+        for function_index, function in enumerate(FUNCTIONS):
+            limits = rows[table_index, function_index, :, 1:]
+            error = np.abs(limits - expected)
+            scale = np.maximum(np.abs(expected), np.finfo(float).tiny)
+            report.append(
+                {
+                    "table": name,
+                    "function": function,
+                    "lookups": len(energies),
+                    "max_error": np.nanmax(error),
+                    "max_relative_error": np.nanmax(error / scale),
+                    "mismatches": int(np.sum(~(error <= rtol * scale))),
+                    "lookups_per_second": speeds[
+                        table_index * len(FUNCTIONS) + function_index
+                    ],
+                }
+            )
+    return pd.DataFrame(report)
+
+
+def main(args=None):
+    """
+    Compile the generated IOC header and check it against the Python
+    interpolation of the spreadsheet tables
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--spreadsheet", default=None,
+                        help="Spreadsheet to read, instead of the default")
+    parser.add_argument("--source", default=None,
+                        help="C source of the IOC find_limits implementation")
+    parser.add_argument("--repeats", type=int, default=10,
+                        help="Number of timed passes over the energies")
+    parser.add_argument("--step", type=float, default=1.0,
+                        help="Spacing of the energies checked [eV]")
+    args = parser.parse_args(args)
+
+    tables = load_spreadsheet(args.spreadsheet)
+    report = check_header(tables, energies=dense_energies(tables, args.step),
+                          source=args.source, repeats=args.repeats)
+    with pd.option_context("display.width", 120):
+        print(report.to_string(index=False))
+    if report.mismatches.any():
+        raise SystemExit("The generated header differs from the tables")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
+import collections.abc
+import hashlib
+import json
 import logging
 import os
 import pathlib
 
+import numpy as np
 import pandas as pd
 
+from ..cache import cache_dir
+
 logger = logging.getLogger(__name__)
 
 MODULE_PATH = pathlib.Path(__file__).parent.resolve()
@@ -17,6 +23,16 @@ REGIONS = {
     "LENS1_750": {"usecols": "N:P"},
 }
 
+# Spreadsheet table for each XRT lens index
+XRT_LENS_TABLES = {
+    0: "NO_LENS",
+    1: "LENS1_750",
+    2: "LENS2_428",
+    3: "LENS3_333",
+}
+
+COLUMNS = ["energy", "trip_min", "trip_max"]
+
 # Lens information
 # Radii in micron:
 xrt_lenses_radii = [750.0, 428.6, 333.3]
@@ -54,28 +70,208 @@ MIN_ENERGY = {
     1: 5.96e3,
 }
 
+# Energy range [eV] covered by a checkout sweep
+SWEEP_ENERGY_RANGE = (0.0, 38000.0)
+
+
+def _column_index(letter):
+    """Zero-based index of an Excel column letter"""
+    index = 0
+    for char in letter.upper():
+        index = index * 26 + ord(char) - ord("A") + 1
+    return index - 1
+
+
+def _region_columns(usecols):
+    """Zero-based column indices of an Excel column range such as ``B:D``"""
+    first, last = usecols.split(":")
+    return list(range(_column_index(first), _column_index(last) + 1))
+
+
+def _to_dataframe(values):
+    """Create a table from an array of energy, trip_min and trip_max rows"""
+    df = pd.DataFrame(np.asarray(values, dtype=float), columns=COLUMNS)
+    return df.set_index(df.energy)
+
 
 def read_spreadsheet(spreadsheet=None):
+    """
+    Parse the tables of every region of the spreadsheet
+
+    The workbook is read once, and the columns of each region in
+    :data:`REGIONS` are split from the result.
+
+    Parameters
+    ----------
+    spreadsheet : str or pathlib.Path, optional
+        The spreadsheet to read. Defaults to :data:`SPREADSHEET`
+
+    Yields
+    ------
+    name : str
+        Region name
+
+    df : pd.DataFrame
+        Table of energy [eV], trip_min and trip_max, indexed by energy
+    """
     if spreadsheet is None:
         spreadsheet = SPREADSHEET
 
-    for name, read_kw in REGIONS.items():
-        df = pd.read_excel(
-            spreadsheet,
-            engine="openpyxl",
-            sheet_name=EXCEL_SHEET,
-            skiprows=ROW_START - 1,
-            header=None,
-            **read_kw
-        )
-        df.columns = ["energy", "trip_min", "trip_max"]
+    columns = {name: _region_columns(read_kw["usecols"])
+               for name, read_kw in REGIONS.items()}
+    sheet = pd.read_excel(
+        spreadsheet,
+        engine="openpyxl",
+        sheet_name=EXCEL_SHEET,
+        skiprows=ROW_START - 1,
+        header=None,
+        usecols=sorted(set(sum(columns.values(), []))),
+    )
+    for name, region_columns in columns.items():
+        df = sheet[region_columns].copy()
+        df.columns = COLUMNS
         df.energy *= 1e3  # keV -> eV
         df = df.dropna()
-        df = df.set_index(df.energy)
+        df = _to_dataframe(df.to_numpy(dtype=float))
         df.loc[df.trip_max > 1e4, "trip_max"] = 1e4
         yield name, df
 
 
+def _file_hash(path):
+    """SHA-256 digest of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(spreadsheet):
+    """Path of the parsed table cache for a spreadsheet, or None"""
+    directory = cache_dir("spreadsheet")
+    if directory is None:
+        return None
+    key = hashlib.sha256(str(spreadsheet).encode()).hexdigest()[:16]
+    return directory / f"{key}.npz"
+
+
+def _write_cache(cache, meta, arrays):
+    """Atomically write the parsed tables and their metadata to the cache"""
+    staging = cache.with_name(f".{cache.name}.{os.getpid()}.npz")
+    try:
+        np.savez(staging, _meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(staging, cache)
+    except OSError:
+        logger.warning("Unable to write spreadsheet cache %s", cache,
+                       exc_info=True)
+
+
+def load_spreadsheet(spreadsheet=None, use_cache=True):
+    """
+    Load the tables of the spreadsheet, using the parsed table cache
+
+    Parsed tables are cached on disk per spreadsheet path. The cache is used
+    if the modification time of the spreadsheet is unchanged, or if its
+    contents hash to the same value, in which case the cached modification
+    time is updated.
+
+    Parameters
+    ----------
+    spreadsheet : str or pathlib.Path, optional
+        The spreadsheet to read. Defaults to :data:`SPREADSHEET`
+
+    use_cache : bool, optional
+        Read and update the cache
+
+    Returns
+    -------
+    dict
+        Table for each region name
+    """
+    spreadsheet = pathlib.Path(spreadsheet or SPREADSHEET).resolve()
+    cache = None
+    if use_cache:
+        try:
+            cache = _cache_path(spreadsheet)
+        except OSError:
+            logger.warning("Spreadsheet cache is not available", exc_info=True)
+
+    stat = spreadsheet.stat()
+    content_hash = None
+    arrays = None
+    if cache is not None and cache.exists():
+        try:
+            with np.load(cache, allow_pickle=False) as cached:
+                meta = json.loads(str(cached["_meta"]))
+                if meta["mtime_ns"] != stat.st_mtime_ns:
+                    content_hash = _file_hash(spreadsheet)
+                if content_hash in (None, meta["sha256"]):
+                    arrays = {name: cached[name] for name in meta["regions"]}
+        except (OSError, ValueError, KeyError):
+            logger.warning("Unable to read spreadsheet cache %s", cache,
+                           exc_info=True)
+    if arrays is not None:
+        logger.debug("Using cached tables for %s", spreadsheet)
+        if content_hash is not None:
+            # Only the modification time changed, skip hashing next time
+            meta["mtime_ns"] = stat.st_mtime_ns
+            _write_cache(cache, meta, arrays)
+        return {name: _to_dataframe(array) for name, array in arrays.items()}
+
+    tables = dict(read_spreadsheet(spreadsheet))
+    if cache is not None:
+        meta = {
+            "path": str(spreadsheet),
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": content_hash or _file_hash(spreadsheet),
+            "regions": list(tables),
+        }
+        arrays = {name: df[COLUMNS].to_numpy(dtype=float)
+                  for name, df in tables.items()}
+        _write_cache(cache, meta, arrays)
+    return tables
+
+
+class SpreadsheetData(collections.abc.Mapping):
+    """
+    Tables of the spreadsheet, loaded on first access
+
+    Parameters
+    ----------
+    spreadsheet : str or pathlib.Path, optional
+        The spreadsheet to read. Defaults to :data:`SPREADSHEET` at the time
+        of the first access
+    """
+    def __init__(self, spreadsheet=None):
+        self.spreadsheet = spreadsheet
+        self._tables = None
+
+    @property
+    def tables(self):
+        """The tables for each region, loading them if necessary"""
+        if self._tables is None:
+            self._tables = load_spreadsheet(self.spreadsheet)
+        return self._tables
+
+    def reload(self):
+        """Discard the loaded tables so they are read again on next access"""
+        self._tables = None
+
+    def __getitem__(self, key):
+        return self.tables[key]
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __repr__(self):
+        if self._tables is None:
+            return f"<{type(self).__name__} (not loaded)>"
+        return f"<{type(self).__name__} {list(self._tables)}>"
+
+
 # Configuration for reading the spreadsheet:
 try:
     SPREADSHEET = pathlib.Path(os.environ["TRANSFOCATOR_SPREADSHEET"])
@@ -84,4 +280,4 @@ except KeyError:
 
 if not SPREADSHEET.exists():
     logger.error("Table not available (``TRANSFOCATOR_SPREADSHEET``): %s", SPREADSHEET)
-data = dict(read_spreadsheet())
+data = SpreadsheetData()
@@ -0,0 +1,105 @@
+"""Vectorized interpolation of the spreadsheet trip limit tables."""
+import numpy as np
+
+from .info import XRT_LENS_TABLES
+from .info import data as spreadsheet_data
+
+
+class LimitTables:
+    """
+    Trip limit tables for each XRT lens index, as plain arrays.
+
+    This is the Python equivalent of ``find_limits`` in the generated IOC
+    header: limits are linearly interpolated between the tabulated energies,
+    and the first or last row is used outside of the tabulated range.
+
+    Parameters
+    ----------
+    tables : dict, optional
+        Table for each region name.  Defaults to the spreadsheet tables in
+        :data:`transfocate.table.info.data`.
+    """
+
+    def __init__(self, tables=None):
+        if tables is None:
+            tables = spreadsheet_data
+        self.energy = {}
+        self.trip_min = {}
+        self.trip_max = {}
+        for xrt_lens, name in XRT_LENS_TABLES.items():
+            df = tables[name]
+            self.energy[xrt_lens] = df.energy.to_numpy(dtype=float)
+            self.trip_min[xrt_lens] = df.trip_min.to_numpy(dtype=float)
+            self.trip_max[xrt_lens] = df.trip_max.to_numpy(dtype=float)
+
+    def find_limits(self, energy, xrt_lens):
+        """
+        Interpolate the trip limits for arrays of energies and XRT lenses.
+
+        Parameters
+        ----------
+        energy : float or array_like
+            Photon energy [eV].
+        xrt_lens : int or array_like
+            XRT lens index, with 0 meaning no pre-focusing lens.  Broadcast
+            against ``energy``.
+
+        Returns
+        -------
+        trip_min : np.ndarray
+            Lower bound of the disallowed effective radius region [um].
+        trip_max : np.ndarray
+            Upper bound of the disallowed effective radius region [um].
+        """
+        energy, xrt_lens = np.broadcast_arrays(
+            np.asarray(energy, dtype=float), np.asarray(xrt_lens)
+        )
+        unknown = set(np.unique(xrt_lens).tolist()) - set(self.energy)
+        if unknown:
+            raise ValueError(f"Unknown XRT lens index: {sorted(unknown)}")
+
+        trip_min = np.empty(energy.shape)
+        trip_max = np.empty(energy.shape)
+        for lens, knots in self.energy.items():
+            where = xrt_lens == lens
+            if not np.any(where):
+                continue
+            trip_min[where] = np.interp(energy[where], knots, self.trip_min[lens])
+            trip_max[where] = np.interp(energy[where], knots, self.trip_max[lens])
+        return trip_min, trip_max
+
+
+_default_tables = None
+
+
+def default_tables():
+    """The :class:`LimitTables` of the spreadsheet, created on first use."""
+    global _default_tables
+    if _default_tables is None:
+        _default_tables = LimitTables()
+    return _default_tables
+
+
+def find_limits(energy, xrt_lens, tables=None):
+    """
+    Interpolate the trip limits for arrays of energies and XRT lenses.
+
+    Parameters
+    ----------
+    energy : float or array_like
+        Photon energy [eV].
+    xrt_lens : int or array_like
+        XRT lens index, with 0 meaning no pre-focusing lens.
+    tables : LimitTables, optional
+        The tables to use.  Defaults to the spreadsheet tables.
+
+    Returns
+    -------
+    trip_min : np.ndarray
+        Lower bound of the disallowed effective radius region [um].
+    trip_max : np.ndarray
+        Upper bound of the disallowed effective radius region [um].
+    """
+    if tables is None:
+        tables = default_tables()
+    return tables.find_limits(energy, xrt_lens)
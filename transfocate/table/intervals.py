@@ -0,0 +1,232 @@
+"""Index of the energy intervals in which each lens combination is allowed."""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from ..combinations import combination_masks, effective_radius
+from .faults import predict_faults
+from .info import (MIN_ENERGY, REQUIRES_LENS_RANGE, XRT_LENS_TABLES,
+                   tfs_lens_radii)
+from .interpolate import default_tables
+
+logger = logging.getLogger(__name__)
+
+
+def limit_crossings(energy, limit, radius):
+    """
+    Energies at which a piecewise linear trip limit equals each radius.
+
+    Parameters
+    ----------
+    energy : np.ndarray
+        Tabulated energies [eV].
+    limit : np.ndarray
+        Trip limit at each energy [um].
+    radius : array_like
+        Effective radii [um].
+
+    Returns
+    -------
+    list of np.ndarray
+        For each radius, the energies at which the linearly interpolated
+        limit equals it [eV], in table order.
+    """
+    radius = np.asarray(radius, dtype=float)[:, np.newaxis]
+    low, high = limit[:-1], limit[1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = (radius - low) / (high - low)
+    inside = (fraction >= 0.0) & (fraction <= 1.0)
+    crossing = energy[:-1] + fraction * np.diff(energy)
+    return [row[where] for row, where in zip(crossing, inside)]
+
+
+def allowed_intervals(xrt_lens, tfs_radius, tables=None):
+    """
+    Energy intervals in which the interlock allows a lens state.
+
+    The interlock state can only change where a trip limit crosses the
+    effective radius, or at the minimum energy and required lens range
+    edges.  The faults are evaluated between each of these breakpoints and
+    neighbouring allowed segments are merged.  Intervals are closed at the
+    breakpoints.
+
+    Parameters
+    ----------
+    xrt_lens : int
+        XRT lens index, with 0 meaning no pre-focusing lens.
+    tfs_radius : array_like
+        Transfocator effective radii [um], 0 when no lens is inserted.
+    tables : LimitTables, optional
+        The trip limit tables.  Defaults to the spreadsheet tables.
+
+    Returns
+    -------
+    list
+        For each radius, a list of ``(low, high)`` allowed energy intervals
+        [eV].  The last interval may extend to ``np.inf``.
+    """
+    if tables is None:
+        tables = default_tables()
+    tfs_radius = np.atleast_1d(np.asarray(tfs_radius, dtype=float))
+    energy = tables.energy[xrt_lens]
+    edges = [0.0, MIN_ENERGY[xrt_lens]]
+    if REQUIRES_LENS_RANGE[xrt_lens] is not None:
+        edges.extend(REQUIRES_LENS_RANGE[xrt_lens])
+    crossings = zip(
+        limit_crossings(energy, tables.trip_min[xrt_lens], tfs_radius),
+        limit_crossings(energy, tables.trip_max[xrt_lens], tfs_radius),
+    )
+
+    result = []
+    for radius, (low_crossings, high_crossings) in zip(tfs_radius, crossings):
+        breakpoints = np.unique(np.concatenate([edges, low_crossings, high_crossings]))
+        # Evaluate the interlock within each segment between breakpoints
+        samples = np.append(
+            (breakpoints[:-1] + breakpoints[1:]) / 2, breakpoints[-1] + 1.0
+        )
+        allowed = ~predict_faults(samples, xrt_lens, radius, tables=tables)["violated"]
+        stops = np.append(breakpoints[1:], np.inf)
+        intervals = []
+        for start, stop, ok in zip(breakpoints, stops, allowed):
+            if not ok:
+                continue
+            if intervals and intervals[-1][1] == start:
+                intervals[-1] = (intervals[-1][0], stop)
+            else:
+                intervals.append((start, stop))
+        result.append([(float(low), float(high)) for low, high in intervals])
+    return result
+
+
+class AllowedEnergyIndex:
+    """
+    Energy intervals in which each combination of lenses is allowed.
+
+    Combinations are indexed as described in :mod:`transfocate.combinations`,
+    with the XRT lens index being the index used by the interlock tables.
+
+    Parameters
+    ----------
+    tfs_radii : array_like, optional
+        Radius of each transfocator lens [um].  Defaults to
+        :data:`tfs_lens_radii`.
+    tables : LimitTables, optional
+        The trip limit tables.  Defaults to the spreadsheet tables.
+
+    Attributes
+    ----------
+    intervals : pd.IntervalIndex
+        Every allowed energy interval [eV] of every combination.
+    combo : np.ndarray
+        Flat combination index of each interval.
+    """
+
+    def __init__(self, tfs_radii=None, tables=None):
+        if tfs_radii is None:
+            tfs_radii = tfs_lens_radii
+        self.tfs_radii = list(tfs_radii)
+        n_xrt = max(XRT_LENS_TABLES)
+        self.xrt_index, self.tfs_mask = combination_masks(n_xrt, len(self.tfs_radii))
+        self.tfs_radius = effective_radius(self.tfs_radii, self.tfs_mask)
+
+        starts, stops, combos = [], [], []
+        for xrt_lens in sorted(XRT_LENS_TABLES):
+            which = np.flatnonzero(self.xrt_index == xrt_lens)
+            # Many subsets share an effective radius; compute each one once
+            radii, inverse = np.unique(self.tfs_radius[which], return_inverse=True)
+            intervals = allowed_intervals(xrt_lens, radii, tables=tables)
+            for combo, radius_index in zip(which, inverse):
+                for start, stop in intervals[radius_index]:
+                    starts.append(start)
+                    stops.append(stop)
+                    combos.append(combo)
+        self.intervals = pd.IntervalIndex.from_arrays(starts, stops, closed="both")
+        self.combo = np.asarray(combos, dtype=np.int64)
+        logger.debug(
+            "Indexed %d allowed intervals for %d combinations",
+            len(self.combo), len(self),
+        )
+
+    def __len__(self):
+        return len(self.tfs_mask)
+
+    def allowed_mask(self, energy):
+        """
+        Boolean mask over all combinations allowed at an energy.
+
+        Parameters
+        ----------
+        energy : float
+            Photon energy [eV].
+
+        Returns
+        -------
+        np.ndarray
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.combo[self.intervals.contains(energy)]] = True
+        return mask
+
+    def allowed_at(self, energy):
+        """
+        Combinations allowed at an energy.
+
+        Parameters
+        ----------
+        energy : float
+            Photon energy [eV].
+
+        Returns
+        -------
+        np.ndarray
+            Sorted flat combination indices.
+        """
+        return np.flatnonzero(self.allowed_mask(energy))
+
+    def intervals_for(self, combo):
+        """
+        Allowed energy intervals of a combination.
+
+        Parameters
+        ----------
+        combo : int
+            Flat combination index.
+
+        Returns
+        -------
+        list
+            List of ``(low, high)`` energy intervals [eV].
+        """
+        intervals = self.intervals[self.combo == combo]
+        return list(zip(intervals.left, intervals.right))
+
+    def stays_allowed(self, combo, low, high):
+        """
+        Check that a combination is allowed over a whole energy range.
+
+        Parameters
+        ----------
+        combo : int
+            Flat combination index.
+        low, high : float
+            The energy range [eV], e.g. the extent of an energy scan.
+
+        Returns
+        -------
+        bool
+        """
+        low, high = min(low, high), max(low, high)
+        intervals = self.intervals[self.combo == combo]
+        return bool(np.any((intervals.left <= low) & (intervals.right >= high)))
+
+
+_default_index = None
+
+
+def default_index():
+    """The :class:`AllowedEnergyIndex` of the spreadsheet, created on first use."""
+    global _default_index
+    if _default_index is None:
+        _default_index = AllowedEnergyIndex()
+    return _default_index
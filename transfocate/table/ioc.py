@@ -3,9 +3,9 @@
 import pandas as pd
 
 from .info import data as spreadsheet_data
+from .uniform import uniform_indices
 
 # Header file output settings:
-ROW_FORMAT = "{{{energy:.6f}, {trip_min:.6f}, {trip_max:.6f}}}"
 HEADER = """
 /* WARNING: This file is auto-generated. Do not modify it. */
 #ifndef _H_MFX_RANGE_TABLE
@@ -77,21 +77,161 @@ const RangeTable static {table_name} = {{
 }};
 """
 
+# Uniform lookup, see transfocate.table.uniform
+UNIFORM_HEADER = """
+typedef struct {
+    const char *table_name;
+    const RangeTable *table;
+    const double energy_start;
+    const double inverse_step;
+    const int num_buckets;
+    const short *bucket_rows;
+} UniformRangeTable;
+
+
+/*
+ * find_limits_uniform
+ *
+ * As find_limits, in constant time.  The row below the energy is found
+ * directly from a uniform grid of energy buckets, each narrower than the
+ * spacing of the rows.  The energy of the result is the closest tabulated
+ * energy.
+ */
+static inline bool find_limits_uniform(
+    RangeRow *result, const UniformRangeTable *index, double find_energy)
+{
+    if (!result || !index || index->table->num_rows < 2 ||
+            find_energy != find_energy) {
+        return false;
+    }
+    const RangeRow *rows = index->table->rows;
+    const int last = index->table->num_rows - 1;
+    if (find_energy <= rows[0].energy) {
+        *result = rows[0];
+        return true;
+    }
+    if (find_energy >= rows[last].energy) {
+        *result = rows[last];
+        return true;
+    }
+
+    double position = (find_energy - index->energy_start) * index->inverse_step;
+    int bucket = 0;
+    if (position >= index->num_buckets - 1) {
+        bucket = index->num_buckets - 1;
+    } else if (position > 0.0) {
+        bucket = (int)position;
+    }
+    int row = index->bucket_rows[bucket];
+    if (row > 0 && find_energy < rows[row].energy) {
+        row--;
+    } else if (find_energy >= rows[row + 1].energy) {
+        row++;
+    }
+
+    const RangeRow *low = &rows[row];
+    const RangeRow *high = &rows[row + 1];
+    const double offset = find_energy - low->energy;
+    const double width = high->energy - low->energy;
+    result->low = (high->low - low->low) / width * offset + low->low;
+    result->high = (high->high - low->high) / width * offset + low->high;
+    result->energy = (offset < width / 2) ? low->energy : high->energy;
+    return true;
+}
+"""
+
+UNIFORM_TABLE_FORMAT = """
+static const short {index_name}_BUCKETS[{bucket_count}] = {{
+    {bucket_rows}
+}};
+
+static const UniformRangeTable {index_name} = {{
+    "{table_name}",
+    &{table_name},
+    {energy_start},
+    {inverse_step},
+    {bucket_count},
+    {index_name}_BUCKETS
+}};
+"""
+
+# Number of bucket rows per line of the header
+BUCKETS_PER_LINE = 16
+
 pd.set_option("display.max_rows", 1000)
 
 
-def generate_header():
-    """Generate the C header from the given spreadsheet."""
-    code = [HEADER.lstrip()]
+def _uniform_table(name, index):
+    """C code of the uniform lookup index of a table."""
+    rows = index.rows.astype(str)
+    lines = [
+        ", ".join(rows[start:start + BUCKETS_PER_LINE])
+        for start in range(0, len(rows), BUCKETS_PER_LINE)
+    ]
+    return UNIFORM_TABLE_FORMAT.format(
+        index_name=f"UNIFORM_{name}",
+        table_name=f"TABLE_{name}",
+        bucket_count=len(index),
+        bucket_rows=",\n    ".join(lines),
+        energy_start=f"{index.start:.17g}",
+        inverse_step=f"{index.inverse_step:.17g}",
+    )
 
-    for name, df in spreadsheet_data.items():
-        rows = ",\n        ".join(
-            ROW_FORMAT.format(**dict(row)) for _, row in df.iterrows()
-        )
-        table_code = TABLE_FORMAT.format(
-            table_name=f"TABLE_{name}", rows=rows, row_count=len(df)
+
+def table_code(name, columns):
+    """
+    C code of one table.
+
+    Parameters
+    ----------
+    name : str
+        Region name.
+    columns : dict
+        Formatted columns of the table, see
+        :func:`~transfocate.table.codegen.format_columns`.
+    """
+    rows = ",\n        ".join(
+        f"{{{energy}, {trip_min}, {trip_max}}}"
+        for energy, trip_min, trip_max in zip(
+            columns["energy"], columns["trip_min"], columns["trip_max"]
         )
-        code.append(table_code)
+    )
+    return TABLE_FORMAT.format(
+        table_name=f"TABLE_{name}", rows=rows, row_count=len(columns["energy"])
+    )
+
+
+def generate_header(tables=None, formatted=None, uniform=False):
+    """
+    Generate the C header from the spreadsheet tables.
+
+    Parameters
+    ----------
+    tables : dict, optional
+        Table for each region name.  Defaults to the spreadsheet tables.
+    formatted : dict, optional
+        The tables formatted by :func:`~transfocate.table.codegen.format_tables`,
+        if already available.
+    uniform : bool, optional
+        Also generate a ``UNIFORM_<name>`` index of each table and
+        ``find_limits_uniform``, for constant time lookups.  See
+        :mod:`transfocate.table.uniform`.
+    """
+    from .codegen import format_tables
+
+    if tables is None:
+        tables = spreadsheet_data
+    if formatted is None:
+        formatted = format_tables(tables)
+
+    code = [HEADER.lstrip()]
+    for name in tables:
+        code.append(table_code(name, formatted[name]))
+
+    if uniform:
+        code.append(UNIFORM_HEADER)
+        for name, index in uniform_indices(tables).items():
+            code.append(_uniform_table(name, index))
 
     code.append(FOOTER)
     return "\n".join(code)
@@ -121,29 +261,20 @@ def plot_data(ax, key, data):
     return df
 
 
-def main():
+def main(plot=False):
     """
     Generate the header file and print it to standard output.
+
+    Parameters
+    ----------
+    plot : bool, optional
+        Also plot the disallowed regions to ``interlock_regions.png``.
     """
     code = generate_header()
     print(code)
-
-    import matplotlib  # noqa
-    matplotlib.use("Agg")  # noqa
-    import matplotlib.pyplot as plt  # noqa
-
-    _, axes = plt.subplots(
-        ncols=2, nrows=2, constrained_layout=True, dpi=120, figsize=(11, 8)
-    )
-    # plt.ion()
-    keys = list(spreadsheet_data)
-    plot_data(axes[0, 0], keys[0], spreadsheet_data)
-    plot_data(axes[0, 1], keys[1], spreadsheet_data)
-    plot_data(axes[1, 0], keys[2], spreadsheet_data)
-    plot_data(axes[1, 1], keys[3], spreadsheet_data)
-    plt.suptitle("Disallowed Effective Radius Regions")
-    plt.savefig("interlock_regions.png")
-    # plt.ioff()
+    if plot:
+        from .codegen import plot_regions
+        plot_regions("interlock_regions.png")
     return code
 
 
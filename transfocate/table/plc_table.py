@@ -3,14 +3,10 @@
 import pandas as pd
 
 from .info import data as spreadsheet_data
+from .uniform import run_lengths, uniform_indices
 
 # PLC file output settings:
 DECLARATION_FORMAT = "{table_name} : ARRAY[0..{row_count}] OF ST_TableRow;"
-ROW_FORMAT = (
-    "{table_name}[{idx}].fEnergy := {energy:.6f}; "
-    "{table_name}[{idx}].fLow := {trip_min:.6f}; "
-    "{table_name}[{idx}].fHigh := {trip_max:.6f}; "
-)
 TABLE_FORMAT = """
     {rows}
 """
@@ -39,20 +35,143 @@ IF NOT bInitialized THEN
     bInitialized := TRUE;
 END_IF
 ]]></ST>
-    </Implementation>
+    </Implementation>{methods}
   </POU>
 </TcPlcObject>
 """
 
+# Uniform lookup, see transfocate.table.uniform
+BUCKETS_DECLARATION_FORMAT = (
+    "{bucket_name} : ARRAY[0..{last_bucket}] OF INT := [{bucket_rows}];"
+)
+
+METHOD_FORMAT = """
+    <Method Name="M_FindLimits" Id="{{0e2a5c1b-6a1f-4b8e-9c56-4f1d7e2b9a30}}">
+      <Declaration><![CDATA[
+(* WARNING: This file is auto-generated. Do not modify it.*)
+(* Interpolate a table in constant time, using its uniform energy buckets *)
+METHOD M_FindLimits : BOOL
+VAR_INPUT
+    (* {table_numbers} *)
+    nTable : INT;
+    fEnergy : LREAL;
+END_VAR
+VAR_IN_OUT
+    stResult : ST_TableRow;
+END_VAR
+VAR
+    nRow : DINT;
+    fOffset : LREAL;
+    fWidth : LREAL;
+END_VAR
+]]></Declaration>
+      <Implementation>
+        <ST><![CDATA[
+(* WARNING: This file is auto-generated. Do not modify it.*)
+IF NOT bInitialized THEN
+    M_FindLimits := FALSE;
+    RETURN;
+END_IF
+M_FindLimits := TRUE;
+CASE nTable OF
+{cases}
+ELSE
+    M_FindLimits := FALSE;
+END_CASE
+]]></ST>
+      </Implementation>
+    </Method>"""
+
+CASE_FORMAT = """\
+{number}: (* {table_name} *)
+    IF fEnergy <= {table_name}[0].fEnergy THEN
+        stResult := {table_name}[0];
+    ELSIF fEnergy >= {table_name}[{last}].fEnergy THEN
+        stResult := {table_name}[{last}];
+    ELSE
+        nRow := {bucket_name}[LIMIT(0, TRUNC((fEnergy - {energy_start}) * {inverse_step}), {last_bucket})];
+        IF nRow > 0 AND fEnergy < {table_name}[nRow].fEnergy THEN
+            nRow := nRow - 1;
+        ELSIF fEnergy >= {table_name}[nRow + 1].fEnergy THEN
+            nRow := nRow + 1;
+        END_IF
+        fOffset := fEnergy - {table_name}[nRow].fEnergy;
+        fWidth := {table_name}[nRow + 1].fEnergy - {table_name}[nRow].fEnergy;
+        stResult.fLow := ({table_name}[nRow + 1].fLow - {table_name}[nRow].fLow) / fWidth * fOffset + {table_name}[nRow].fLow;
+        stResult.fHigh := ({table_name}[nRow + 1].fHigh - {table_name}[nRow].fHigh) / fWidth * fOffset + {table_name}[nRow].fHigh;
+        IF fOffset < fWidth / 2 THEN
+            stResult.fEnergy := {table_name}[nRow].fEnergy;
+        ELSE
+            stResult.fEnergy := {table_name}[nRow + 1].fEnergy;
+        END_IF
+    END_IF"""
+
 pd.set_option("display.max_rows", 1000)
 
 
-def generate_source():
-    """Generate the PLC code from the given spreadsheet."""
+def _bucket_initializer(rows):
+    """Array initializer of bucket rows, with repeated rows as ``n(row)``."""
+    return ", ".join(
+        str(row) if count == 1 else f"{count}({row})"
+        for count, row in run_lengths(rows)
+    )
+
+
+def row_assignments(table_name, columns, rows=None):
+    """
+    PLC statements initializing rows of a table.
+
+    Parameters
+    ----------
+    table_name : str
+        Name of the table array.
+    columns : dict
+        Formatted columns of the table, see
+        :func:`~transfocate.table.codegen.format_columns`.
+    rows : array_like, optional
+        Indices of the rows.  Defaults to every row.
+
+    Returns
+    -------
+    list of str
+        One statement per row.
+    """
+    if rows is None:
+        rows = range(len(columns["energy"]))
+    return [
+        f"{table_name}[{idx}].fEnergy := {columns['energy'][idx]}; "
+        f"{table_name}[{idx}].fLow := {columns['trip_min'][idx]}; "
+        f"{table_name}[{idx}].fHigh := {columns['trip_max'][idx]}; "
+        for idx in rows
+    ]
+
+
+def generate_source(tables=None, formatted=None, uniform=False):
+    """
+    Generate the PLC code from the spreadsheet tables.
+
+    Parameters
+    ----------
+    tables : dict, optional
+        Table for each region name.  Defaults to the spreadsheet tables.
+    formatted : dict, optional
+        The tables formatted by :func:`~transfocate.table.codegen.format_tables`,
+        if already available.
+    uniform : bool, optional
+        Also generate the uniform energy buckets of each table and the
+        ``M_FindLimits`` method, for constant time lookups.  Tables are
+        numbered in order.  See :mod:`transfocate.table.uniform`.
+    """
+    from .codegen import format_tables
+
+    if tables is None:
+        tables = spreadsheet_data
+    if formatted is None:
+        formatted = format_tables(tables)
+
     declarations = []
     table_code = []
-
-    for name, df in spreadsheet_data.items():
+    for name, df in tables.items():
         table_name = f"st{name}"
 
         declarations.append(
@@ -61,17 +180,45 @@ def generate_source():
                 row_count=len(df) - 1,
             )
         )
-        rows = "\n    ".join(
-            ROW_FORMAT.format(idx=idx, table_name=table_name, **dict(row))
-            for idx, (_, row) in enumerate(df.iterrows())
-        )
+        rows = "\n    ".join(row_assignments(table_name, formatted[name]))
         table_code.append(
             TABLE_FORMAT.format(table_name=table_name, rows=rows, row_count=len(df))
         )
 
+    methods = ""
+    if uniform:
+        cases = []
+        numbers = []
+        for number, (name, index) in enumerate(uniform_indices(tables).items()):
+            table_name = f"st{name}"
+            bucket_name = f"n{name}Buckets"
+            declarations.append(
+                BUCKETS_DECLARATION_FORMAT.format(
+                    bucket_name=bucket_name,
+                    last_bucket=len(index) - 1,
+                    bucket_rows=_bucket_initializer(index.rows),
+                )
+            )
+            cases.append(
+                CASE_FORMAT.format(
+                    number=number,
+                    table_name=table_name,
+                    bucket_name=bucket_name,
+                    last=len(index.energy) - 1,
+                    last_bucket=len(index) - 1,
+                    energy_start=f"{index.start:.17g}",
+                    inverse_step=f"{index.inverse_step:.17g}",
+                )
+            )
+            numbers.append(f"{number}: {table_name}")
+        methods = METHOD_FORMAT.format(
+            table_numbers=", ".join(numbers), cases="\n".join(cases)
+        )
+
     code = CODE_FORMAT.format(
         tables="\n".join(table_code),
         declarations="\n    ".join(declarations),
+        methods=methods,
     )
 
     return code
@@ -101,31 +248,22 @@ def plot_data(ax, key, data):
     return df
 
 
-def main():
+def main(plot=False):
     """
     Generate the PLC source code and print it to standard output.
 
     Returns the generated data.
+
+    Parameters
+    ----------
+    plot : bool, optional
+        Also plot the disallowed regions to ``plc_table_regions.png``.
     """
     code = generate_source()
     print(code)
-
-    import matplotlib  # noqa
-    matplotlib.use("Agg")  # noqa
-    import matplotlib.pyplot as plt  # noqa
-
-    _, axes = plt.subplots(
-        ncols=2, nrows=2, constrained_layout=True, dpi=120, figsize=(11, 8)
-    )
-    # plt.ion()
-    keys = list(spreadsheet_data)
-    plot_data(axes[0, 0], keys[0], spreadsheet_data)
-    plot_data(axes[0, 1], keys[1], spreadsheet_data)
-    plot_data(axes[1, 0], keys[2], spreadsheet_data)
-    plot_data(axes[1, 1], keys[3], spreadsheet_data)
-    plt.suptitle("Disallowed Effective Radius Regions")
-    plt.savefig("plc_table_regions.png")
-    # plt.ioff()
+    if plot:
+        from .codegen import plot_regions
+        plot_regions("plc_table_regions.png")
     return code
 
 
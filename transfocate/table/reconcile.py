@@ -0,0 +1,121 @@
+"""Reconciliation of checkout scan data against the spreadsheet tables."""
+import numpy as np
+import pandas as pd
+
+from .faults import FAULT_FIELDS, predict_faults
+from .info import MIN_ENERGY, REQUIRES_LENS_RANGE
+
+# Fault bits reported by the PLC that are predicted by the offline model
+CHECKED_FAULTS = [field for field in FAULT_FIELDS if field != "violated"]
+CHECKED_LIMITS = ["trip_low", "trip_high"]
+
+
+def _energy_edges(xrt_lens):
+    edges = [MIN_ENERGY[xrt_lens]]
+    if REQUIRES_LENS_RANGE[xrt_lens] is not None:
+        edges.extend(REQUIRES_LENS_RANGE[xrt_lens])
+    return np.asarray(edges, dtype=float)
+
+
+def reconcile(df, xrt_lens, tables=None, limit_rtol=1e-4, limit_atol=1e-2,
+              radius_rtol=1e-3, energy_atol=1.0):
+    """
+    Compare the limits and faults reported by the PLC with the spreadsheet.
+
+    Points within a tolerance of a boundary, where the expected state
+    depends on rounding in the PLC, are marked ``ambiguous`` and their
+    faults are not checked.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Scan data with ``energy``, ``tfs_radius``, ``trip_low``,
+        ``trip_high`` and fault columns, as saved by the checkout.
+    xrt_lens : int
+        XRT lens index of the scan, with 0 meaning no pre-focusing lens.
+    tables : LimitTables, optional
+        The trip limit tables.  Defaults to the spreadsheet tables.
+    limit_rtol, limit_atol : float, optional
+        Relative and absolute [um] tolerance on the trip limits.
+    radius_rtol : float, optional
+        Relative distance of the effective radius from a trip limit within
+        which the table fault is ambiguous.
+    energy_atol : float, optional
+        Distance [eV] from a minimum energy or required lens range edge
+        within which the faults are ambiguous.
+
+    Returns
+    -------
+    pd.DataFrame
+        The input columns, the ``expected_`` value of each checked limit and
+        fault, a ``<name>_mismatch`` column for each, ``ambiguous`` and
+        ``discrepancy``, the latter being set for any mismatch.
+    """
+    energy = df["energy"].to_numpy(dtype=float)
+    tfs_radius = df["tfs_radius"].to_numpy(dtype=float)
+    expected = predict_faults(energy, xrt_lens, tfs_radius, tables=tables)
+
+    result = df.copy()
+    discrepancy = np.zeros(len(df), dtype=bool)
+    for name in CHECKED_LIMITS:
+        result[f"expected_{name}"] = expected[name]
+        mismatch = ~np.isclose(
+            df[name].to_numpy(dtype=float), expected[name],
+            rtol=limit_rtol, atol=limit_atol,
+        )
+        result[f"{name}_mismatch"] = mismatch
+        discrepancy |= mismatch
+
+    near_limit = np.zeros(len(df), dtype=bool)
+    for name in CHECKED_LIMITS:
+        near_limit |= np.isclose(tfs_radius, expected[name], rtol=radius_rtol)
+    edges = _energy_edges(xrt_lens)
+    near_edge = np.any(
+        np.abs(energy[:, np.newaxis] - edges) <= energy_atol, axis=1
+    )
+    ambiguous = near_limit | near_edge
+    result["ambiguous"] = ambiguous
+
+    for name in CHECKED_FAULTS + ["violated"]:
+        result[f"expected_{name}"] = expected[name]
+        if name not in df:
+            continue
+        mismatch = (df[name].to_numpy() != 0) != expected[name]
+        mismatch &= ~ambiguous
+        result[f"{name}_mismatch"] = mismatch
+        discrepancy |= mismatch
+
+    result["discrepancy"] = discrepancy
+    return result
+
+
+def reconciliation_summary(results):
+    """
+    Summarize the discrepancies of several reconciled scans.
+
+    Parameters
+    ----------
+    results : dict
+        Result of :func:`reconcile` for each XRT lens index.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per XRT lens with the number of ``points``, of
+        ``ambiguous`` points, of mismatches of each limit and fault, and of
+        points with any ``discrepancy``.
+    """
+    rows = []
+    for xrt_lens, result in sorted(results.items()):
+        row = {
+            "xrt_lens": xrt_lens,
+            "points": len(result),
+            "ambiguous": int(result["ambiguous"].sum()),
+        }
+        for name in CHECKED_LIMITS + CHECKED_FAULTS + ["violated"]:
+            column = f"{name}_mismatch"
+            if column in result:
+                row[name] = int(result[column].sum())
+        row["discrepancy"] = int(result["discrepancy"].sum())
+        rows.append(row)
+    return pd.DataFrame(rows).set_index("xrt_lens")
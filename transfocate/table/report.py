@@ -1,12 +1,26 @@
+import concurrent.futures
 import datetime
+import hashlib
+import json
+import logging
+import os
 
 import numpy as np
-import openpyxl
 import pandas as pd
 from reportlab import platypus
 from reportlab.lib import colors, pagesizes, units
 from reportlab.lib.styles import getSampleStyleSheet
 
+from ..cache import cache_dir
+from ..scan_data import read_scan_data
+from . import info
+from .reconcile import reconcile, reconciliation_summary
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached section data changes format
+SECTION_CACHE_VERSION = 1
+
 
 def to_paragraph(text):
     return text.replace("\n", "<br/>")
@@ -30,8 +44,9 @@ table_fields = {
 HEADER = f"""
 Report generated: {datetime.datetime.now()}
 
-The next 4 sections describe individual scans, without a pre-focus lens and \
-then one per pre-focus lens.
+A summary comparing every scan point with the spreadsheet comes first.  The \
+next 4 sections describe individual scans, without a pre-focus lens and then \
+one per pre-focus lens.
 """
 
 SCAN_INFO = """
@@ -57,57 +72,205 @@ region.
 
 results = {
     "pre_focus_10000um_lens_0": {
+        "xrt_lens": 0,
         "title": "Scan 1: No pre-focusing lens",
         "info": """bluesky scan sweep_energy_plan performed without a pre-focus lens.""",
     },
     "pre_focus_750um_lens_1": {
+        "xrt_lens": 1,
         "title": "Scan 2: 750.000µm pre-focusing lens",
         "info": "bluesky scan sweep_energy_plan with 750.000µm pre-focusing lens..",
     },
     "pre_focus_429um_lens_2": {
+        "xrt_lens": 2,
         "title": "Scan 3: 428.571µm pre-focusing lens",
         "info": "bluesky scan sweep_energy_plan with 428.571µm pre-focusing lens.",
     },
     "pre_focus_333um_lens_3": {
+        "xrt_lens": 3,
         "title": "Scan 4: 333.333µm pre-focusing lens",
         "info": "bluesky scan sweep_energy_plan with 333.333µm pre-focusing lens.",
     },
 }
 
 
-def _build_report():
-    stylesheet = getSampleStyleSheet()
-    builder = [
-        platypus.Paragraph("Report document", stylesheet["Heading1"]),
-        platypus.Paragraph(to_paragraph(HEADER), stylesheet["Normal"]),
+RECONCILE_INFO = """
+Every scan point is compared with the spreadsheet: the trip limits reported \
+by the PLC with the interpolated table values, and the fault bits with those \
+predicted by the offline interlock model.
+Each column counts the points that disagree.  <b>Ambiguous</b> points lie \
+on a table boundary, where the fault state depends on PLC rounding; their \
+faults are not compared.
+"""
+
+reconcile_fields = list(table_fields) + ["violated"]
+
+
+def _table(rows, header):
+    style = platypus.TableStyle(
+        [
+            ("FACE", (0, 0), (-1, 0), "Times-Bold"),
+            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.black),
+            ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
+        ]
+    )
+    table = platypus.Table([header] + rows, repeatRows=1)
+    table.setStyle(style)
+    return table
+
+
+def _reconciliation_section(summary, stylesheet):
+    summary = summary.reset_index()
+    header = [column.replace("_", "\n") for column in summary.columns]
+    return [
+        platypus.Paragraph("Reconciliation summary", stylesheet["Heading1"]),
+        platypus.Paragraph(to_paragraph(RECONCILE_INFO), stylesheet["Normal"]),
+        _table(summary.to_numpy().tolist(), header),
+        platypus.PageBreakIfNotEmpty(),
     ]
 
-    for scan_prefix, scan_info in results.items():
-        excel_filename = f"{scan_prefix}.xlsx"
-        workbook = openpyxl.load_workbook(excel_filename)
-        df = pd.read_excel(excel_filename, engine="openpyxl")
-        df = df[list(table_fields)]
 
-        for attr, col_info in table_fields.items():
-            precision = col_info.get("precision")
-            if precision is not None:
-                col = getattr(df, attr)
-                setattr(df, attr, [f"%.{precision}f" % item for item in col])
+def format_table(df):
+    """
+    Format the columns of scan data for the report table.
 
-        style = platypus.TableStyle(
-            [
-                ("FACE", (0, 0), (-1, 0), "Times-Bold"),
-                ("ALIGN", (0, 0), (-1, 0), "CENTER"),
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.black),
-                ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
-            ]
-        )
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Scan data with the columns of :data:`table_fields`.
+
+    Returns
+    -------
+    list
+        Rows of the table, with fixed precision columns as strings.
+    """
+    columns = []
+    for attr, col_info in table_fields.items():
+        values = df[attr].to_numpy()
+        precision = col_info.get("precision")
+        if precision is not None:
+            values = np.char.mod(f"%.{precision}f", values.astype(float))
+        columns.append(values.tolist())
+    return [list(row) for row in zip(*columns)]
+
+
+def _file_key(*paths):
+    """Key identifying the current contents of files, by size and mtime."""
+    digest = hashlib.sha256(str(SECTION_CACHE_VERSION).encode())
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:32]
+
+
+def render_figure(df, xrt_lens, filename):
+    """Render the plot of a scan with the Agg backend, independent of pyplot."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
 
-        header = [
-            col_info.get("label", attr) for attr, col_info in table_fields.items()
+    from ..sweep_plot import SweepPlot
+
+    fig = Figure(figsize=(12, 10), constrained_layout=True)
+    FigureCanvasAgg(fig)
+    plot = SweepPlot(xrt_lens, fig.add_subplot(), blit=False)
+    plot.add(df)
+    fig.savefig(filename)
+
+
+def prepare_scan(scan_prefix, xrt_lens, use_cache=True):
+    """
+    Data for the report section of one scan.
+
+    The scan data is read once, to reconcile it against the spreadsheet,
+    format its table and, if missing or older than the data, render its
+    figure.  The result is cached on disk, keyed on the data file and the
+    spreadsheet, so unchanged scans are not processed again.
+
+    Parameters
+    ----------
+    scan_prefix : str
+        File name of the scan data and figure, without extension.
+    xrt_lens : int
+        XRT lens index of the scan.
+    use_cache : bool, optional
+        Use the section cache.
+
+    Returns
+    -------
+    dict
+        The table ``rows``, the ``created`` time of the data and the
+        reconciliation ``summary`` row.
+    """
+    data_filename = f"{scan_prefix}.parquet"
+    figure_filename = f"{scan_prefix}.png"
+    stale_figure = not os.path.exists(figure_filename) or (
+        os.path.getmtime(figure_filename) < os.path.getmtime(data_filename)
+    )
+
+    directory = cache_dir("report") if use_cache else None
+    cache_path = None
+    if directory is not None:
+        key = _file_key(data_filename, info.SPREADSHEET)
+        cache_path = directory / f"{key}.json"
+        if not stale_figure and cache_path.exists():
+            with open(cache_path) as fp:
+                logger.debug("Using cached report section for %s", scan_prefix)
+                return json.load(fp)
+
+    df, metadata = read_scan_data(
+        data_filename, columns=reconcile_fields + ["xrt_radius"], with_metadata=True
+    )
+    if stale_figure:
+        render_figure(df, xrt_lens, figure_filename)
+    summary = reconciliation_summary({xrt_lens: reconcile(df, xrt_lens)})
+    section = {
+        "rows": format_table(df),
+        "created": str(metadata.get("created")),
+        # Counts only; JSON does not know numpy integers
+        "summary": {
+            key: int(value)
+            for key, value in summary.reset_index().iloc[0].items()
+        },
+    }
+    if cache_path is not None:
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as fp:
+            json.dump(section, fp)
+        os.replace(tmp_path, cache_path)
+    return section
+
+
+def _prepare_scans(use_cache=True, processes=None):
+    """Prepare every scan section, in parallel worker processes."""
+    scans = [(prefix, scan_info["xrt_lens"]) for prefix, scan_info in results.items()]
+    processes = processes or min(len(scans), os.cpu_count() or 1)
+    if processes == 1:
+        return [prepare_scan(prefix, lens, use_cache) for prefix, lens in scans]
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        futures = [
+            executor.submit(prepare_scan, prefix, lens, use_cache)
+            for prefix, lens in scans
         ]
-        table = platypus.Table([header] + np.array(df).tolist(), repeatRows=1)
-        table.setStyle(style)
+        return [future.result() for future in futures]
+
+
+def _build_report(use_cache=True, processes=None):
+    stylesheet = getSampleStyleSheet()
+    sections = _prepare_scans(use_cache=use_cache, processes=processes)
+    summary = pd.DataFrame(
+        [section["summary"] for section in sections]
+    ).set_index("xrt_lens")
+
+    builder = [
+        platypus.Paragraph("Report document", stylesheet["Heading1"]),
+        platypus.Paragraph(to_paragraph(HEADER), stylesheet["Normal"]),
+    ]
+    builder.extend(_reconciliation_section(summary, stylesheet))
+
+    header = [col_info.get("label", attr) for attr, col_info in table_fields.items()]
+    for (scan_prefix, scan_info), section in zip(results.items(), sections):
+        table = _table(section["rows"], header)
         plot = platypus.Image(f"{scan_prefix}.png")
         plot.drawWidth = 8.0 * units.inch
         plot.drawHeight = 6.67 * units.inch
@@ -115,7 +278,7 @@ def _build_report():
             [
                 platypus.Paragraph(scan_info["title"], stylesheet["Heading1"]),
                 platypus.Paragraph(
-                    f"Data generated: {workbook.properties.created}",
+                    f"Data generated: {section['created']}",
                     stylesheet["Normal"],
                 ),
                 platypus.Paragraph(
@@ -147,7 +310,26 @@ def page_footer(canvas, doc):
     canvas.restoreState()
 
 
-def generate_report(fn=None):
+def generate_report(fn=None, use_cache=True, processes=None):
+    """
+    Generate the checkout report from the scan data in the current directory.
+
+    Parameters
+    ----------
+    fn : str, optional
+        The PDF file to write.  Defaults to a timestamped name.
+    use_cache : bool, optional
+        Reuse the sections of scans that have not changed since the last
+        report.
+    processes : int, optional
+        Number of worker processes preparing the scan sections.  By default
+        one per scan, and ``1`` prepares them in this process.
+
+    Returns
+    -------
+    str
+        The file written.
+    """
     if fn is None:
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M")
         fn = f"report_{timestamp}.pdf"
@@ -156,7 +338,7 @@ def generate_report(fn=None):
         fn,
         pagesize=pagesizes.letter,
     )
-    builder = _build_report()
+    builder = _build_report(use_cache=use_cache, processes=processes)
     doc.build(builder, onFirstPage=page_footer, onLaterPages=page_footer)
     print(f"Wrote report to {fn}")
     return fn
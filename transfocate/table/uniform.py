@@ -0,0 +1,215 @@
+"""
+Constant time lookup in the trip limit tables, on a uniform energy grid
+
+The tabulated energies are irregular, so finding the row of an energy means
+searching the table.  :class:`UniformIndex` divides the energy range of a
+table into uniform buckets, narrower than the smallest row spacing, and
+stores the row at the start of each bucket.  The row of any energy is then
+found by direct indexing and at most one comparison, and the limits are
+interpolated between the original rows.  The table is not resampled, so the
+lookup has no interpolation error beyond rounding.
+
+The generated IOC header and PLC code include these indices when asked for
+uniform lookups, see :func:`transfocate.table.codegen.generate`.
+"""
+import numpy as np
+
+# Bucket width as a fraction of the smallest row spacing.  Less than 1 so
+# that rounding of the bucket position never skips over a row.
+BUCKET_FRACTION = 0.5
+
+# The bucket rows are emitted as 16-bit integers
+MAX_ROWS = np.iinfo(np.int16).max
+
+
+class UniformIndex:
+    """
+    Index of the rows of a table on a uniform energy grid.
+
+    Parameters
+    ----------
+    energy : array_like
+        Strictly increasing tabulated energies [eV].
+    step : float, optional
+        Bucket width [eV].  Defaults to :data:`BUCKET_FRACTION` of the
+        smallest row spacing, and must be smaller than that spacing.
+
+    Attributes
+    ----------
+    start : float
+        Energy of the first row [eV].
+    step : float
+        Bucket width [eV].
+    rows : np.ndarray
+        Row starting each bucket, between 0 and the second to last row.
+    """
+
+    def __init__(self, energy, step=None):
+        self.energy = np.asarray(energy, dtype=float)
+        if len(self.energy) < 2:
+            raise ValueError("A table needs at least 2 rows")
+        if len(self.energy) > MAX_ROWS:
+            raise ValueError(f"Tables are limited to {MAX_ROWS} rows")
+        spacing = np.diff(self.energy).min()
+        if spacing <= 0.0:
+            raise ValueError("Table energies must be strictly increasing")
+        if step is None:
+            step = BUCKET_FRACTION * spacing
+        elif step >= spacing:
+            raise ValueError(
+                f"Bucket width {step} must be less than the row spacing {spacing}"
+            )
+        self.start = float(self.energy[0])
+        self.step = float(step)
+        num_buckets = int(np.ceil((self.energy[-1] - self.start) / self.step)) + 1
+        bucket_start = self.start + self.step * np.arange(num_buckets)
+        rows = np.searchsorted(self.energy, bucket_start, side="right") - 1
+        self.rows = np.clip(rows, 0, len(self.energy) - 2).astype(np.int16)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def inverse_step(self):
+        """Number of buckets per eV."""
+        return 1.0 / self.step
+
+    def locate(self, energy):
+        """
+        Row at or below each energy, as the generated code finds it.
+
+        Parameters
+        ----------
+        energy : float or array_like
+            Photon energy [eV], within the range of the table.
+
+        Returns
+        -------
+        np.ndarray
+            Row index, between 0 and the second to last row.
+        """
+        energy = np.asarray(energy, dtype=float)
+        position = (energy - self.start) * self.inverse_step
+        bucket = np.clip(np.nan_to_num(position), 0, len(self.rows) - 1)
+        row = self.rows[bucket.astype(np.intp)].astype(np.intp)
+        last = len(self.energy) - 1
+        below = (row > 0) & (energy < self.energy[row])
+        above = ~below & (row < last - 1) & (energy >= self.energy[
+            np.minimum(row + 1, last)])
+        return row - below + above
+
+    def interpolate(self, energy, values):
+        """
+        Interpolate tabulated values, using the first or last row outside of
+        the table.
+
+        This is equivalent to :func:`numpy.interp`, up to rounding.
+
+        Parameters
+        ----------
+        energy : float or array_like
+            Photon energy [eV].
+        values : array_like
+            Value of each row.
+
+        Returns
+        -------
+        np.ndarray
+        """
+        energy = np.clip(np.asarray(energy, dtype=float),
+                         self.energy[0], self.energy[-1])
+        values = np.asarray(values, dtype=float)
+        row = self.locate(energy)
+        slope = (values[row + 1] - values[row]) / (
+            self.energy[row + 1] - self.energy[row]
+        )
+        return slope * (energy - self.energy[row]) + values[row]
+
+    def max_error(self, values, energy=None):
+        """
+        Largest difference from :func:`numpy.interp` of the original table.
+
+        Parameters
+        ----------
+        values : array_like
+            Value of each row.
+        energy : array_like, optional
+            Energies to check.  Defaults to every row, the midpoints between
+            rows, every bucket edge and points beyond the table.
+
+        Returns
+        -------
+        float
+        """
+        if energy is None:
+            edges = self.start + self.step * np.arange(len(self.rows) + 1)
+            midpoints = (self.energy[:-1] + self.energy[1:]) / 2
+            energy = np.concatenate([
+                self.energy, midpoints, edges, np.nextafter(edges, -np.inf),
+                [self.energy[0] - 1.0, self.energy[-1] + 1.0],
+            ])
+        expected = np.interp(energy, self.energy, values)
+        return float(np.max(np.abs(self.interpolate(energy, values) - expected)))
+
+
+def uniform_indices(tables, step=None, rtol=1e-12):
+    """
+    Build and verify the :class:`UniformIndex` of each table.
+
+    Parameters
+    ----------
+    tables : dict
+        Table for each region name.
+    step : float, optional
+        Bucket width [eV].  Defaults to a width per table.
+    rtol : float, optional
+        Allowed difference from the interpolated table, relative to the
+        largest value of the table.  Only rounding differences are expected.
+
+    Returns
+    -------
+    dict
+        :class:`UniformIndex` for each region name.
+
+    Raises
+    ------
+    ValueError
+        If a table cannot be indexed, or its lookups differ from the
+        interpolated table.
+    """
+    indices = {}
+    for name, df in tables.items():
+        index = UniformIndex(df.energy.to_numpy(dtype=float), step=step)
+        for column in ("trip_min", "trip_max"):
+            values = df[column].to_numpy(dtype=float)
+            error = index.max_error(values)
+            if error > rtol * np.max(np.abs(values)):
+                raise ValueError(
+                    f"Uniform lookup of {name} {column} differs from the "
+                    f"table by {error}"
+                )
+        indices[name] = index
+    return indices
+
+
+def run_lengths(values):
+    """
+    Compress values into ``(count, value)`` runs.
+
+    Parameters
+    ----------
+    values : array_like
+        Values to compress.
+
+    Returns
+    -------
+    list of tuple
+    """
+    values = np.asarray(values)
+    if not len(values):
+        return []
+    starts = np.flatnonzero(np.diff(values)) + 1
+    starts = np.concatenate([[0], starts])
+    counts = np.diff(np.append(starts, len(values)))
+    return [(int(count), values[start].item())
+            for count, start in zip(counts, starts)]
@@ -1,6 +1,9 @@
 import pytest
+from bluesky import RunEngine
+from bluesky.utils import DuringTask
 from ophyd.sim import make_fake_device
 
+from .. import checkout
 from ..lens import Lens, LensConnect
 
 
@@ -24,6 +27,42 @@ class FakeLens:
 SynLens = make_fake_device(Lens)
 
 
+@pytest.fixture(scope='session', autouse=True)
+def cache_dir(tmp_path_factory):
+    # Keep on-disk caches out of the home directory of the user
+    with pytest.MonkeyPatch.context() as mp:
+        path = tmp_path_factory.mktemp('cache')
+        mp.setenv('TRANSFOCATE_CACHE_DIR', str(path))
+        yield path
+
+
+@pytest.fixture
+def RE():
+    # Importing automated_checkout selects the Qt backend, which the default
+    # RunEngine would then try to use while waiting
+    return RunEngine({}, call_returns_result=True, during_task=DuringTask())
+
+
+@pytest.fixture
+def fake_checkout():
+    FakeCheckout = make_fake_device(checkout.LensInterlockCheckout)
+    device = FakeCheckout("MFX:LENS", name="checkout")
+    device.update_seq.sim_put(0)
+    for lens in device.lenses:
+        lens.state_bypass.sim_put(0)
+        lens.known_bypass.sim_put(1)
+
+    def advance(*args, **kwargs):
+        updates = device.update_seq.get() + checkout.SETTLE_UPDATES
+        device.update_seq.sim_put(updates)
+
+    # Every put is followed by enough PLC updates for it to settle
+    device.energy.subscribe(advance, run=False)
+    for lens in device.lenses:
+        lens.state_bypass.subscribe(advance, run=False)
+    return device
+
+
 @pytest.fixture(scope='module')
 def lens():
     lens = SynLens("TST:TFS:LENS:01:", name='Lens')
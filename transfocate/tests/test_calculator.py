@@ -2,6 +2,8 @@ import numpy as np
 import pytest
 
 from transfocate.calculator import Calculator
+from transfocate.lens import LensConnect
+from transfocate.table.faults import predict_faults
 
 from .conftest import FakeLens
 
@@ -58,3 +60,39 @@ def test_calculator_find_combinations(calculator):
     assert combo.nlens == 5
     assert np.isclose(69.76, combo.effective_radius, atol=0.1)
     assert np.isclose(356.48, combo.image(0.0), atol=0.1)
+
+
+def test_calculator_interlock(calculator):
+    energy = 9000.0
+    combos = calculator.combinations()
+    allowed = calculator.allowed(combos, energy)
+    assert allowed.any() and not allowed.all()
+    combo = calculator.find_solution(318.5, energy=energy)
+    assert combo is not None
+    assert calculator.allowed([combo], energy).all()
+    # The best combination without the interlock is not allowed
+    best = calculator.find_solution(318.5)
+    assert not calculator.allowed([best], energy).all()
+    # Below the minimum energy of every pre-focus lens
+    assert calculator.find_solution(312.5, energy=5000.0) is None
+
+
+def test_calculator_interlock_vectorized(calculator):
+    energy = 9000.0
+    combos = calculator.combinations()
+    # Compare against checking the combinations one at a time
+    expected = []
+    for combo in combos:
+        xrt = [lens for lens in calculator.xrt_lenses if lens in combo.lenses]
+        tfs = [lens for lens in combo.lenses if lens not in xrt]
+        xrt_index = calculator.xrt_lenses.index(xrt[0]) + 1 if xrt else 0
+        faults = predict_faults(energy, xrt_index,
+                                LensConnect(*tfs).effective_radius)
+        expected.append(not faults['violated'])
+    assert list(calculator.allowed(combos, energy)) == expected
+    # The solution is the best allowed combination with few enough lenses
+    allowed = [combo for combo, ok in zip(combos, expected)
+               if ok and combo.nlens <= 2]
+    best = min(allowed, key=lambda combo: abs(combo.image(0.0) - 318.5))
+    combo = calculator.find_solution(318.5, n=2, energy=energy)
+    assert sorted(map(id, combo.lenses)) == sorted(map(id, best.lenses))
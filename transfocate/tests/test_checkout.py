@@ -0,0 +1,319 @@
+import logging
+import threading
+import time
+
+import bluesky.plan_stubs as bps
+import numpy as np
+import ophyd
+import pytest
+from ophyd.sim import SynSignal
+
+from transfocate import checkout
+from transfocate.checkout import (DEFAULT_RADIUS_TARGETS, boundary_radii,
+                                  select_lens_sets, unique_lens_sets)
+from transfocate.combinations import bits_to_mask, effective_radius
+from transfocate.scan_data import ScanDataWriter, read_scan_data
+from transfocate.table.info import tfs_lens_radii
+from transfocate.table.interpolate import default_tables, find_limits
+
+
+def lens_set_radius(lens_sets):
+    return effective_radius(tfs_lens_radii, bits_to_mask(lens_sets))
+
+
+def test_unique_lens_sets():
+    masks, radii = unique_lens_sets()
+    assert np.all(np.diff(radii) > 0)
+    assert np.allclose(radii, effective_radius(tfs_lens_radii, masks))
+    # Only one of the three identical 50um lenses is needed
+    assert masks[np.isclose(radii, 50.0)].tolist() == [1 << 6]
+
+
+def test_select_lens_sets_default():
+    lens_sets = select_lens_sets(DEFAULT_RADIUS_TARGETS)
+    assert lens_sets[0] == [0] * len(tfs_lens_radii)
+    radii = lens_set_radius(lens_sets[1:])
+    assert np.allclose(radii, DEFAULT_RADIUS_TARGETS, atol=0.01)
+
+
+def test_select_lens_sets_tolerance():
+    targets = np.geomspace(15.0, 150.0, 200)
+    lens_sets = select_lens_sets(targets, rtol=0.05, include_empty=False)
+    radii = lens_set_radius(lens_sets)
+    # Every target is covered by a selected lens set
+    ratio = np.abs(np.log(targets[:, None] / radii[None, :])).min(axis=1)
+    assert np.all(ratio <= np.log(1.05) + 1e-9)
+    assert len(lens_sets) < len(unique_lens_sets()[0]) / 2
+
+
+def test_select_lens_sets_boundaries():
+    lens_sets = select_lens_sets(rtol=0.1)
+    radii = lens_set_radius(lens_sets[1:])
+    boundaries = boundary_radii()
+    assert boundaries.min() >= radii.min() / 1.1
+    assert boundaries.max() <= radii.max() * 1.1
+
+
+def test_select_lens_sets_unreachable(caplog):
+    # Targets between and beyond the available effective radii
+    targets = np.geomspace(1.0, 5.0, 50)
+    with caplog.at_level(logging.WARNING):
+        lens_sets = select_lens_sets(targets, rtol=0.01, include_empty=False)
+    assert len(lens_sets) >= 1
+    warnings = [record for record in caplog.records
+                if record.levelno == logging.WARNING]
+    assert len(warnings) == 1
+    assert '50 radius target(s)' in warnings[0].getMessage()
+
+
+def test_energy_breakpoints():
+    tables = default_tables()
+    radius = 100.0
+    breakpoints = checkout.energy_breakpoints(3, radius)
+    assert checkout.MIN_ENERGY[3] in breakpoints
+    for edge in checkout.REQUIRES_LENS_RANGE[3]:
+        assert edge in breakpoints
+    # Each trip limit crossing is at the effective radius
+    low, high = find_limits(breakpoints, 3, tables=tables)
+    crossings = np.isclose(low, radius) | np.isclose(high, radius)
+    assert crossings.sum() >= len(breakpoints) - 3
+
+
+def test_adaptive_energies():
+    energies = checkout.adaptive_energies(3, 100.0, 10, width=100.0)
+    assert np.all(np.diff(energies) > 0)
+    assert energies[0] >= 0.0 and energies[-1] <= 38000.0
+    for breakpoint in checkout.energy_breakpoints(3, 100.0):
+        distance = np.abs(energies - breakpoint)
+        assert 0.0 < distance.min() <= 100.0 / 4
+    # Far fewer points than a uniform grid of the same resolution
+    assert len(energies) < 38000.0 / 100.0
+
+
+def test_sweep_energies():
+    np.testing.assert_array_equal(checkout.sweep_energies(0, 0.0, 5),
+                                  np.linspace(0.0, 38000.0, 5))
+    energies = checkout.sweep_energies(0, 0.0, 39, energy_ranges=[
+        (1000.0, 3000.0), (2000.0, 2500.0), (10000.0, 10001.0)
+    ])
+    # The density of the full sweep, with at least 2 steps per range
+    assert energies.tolist() == [1000.0, 2000.0, 2500.0, 3000.0, 10000.0, 10001.0]
+    adaptive = checkout.sweep_energies(3, 100.0, 39, adaptive=True,
+                                       energy_ranges=[(9000.0, 12000.0)])
+    assert adaptive.min() >= 9000.0 and adaptive.max() <= 12000.0
+    assert len(adaptive) > 4
+    assert len(checkout.sweep_energies(0, 0.0, 10, energy_ranges=[])) == 0
+
+
+def test_adaptive_energy_scan(RE):
+    energy = ophyd.Signal(name="energy", value=0.0)
+    faulted = SynSignal(
+        func=lambda: int(energy.get() > 1234.0), name="faulted"
+    )
+
+    def plan():
+        yield from bps.open_run()
+        results = yield from checkout.adaptive_energy_scan(
+            [energy, faulted], energy, [0.0, 1000.0, 2000.0, 3000.0], faulted,
+            refine=6,
+        )
+        yield from bps.close_run()
+        return results
+
+    results = RE(plan()).plan_result
+    scanned = [point for point, _ in results]
+    assert scanned == sorted(scanned)
+    assert len(results) == 4 + 6
+    for point, fault in results:
+        assert fault == (point > 1234.0)
+    below = max(point for point, fault in results if not fault)
+    above = min(point for point, fault in results if fault)
+    assert above - below == pytest.approx(1000.0 / 2 ** 6)
+
+
+def test_adaptive_energy_scan_initial(RE):
+    energy = ophyd.Signal(name="energy", value=0.0)
+    faulted = SynSignal(
+        func=lambda: int(energy.get() > 1234.0), name="faulted"
+    )
+    scanned = []
+
+    def plan():
+        yield from bps.open_run()
+        # The points read before an interruption are not read again
+        results = yield from checkout.adaptive_energy_scan(
+            [energy, faulted], energy, [2000.0, 3000.0], faulted, refine=6,
+            callback=lambda point, fault: scanned.append(point),
+            initial=[(1000.0, False), (0.0, False)],
+        )
+        yield from bps.close_run()
+        return results
+
+    results = RE(plan()).plan_result
+    assert len(scanned) == 2 + 6
+    assert results[:2] == [(0.0, False), (1000.0, False)]
+    below = max(point for point, fault in results if not fault)
+    above = min(point for point, fault in results if fault)
+    assert above - below == pytest.approx(1000.0 / 2 ** 6)
+
+
+def test_wait_for_update(RE):
+    sequence = ophyd.Signal(name="update_seq", value=10)
+
+    def advance():
+        for value in (11, 12):
+            time.sleep(0.05)
+            sequence.put(value)
+
+    def plan():
+        since = yield from bps.rd(sequence)
+        threading.Thread(target=advance).start()
+        yield from checkout.wait_for_update(sequence, since, timeout=2.0)
+
+    t0 = time.monotonic()
+    RE(plan())
+    assert sequence.get() == 12
+    assert time.monotonic() - t0 < 1.0
+
+
+def test_wait_for_update_timeout(RE):
+    sequence = ophyd.Signal(name="update_seq", value=10)
+    with pytest.raises(TimeoutError):
+        RE(checkout.wait_for_update(sequence, 10, timeout=0.1))
+
+
+def test_wait_for_update_timeout_returns(RE, monkeypatch):
+    # Older bluesky releases return from wait_for when the timeout expires
+    def wait_for(futures, timeout=None, **kwargs):
+        yield from bps.sleep(timeout)
+
+    monkeypatch.setattr(checkout.bps, 'wait_for', wait_for)
+    sequence = ophyd.Signal(name="update_seq", value=10)
+    with pytest.raises(TimeoutError, match="update_seq"):
+        RE(checkout.wait_for_update(sequence, 10, timeout=0.1))
+
+
+def test_set_lens_state_batched(RE, fake_checkout):
+    device = fake_checkout
+    messages = []
+
+    def count_sets(msg):
+        if msg.command == "set":
+            messages.append(msg)
+
+    RE.msg_hook = count_sets
+    RE(device.set_lens_state(1, [1, 0, 0, 0, 0, 0, 0, 0, 1]))
+    # Only the three changed lenses are written, in a single group
+    assert len(messages) == 3
+    assert len({msg.kwargs["group"] for msg in messages}) == 1
+    assert device.xrt_01.state_bypass.get() == 1
+    assert device.tfs_02.state_bypass.get() == 1
+    assert device.tfs_10.state_bypass.get() == 1
+
+    messages.clear()
+    RE(device.set_lens_state(1, [1, 0, 0, 0, 0, 0, 0, 0, 1]))
+    assert not messages
+
+
+def test_sweep_checkpoint(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    checkpoint = checkout.SweepCheckpoint(path, commit_every=3)
+    checkpoint.record(1, 5, 1000.0, False)
+    checkpoint.record(1, 5, 2000.0001, True)
+    checkpoint.mark_complete(1, 5)
+    checkpoint.mark_complete(2, 3)
+    # Points are recorded every commit_every within a lens set
+    for energy in (1000.0, 2000.0, 3000.0, 4000.0):
+        checkpoint.record(1, 6, energy)
+    checkpoint.set_result(0, "lens_0.parquet")
+    # An entry cut short by an interruption
+    with open(path, "a") as fp:
+        fp.write('{"xrt_lens": 1, "tfs_ma')
+
+    checkpoint = checkout.SweepCheckpoint(path)
+    assert checkpoint.is_done(1, 5, 2000.0)
+    assert not checkpoint.is_done(1, 4, 2000.0)
+    assert checkpoint.is_done(1, 6, 3000.0)
+    assert not checkpoint.is_done(1, 6, 4000.0)
+    assert checkpoint.remaining(1, 5, [1000.0, 2000.0, 3000.0]) == [3000.0]
+    assert checkpoint.results(1, 5) == [(1000.0, False), (2000.0, True)]
+    assert checkpoint.results(1, 6) == []
+    assert checkpoint.is_complete(2, 3)
+    assert checkpoint.is_complete(1, 5)
+    assert not checkpoint.is_complete(1, 6)
+    assert checkpoint.result(0) == "lens_0.parquet"
+    assert checkpoint.result(1) is None
+
+    checkpoint.clear()
+    assert not path.exists()
+    assert not checkpoint.is_done(1, 5, 2000.0)
+
+
+def test_sweep_energy_plan_resume(RE, tmp_path, fake_checkout):
+    # Only read, so no need for a full transfocator
+    tfs = SynSignal(func=lambda: 0.0, name="tfs_radius")
+    lens_sets = [[0] * 9, [1] + [0] * 8]
+    checkpoint = checkout.SweepCheckpoint(tmp_path / "checkpoint.jsonl",
+                                          commit_every=2)
+    # The first lens set finished, and the second was interrupted part way
+    checkpoint.mark_complete(0, 0)
+    checkpoint.record(0, 1, 0.0)
+    checkpoint.record(0, 1, 9500.0)
+    checkpoint.record(0, 1, 19000.0)
+    checkpoint = checkout.SweepCheckpoint(tmp_path / "checkpoint.jsonl")
+
+    events = []
+    RE(
+        checkout.sweep_energy_plan(
+            tfs, fake_checkout, 0, 5, tfs_lens_combinations=lens_sets,
+            checkpoint=checkpoint,
+        ),
+        lambda name, doc: events.append(doc) if name == "event" else None,
+    )
+    # Only the uncommitted points of the interrupted lens set are read again
+    energies = [event["data"]["checkout_energy"] for event in events]
+    assert energies == [19000.0, 28500.0, 38000.0]
+    assert checkpoint.is_complete(0, 1)
+    assert checkpoint.remaining(0, 1, np.linspace(0, 38000, 5)) == []
+
+
+def test_sweep_energy_plan_crash(RE, tmp_path, fake_checkout):
+    tfs = SynSignal(func=lambda: 0.0, name="tfs_radius")
+    lens_sets = [[0] * 9, [1] + [0] * 8]
+    path = tmp_path / "sweep.parquet"
+    checkpoint = checkout.SweepCheckpoint(tmp_path / "checkpoint.jsonl",
+                                          commit_every=2)
+    checkpoint.writer = ScanDataWriter(path, fields=["checkout_energy"],
+                                       batch_size=2, keep_failed=False)
+
+    class Crash(Exception):
+        pass
+
+    def crash(name, doc):
+        # Fail part way through the second lens set
+        if name == "event" and checkpoint.is_complete(0, 0) and doc["seq_num"] == 8:
+            raise Crash()
+
+    plan = checkout.sweep_energy_plan(tfs, fake_checkout, 0, 5,
+                                      tfs_lens_combinations=lens_sets,
+                                      checkpoint=checkpoint)
+    with pytest.raises(Crash):
+        RE(plan, [checkpoint.writer, crash])
+    # The completed lens set and the committed points of the other are
+    # readable and recorded
+    assert len(read_scan_data(path)) == 7
+    checkpoint = checkout.SweepCheckpoint(tmp_path / "checkpoint.jsonl")
+    assert checkpoint.is_complete(0, 0)
+    assert not checkpoint.is_complete(0, 1)
+    remaining = checkpoint.remaining(0, 1, np.linspace(0, 38000, 5))
+    assert remaining == [19000.0, 28500.0, 38000.0]
+
+    checkpoint.writer = ScanDataWriter(path, fields=["checkout_energy"],
+                                       append=True, keep_failed=False)
+    RE(checkout.sweep_energy_plan(tfs, fake_checkout, 0, 5,
+                                  tfs_lens_combinations=lens_sets,
+                                  checkpoint=checkpoint),
+       checkpoint.writer)
+    df = read_scan_data(path)
+    assert df.checkout_energy.tolist() == 2 * [0.0, 9500.0, 19000.0, 28500.0,
+                                               38000.0]
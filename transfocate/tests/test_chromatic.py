@@ -0,0 +1,127 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from transfocate.chromatic import (ChromaticTable, CombinationTable,
+                                   focal_length)
+from transfocate.combinations import combination_index
+from transfocate.lens import LensConnect
+
+from .conftest import FakeLens
+
+ENERGY = 9500.0
+
+
+def make_lenses(energy):
+    xrt = [FakeLens(radius, 100.0, focal_length(radius, energy))
+           for radius in (750.0, 428.6)]
+    tfs = [FakeLens(radius, z, focal_length(radius, energy))
+           for radius, z in ((500.0, 300.0), (250.0, 301.0), (125.0, 302.5))]
+    return xrt, tfs
+
+
+@pytest.fixture(scope='function')
+def lenses():
+    return make_lenses(ENERGY)
+
+
+def test_focal_length():
+    # 500um beryllium lens at 9.5 keV
+    assert np.isclose(focal_length(500.0, 9500.0), 66.26, atol=0.01)
+    # Focal length scales with the square of the energy
+    assert np.isclose(focal_length(500.0, 19000.0),
+                      4 * focal_length(500.0, 9500.0))
+
+
+def test_combination_table_matches_lens_connect(lenses):
+    xrt, tfs = lenses
+    table = CombinationTable.from_lenses(xrt, tfs)
+    assert len(table) == 3 * 8
+    images = table.image(ENERGY)
+    for idx in range(len(table)):
+        combo = table.to_lens_connect(idx, xrt, tfs)
+        assert combination_index(xrt, tfs, combo.lenses) == idx
+        assert table.nlens[idx] == combo.nlens
+        assert np.isclose(table.effective_radius[idx], combo.effective_radius)
+        assert np.isclose(images[idx], combo.image(0.0))
+
+
+def test_combination_table_cached(lenses):
+    xrt, tfs = lenses
+    table = CombinationTable.from_lenses(xrt, tfs)
+    assert CombinationTable.from_lenses(*make_lenses(5000.)) is table
+    tfs[0].z = 310.0
+    assert CombinationTable.from_lenses(xrt, tfs) is not table
+
+
+def test_chromatic_table_best_combo(lenses):
+    xrt, tfs = lenses
+    table = ChromaticTable.from_lenses(xrt, tfs, np.linspace(5e3, 20e3, 151))
+    assert table.image.shape == (24, 151)
+    # Compare against an exhaustive search at this energy
+    target = 330.0
+    best = min((LensConnect(x, *combo)
+                for x in xrt
+                for i in range(1, len(tfs) + 1)
+                for combo in itertools.combinations(tfs, i)),
+               key=lambda combo: abs(combo.image(0.0) - target))
+    index, residual = table.best_combo(ENERGY, target)
+    assert index == combination_index(xrt, tfs, best.lenses)
+    assert np.isclose(residual, abs(best.image(0.0) - target))
+    # Vectorized over energies, on and off the grid
+    energies = [ENERGY, 2 * ENERGY, 12345.6]
+    indices, residuals = table.best_combo(energies, target)
+    assert indices[0] == index
+    assert residuals.shape == (3,)
+    candidates = table.combinations.candidates()
+    for energy, index, residual in zip(energies, indices, residuals):
+        image = table.combinations.image(energy)
+        distance = np.abs(image[candidates] - target)
+        assert np.isclose(residual, np.nanmin(distance))
+        assert np.isclose(residual, abs(image[index] - target))
+
+
+def test_chromatic_table_uses_grid(lenses, monkeypatch):
+    xrt, tfs = lenses
+    table = ChromaticTable.from_lenses(xrt, tfs, np.linspace(5e3, 20e3, 151))
+    expected = table.best_combo(table.energies[40], 330.0)
+    column = table.image[:, 40].copy()
+
+    def image(energy):
+        raise AssertionError("Recomputed an image on the grid")
+
+    monkeypatch.setattr(table.combinations, 'image', image)
+    assert np.array_equal(table.image_at(table.energies[40]), column)
+    assert table.best_combo(table.energies[40], 330.0) == expected
+
+
+def test_chromatic_table_energy_range(lenses):
+    xrt, tfs = lenses
+    table = ChromaticTable.from_lenses(xrt, tfs, np.linspace(5e3, 20e3, 301))
+    index, _ = table.best_combo(ENERGY, 330.0)
+    # Use the exact image of the combination as the target
+    target = table.combinations.image(ENERGY)[index]
+    ranges = table.energy_range(index, target, 1.0)
+    assert any(low <= ENERGY <= high for low, high in ranges)
+    for low, high in ranges:
+        assert low <= high
+        for energy in (low, high):
+            image = table.combinations.image(energy)[index]
+            assert abs(image - target) == pytest.approx(1.0, abs=0.05) \
+                or energy in (5e3, 20e3)
+
+
+def test_combination_table_disk_cache(lenses, cache_dir):
+    xrt, tfs = lenses
+    table = CombinationTable.from_lenses(xrt, tfs)
+    # Tables are shared read-only through the on-disk cache
+    assert isinstance(table.coefficients, np.memmap)
+    assert (cache_dir / 'combinations-v1' / table.geometry_hash).is_dir()
+    computed = CombinationTable(table.xrt_geometry, table.tfs_geometry)
+    loaded = CombinationTable.load(cache_dir / 'combinations-v1'
+                                   / table.geometry_hash, mmap=False)
+    for name in CombinationTable._cache_arrays:
+        assert np.array_equal(getattr(loaded, name), getattr(computed, name))
+    assert loaded.z_ref == computed.z_ref
+    assert np.allclose(loaded.image(ENERGY), computed.image(ENERGY))
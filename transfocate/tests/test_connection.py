@@ -0,0 +1,64 @@
+import time
+
+import ophyd
+import pytest
+from ophyd import Component as Cpt
+
+from transfocate.connection import connect_devices, slowest_signals
+
+
+class SlowSignal(ophyd.Signal):
+    """Signal which connects a set time after creation, or never."""
+
+    delay = 0.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._created = time.monotonic()
+
+    @property
+    def connected(self):
+        return time.monotonic() - self._created >= self.delay
+
+
+class DelayedSignal(SlowSignal):
+    delay = 0.15
+
+
+class NeverSignal(SlowSignal):
+    delay = float("inf")
+
+
+class Fast(ophyd.Device):
+    a = Cpt(SlowSignal)
+    b = Cpt(SlowSignal)
+
+
+class Delayed(ophyd.Device):
+    a = Cpt(SlowSignal)
+    b = Cpt(DelayedSignal)
+
+
+class Broken(ophyd.Device):
+    a = Cpt(NeverSignal)
+
+
+def test_connect_devices():
+    fast, delayed = Fast(name="fast"), Delayed(name="delayed")
+    report = connect_devices([fast, delayed], timeout=1.0)
+    assert report.connected.all()
+    assert report.signal.tolist() == ["fast_a", "fast_b", "delayed_a", "delayed_b"]
+    slow = report.set_index("signal").loc["delayed_b"]
+    assert 0.15 <= slow.latency < 0.5
+    assert (report.latency[:3] < slow.latency).all()
+    assert slowest_signals(report, count=1).signal.tolist() == ["delayed_b"]
+
+
+def test_connect_devices_failure():
+    devices = [Fast(name="fast"), Broken(name="broken")]
+    with pytest.raises(TimeoutError, match="broken_a"):
+        connect_devices(devices, timeout=0.02)
+
+    report = connect_devices(devices, timeout=0.02, raise_on_failure=False)
+    assert report.connected.tolist() == [True, True, False]
+    assert slowest_signals(report, count=1).signal.tolist() == ["broken_a"]
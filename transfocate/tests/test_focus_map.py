@@ -0,0 +1,94 @@
+import logging
+
+import numpy as np
+import pytest
+
+from transfocate.chromatic import ChromaticTable
+from transfocate.focus_map import FocusMap, build_focus_map
+
+from .test_chromatic import ENERGY, make_lenses
+from .test_transfocate import make_fake_transfocator
+
+ENERGIES = np.linspace(8000, 12000, 9)
+TARGETS = np.linspace(310, 350, 21)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_build_focus_map(tmp_path, processes):
+    xrt, tfs = make_lenses(ENERGY)
+    path = tmp_path / 'focus_map.npy'
+    focus_map = build_focus_map(path, xrt, tfs, ENERGIES, TARGETS,
+                                processes=processes)
+    assert isinstance(focus_map.cells, np.memmap)
+    assert focus_map.cells.shape == (len(ENERGIES), len(TARGETS))
+    table = ChromaticTable.from_lenses(xrt, tfs, ENERGIES)
+    energy, target = np.meshgrid(ENERGIES, TARGETS, indexing='ij')
+    expected, residual = table.best_combo(energy, target)
+    combo, found = FocusMap.load(path).lookup(energy, target)
+    assert np.all(combo == expected)
+    assert np.allclose(found, residual, rtol=1e-5)
+    # Off-grid lookups use the nearest cell
+    assert focus_map.lookup(8010., 311.)[0] == expected[0, 0]
+    assert expected[0, 0] in focus_map.neighbours(8010., 311.)
+
+
+def test_focus_map_outside(tmp_path, caplog):
+    xrt, tfs = make_lenses(ENERGY)
+    focus_map = build_focus_map(tmp_path / 'focus_map.npy', xrt, tfs,
+                                ENERGIES, TARGETS, processes=1)
+    assert focus_map.covers(ENERGIES[0], TARGETS[-1])
+    assert not focus_map.covers(20000., 330.)
+    assert not focus_map.covers(ENERGY, 400.)
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        focus_map.lookup(ENERGY, 330.)
+    assert not caplog.records
+    with caplog.at_level(logging.WARNING):
+        focus_map.lookup([ENERGY, 20000.], 330.)
+    assert 'outside of the focus map' in caplog.text
+
+
+def test_transfocator_focus_map(tmp_path):
+    transfocator = make_fake_transfocator()
+    path = tmp_path / 'focus_map.npy'
+    build_focus_map(path, transfocator.xrt_lenses, transfocator.tfs_lenses,
+                    ENERGIES, TARGETS, processes=1)
+    transfocator.load_focus_map(path)
+    combo = transfocator.find_best_combo(330.0, energy=ENERGY)
+    index, _ = transfocator.focus_map.lookup(ENERGY, 330.0)
+    expected = transfocator.focus_map.combinations.to_lens_connect(
+        index, transfocator.xrt_lenses, transfocator.tfs_lenses)
+    assert combo.lenses == expected.lenses
+    # Refinement picks the best neighbour using the current focal lengths
+    refined = transfocator.find_best_combo(330.0, energy=ENERGY, refine=True)
+    assert abs(refined.image(0.0) - 330.0) <= abs(combo.image(0.0) - 330.0)
+    # Energies outside of the map are calculated instead of clamped
+    calculated = transfocator.find_best_combo(330.0, energy=20000.0)
+    transfocator.focus_map = None
+    direct = transfocator.find_best_combo(330.0, energy=20000.0)
+    assert calculated.lenses == direct.lenses
+
+
+def test_transfocator_focus_map_no_combo(tmp_path):
+    transfocator = make_fake_transfocator()
+    path = tmp_path / 'focus_map.npy'
+    build_focus_map(path, transfocator.xrt_lenses, transfocator.tfs_lenses,
+                    ENERGIES, TARGETS, processes=1)
+    transfocator.load_focus_map(path)
+    # Cells without a finite residual are calculated instead
+    cells = np.array(transfocator.focus_map.cells)
+    cells['combo'] = -1
+    transfocator.focus_map.cells = cells
+    combo = transfocator.find_best_combo(330.0, energy=ENERGY)
+    transfocator.focus_map = None
+    direct = transfocator.find_best_combo(330.0, energy=ENERGY)
+    assert combo is not None
+    assert combo.lenses == direct.lenses
+
+
+def test_transfocator_focus_map_geometry(tmp_path):
+    transfocator = make_fake_transfocator()
+    path = tmp_path / 'focus_map.npy'
+    build_focus_map(path, *make_lenses(ENERGY), ENERGIES, TARGETS, processes=1)
+    with pytest.raises(ValueError):
+        transfocator.load_focus_map(path)
@@ -0,0 +1,72 @@
+import threading
+
+import numpy as np
+import ophyd
+import pandas as pd
+import pytest
+
+from transfocate.latency import interlock_latency_plan, latency_statistics
+
+# Time for the simulated PLC to update the fault after an energy change
+RESPONSE = 0.03
+
+
+@pytest.fixture
+def fake_plc(fake_checkout):
+    """Fault signal responding to the bypass energy, with a PLC cycling."""
+    faulted = ophyd.Signal(name="faulted", value=0)
+    unchanged = ophyd.Signal(name="unchanged", value=0)
+    stop = threading.Event()
+
+    def respond(value, **kwargs):
+        fault = int(value < 10000.0)
+        threading.Timer(RESPONSE, faulted.put, (fault,)).start()
+
+    def cycle():
+        while not stop.wait(0.005):
+            fake_checkout.plc_cycles.sim_put(fake_checkout.plc_cycles.get() + 1)
+            fake_checkout.update_seq.sim_put(fake_checkout.update_seq.get() + 1)
+
+    fake_checkout.plc_cycles.sim_put(0)
+    fake_checkout.energy.subscribe(respond, run=False)
+    thread = threading.Thread(target=cycle, daemon=True)
+    thread.start()
+    yield fake_checkout, faulted, unchanged
+    stop.set()
+    thread.join()
+
+
+def test_interlock_latency_plan(RE, fake_plc):
+    checkout, faulted, unchanged = fake_plc
+    states = [dict(energy=5000.0), dict(energy=20000.0)]
+    samples = RE(
+        interlock_latency_plan(checkout, [faulted, unchanged], states, num=3,
+                               timeout=0.2)
+    ).plan_result
+    assert len(samples) == 3 * 2 * 2
+    changed = samples[samples.signal == "faulted"]
+    assert changed.latency.min() >= RESPONSE
+    assert changed.latency.max() < 0.2
+    assert (changed.plc_cycles > 0).all()
+    assert samples[samples.signal == "unchanged"].latency.isna().all()
+
+    stats = latency_statistics(samples)
+    assert stats.loc["faulted", "count"] == 6
+    assert stats.loc["faulted", "missed"] == 0
+    assert stats.loc["unchanged", "missed"] == 6
+    assert RESPONSE <= stats.loc["faulted", "p50"] <= stats.loc["faulted", "p99"]
+    assert stats.loc["faulted", "p99"] <= stats.loc["faulted", "max"]
+
+
+def test_latency_statistics_by_state():
+    samples = {
+        "signal": ["a"] * 4,
+        "state": [0, 1, 0, 1],
+        "latency": [0.1, 0.2, 0.3, np.nan],
+        "plc_cycles": [1, 2, 3, 4],
+    }
+    stats = latency_statistics(pd.DataFrame(samples), percentiles=(50,),
+                               by=("signal", "state"))
+    assert stats.loc[("a", 0), "p50"] == pytest.approx(0.2)
+    assert stats.loc[("a", 1), "missed"] == 1
+    assert stats.loc[("a", 1), "max"] == pytest.approx(0.2)
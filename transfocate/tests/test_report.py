@@ -0,0 +1,69 @@
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from transfocate.scan_data import METADATA_KEY
+from transfocate.table import report
+from transfocate.tests.test_table_reconcile import make_scan
+
+
+def write_scan(path, xrt_lens):
+    df = make_scan(xrt_lens)
+    df["state_fault"] = 0
+    df["xrt_radius"] = 0.0
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {METADATA_KEY: json.dumps({"time": 1.7e9, "uid": "uid"}).encode()}
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+
+
+@pytest.fixture
+def scans(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for prefix, scan_info in report.results.items():
+        write_scan(f"{prefix}.parquet", scan_info["xrt_lens"])
+    return list(report.results)
+
+
+def test_format_table():
+    df = make_scan(0).iloc[:2]
+    df["state_fault"] = 0
+    rows = report.format_table(df)
+    assert len(rows) == 2
+    assert rows[0][0] == "%.2f" % df.energy.iloc[0]
+    assert rows[0][list(report.table_fields).index("faulted")] == df.faulted.iloc[0]
+
+
+def test_generate_report_cached(scans, monkeypatch):
+    calls = []
+    reconcile = report.reconcile
+
+    def counting_reconcile(df, xrt_lens, **kwargs):
+        calls.append(xrt_lens)
+        return reconcile(df, xrt_lens, **kwargs)
+
+    monkeypatch.setattr(report, "reconcile", counting_reconcile)
+    report.generate_report("first.pdf", processes=1)
+    assert os.path.getsize("first.pdf") > 0
+    assert sorted(calls) == [0, 1, 2, 3]
+    for prefix in scans:
+        assert os.path.exists(f"{prefix}.png")
+
+    # Nothing changed, so everything comes from the cache
+    calls.clear()
+    report.generate_report("second.pdf", processes=1)
+    assert calls == []
+
+    # Only the rewritten scan is processed again
+    stat = os.stat(scans[2] + ".parquet")
+    write_scan(scans[2] + ".parquet", 2)
+    os.utime(scans[2] + ".parquet", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    report.generate_report("third.pdf", processes=1)
+    assert calls == [2]
+
+
+def test_generate_report_processes(scans):
+    report.generate_report("report.pdf", use_cache=False, processes=2)
+    assert os.path.getsize("report.pdf") > 0
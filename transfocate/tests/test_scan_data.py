@@ -0,0 +1,90 @@
+import os
+
+import bluesky.plans as bp
+import pytest
+from ophyd.sim import SynAxis, SynSignal
+
+from transfocate.scan_data import (ScanDataWriter, read_scan_data,
+                                   remove_scan_data, scan_metadata)
+
+
+@pytest.fixture
+def devices():
+    energy = SynAxis(name="energy")
+    faulted = SynSignal(func=lambda: int(energy.position > 500), name="faulted")
+    return energy, faulted
+
+
+def test_scan_data_writer(RE, tmp_path, devices):
+    energy, faulted = devices
+    path = tmp_path / "scan.parquet"
+    writer = ScanDataWriter(path, fields=["energy", "faulted"], batch_size=3)
+    (uid,) = RE(bp.scan([faulted], energy, 0, 1000, 11), writer).run_start_uids
+
+    assert not list(path.glob(".*.partial"))
+    assert writer.rows_written == 11
+    df = read_scan_data(path)
+    assert list(df.columns) == ["time", "seq_num", "energy", "faulted"]
+    assert df.energy.tolist() == [100.0 * step for step in range(11)]
+    assert df.faulted.tolist() == [0] * 6 + [1] * 5
+
+    df = read_scan_data(path, columns=["faulted"])
+    assert list(df.columns) == ["faulted"]
+
+    metadata = scan_metadata(path)
+    assert metadata["uid"] == uid
+    assert metadata["plan_name"] == "scan"
+    assert metadata["created"].year >= 2020
+
+
+def test_scan_data_writer_no_events(RE, tmp_path):
+    path = tmp_path / "scan.parquet"
+    RE(bp.count([], num=0), ScanDataWriter(path))
+    assert not path.exists()
+
+
+def test_scan_data_writer_append(RE, tmp_path, devices):
+    energy, faulted = devices
+    path = tmp_path / "scan.parquet"
+    RE(bp.scan([faulted], energy, 0, 400, 5), ScanDataWriter(path))
+    RE(bp.scan([faulted], energy, 600, 1000, 3), ScanDataWriter(path, append=True))
+    df = read_scan_data(path)
+    assert df.energy.tolist() == [0.0, 100.0, 200.0, 300.0, 400.0,
+                                  600.0, 800.0, 1000.0]
+    assert sorted(os.listdir(path)) == ["part-00000.parquet", "part-00001.parquet"]
+
+
+def test_scan_data_writer_replace(RE, tmp_path, devices):
+    energy, faulted = devices
+    path = tmp_path / "scan.parquet"
+    RE(bp.scan([faulted], energy, 0, 400, 5), ScanDataWriter(path))
+    RE(bp.scan([faulted], energy, 600, 1000, 3), ScanDataWriter(path))
+    assert read_scan_data(path).energy.tolist() == [600.0, 800.0, 1000.0]
+    assert os.listdir(path) == ["part-00001.parquet"]
+    remove_scan_data(path)
+    assert not path.exists()
+
+
+def test_scan_data_writer_commit(tmp_path):
+    path = tmp_path / "scan.parquet"
+    writer = ScanDataWriter(path, batch_size=1)
+    writer("start", {"uid": "abc", "time": 0.0})
+    writer("descriptor", {"uid": "d", "name": "primary", "data_keys": {}})
+    for seq_num in (1, 2):
+        writer("event", {"descriptor": "d", "time": 0.0, "seq_num": seq_num,
+                         "data": {"energy": 100.0 * seq_num}})
+    writer.commit()
+    first = path / "part-00000.parquet"
+    committed = os.stat(first)
+    writer("event", {"descriptor": "d", "time": 0.0, "seq_num": 3,
+                     "data": {"energy": 300.0}})
+    # Committed rows are readable while later ones are still in progress
+    assert read_scan_data(path).energy.tolist() == [100.0, 200.0]
+    assert os.path.exists(writer.partial_path)
+    writer("stop", {"run_start": "abc", "exit_status": "success"})
+    assert read_scan_data(path).energy.tolist() == [100.0, 200.0, 300.0]
+    assert not list(path.glob(".*.partial"))
+    # Later commits add part files, without rewriting the committed ones
+    assert sorted(os.listdir(path)) == ["part-00000.parquet", "part-00001.parquet"]
+    assert os.stat(first).st_mtime_ns == committed.st_mtime_ns
+    assert scan_metadata(path)["uid"] == "abc"
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from ophyd.sim import SynAxis
+
+from transfocate.chromatic import CombinationTable
+from transfocate.combinations import actuations
+from transfocate.schedule import focus_schedule_scan, plan_focus_schedule
+
+from .test_chromatic import ENERGY, make_lenses
+from .test_transfocate import insert, make_fake_transfocator
+
+ENERGIES = np.linspace(9000, 10000, 21)
+
+
+@pytest.fixture(scope='function')
+def transfocator():
+    return make_fake_transfocator()
+
+
+@pytest.fixture(scope='function')
+def combinations():
+    return CombinationTable.from_lenses(*make_lenses(ENERGY))
+
+
+def test_plan_focus_schedule(combinations):
+    target = combinations.image(ENERGY)[19]
+    schedule = plan_focus_schedule(combinations, ENERGIES, target, 5.0)
+    assert len(schedule) == len(ENERGIES)
+    # Every step is in focus
+    images = combinations.image(ENERGIES)
+    residuals = np.abs(images[schedule.indices, np.arange(len(ENERGIES))]
+                       - target)
+    assert np.all(residuals <= 5.0)
+    assert np.allclose(residuals, schedule.residuals)
+    # Never worse than picking the best combination at each step
+    mask = combinations.candidates()
+    greedy = np.argmin(np.where(mask[:, None], np.abs(images - target), np.inf),
+                       axis=0)
+    greedy_moves = actuations(combinations.xrt_index[greedy[:-1]],
+                              combinations.tfs_mask[greedy[:-1]],
+                              combinations.xrt_index[greedy[1:]],
+                              combinations.tfs_mask[greedy[1:]]).sum()
+    assert schedule.total_actuations <= greedy_moves
+    schedule.show_info()
+
+
+def test_plan_focus_schedule_initial(combinations):
+    target = combinations.image(ENERGY)[19]
+    schedule = plan_focus_schedule(combinations, [ENERGY], target, 0.1,
+                                   initial=19)
+    assert schedule.indices[0] == 19
+    assert schedule.total_actuations == 0
+
+
+def test_plan_focus_schedule_unreachable(combinations):
+    with pytest.raises(ValueError):
+        plan_focus_schedule(combinations, ENERGIES, 1e6, 1.0)
+
+
+def test_focus_schedule_scan(transfocator):
+    insert(transfocator.tfs_02)
+    schedule = transfocator.plan_energy_scan(ENERGIES, 1e3, target=300.0)
+    assert schedule.indices[0] == schedule.indices[-1]
+    energy = SynAxis(name='energy')
+    msgs = list(focus_schedule_scan([], energy, transfocator, schedule))
+    sets = [msg for msg in msgs if msg.command == 'set']
+    # Only the energy moves after the first step
+    assert all(msg.obj is energy for msg in sets[-len(ENERGIES) + 1:])
+    assert len([msg for msg in msgs if msg.command == 'save']) == len(ENERGIES)
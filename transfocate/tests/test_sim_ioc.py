@@ -0,0 +1,134 @@
+import asyncio
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("caproto")
+
+from ..sim_ioc import TransfocatorSimIOC, sim_pvdb  # noqa: E402
+from ..table.faults import FAULT_FIELDS, predict_faults  # noqa: E402
+from ..table.info import tfs_lens_radii  # noqa: E402
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+@pytest.fixture(scope='module')
+def ioc():
+    return TransfocatorSimIOC("SIM:LENS", speedup=1000.0)
+
+
+async def set_bypass(ioc, energy, xrt, tfs):
+    await ioc.bypass_set.write(1)
+    await ioc.bypass_energy.write(energy)
+    await ioc.bypass_positions.write(1)
+    for lens, inserted in zip(ioc.xrt_lenses + ioc.tfs_lenses, xrt + tfs):
+        await lens.bypass_state.write(int(inserted))
+        await lens.bypass_known.write(1)
+
+
+@pytest.mark.parametrize('energy', [3000.0, 9500.0, 25000.0])
+@pytest.mark.parametrize('xrt_lens', [0, 1, 3])
+def test_evaluate(ioc, energy, xrt_lens):
+    xrt = [index + 1 == xrt_lens for index in range(3)]
+    tfs = [False] * 7 + [True, False]
+    run(set_bypass(ioc, energy, xrt, tfs))
+    outputs = ioc.evaluate()
+    expected = predict_faults(energy, xrt_lens, tfs_lens_radii[7],
+                              tables=ioc.tables)
+    assert outputs['energy'] == energy
+    assert outputs['tfs_radius'] == pytest.approx(tfs_lens_radii[7])
+    assert outputs['trip_low'] == pytest.approx(float(expected['trip_low']))
+    for name in FAULT_FIELDS:
+        assert outputs[name] == int(expected[name])
+    assert outputs['state_fault'] == 0
+    assert outputs['faulted'] == int(bool(expected['violated']))
+
+
+def test_publish_latches():
+    ioc = TransfocatorSimIOC("SIM:LENS")
+
+    async def publish(energy):
+        # The 62.5 um lens is in the trip region at 9.5 keV only
+        await set_bypass(ioc, energy, [False] * 3, [False] * 5 + [True] + [False] * 3)
+        await ioc.publish()
+
+    run(publish(9500.0))
+    assert ioc.faulted.value == 1
+    latched = {name: getattr(ioc, f'{name}_latch').value
+               for name in FAULT_FIELDS}
+    assert latched['violated'] == 1
+    run(publish(25000.0))
+    assert ioc.update_seq.value == 2
+    assert ioc.faulted.value == 0
+    for name, value in latched.items():
+        assert getattr(ioc, f'{name}_latch').value == value
+
+
+def test_lens_motion():
+    ioc = TransfocatorSimIOC("SIM:LENS", speedup=1000.0)
+
+    async def insert():
+        lens = ioc.tfs_02
+        await lens.insert.write(1)
+        assert lens.moving
+        assert ioc.lens_states()[2] is False
+        await asyncio.sleep(3 * ioc.motion_time / ioc.speedup)
+        return lens
+
+    lens = run(insert())
+    assert lens.inserted
+    assert lens.state.value == 1
+    assert lens.out.value == 0
+    assert ioc.lens_states()[1][0]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_serve(monkeypatch):
+    from caproto.server import run as serve
+    from caproto.sync.client import read, write
+
+    port = free_port()
+    for name, value in (('EPICS_CA_SERVER_PORT', port),
+                        ('EPICS_CAS_SERVER_PORT', port),
+                        ('EPICS_CA_ADDR_LIST', '127.0.0.1'),
+                        ('EPICS_CA_AUTO_ADDR_LIST', 'NO'),
+                        ('EPICS_CAS_INTF_ADDR_LIST', '127.0.0.1')):
+        monkeypatch.setenv(name, str(value))
+    ioc, _, pvdb = sim_pvdb("SIM:LENS", "SIM:MMS:21", speedup=100.0)
+
+    def target():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        serve(pvdb, interfaces=['127.0.0.1'])
+
+    threading.Thread(target=target, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            seq = read('SIM:LENS:PLC:UPDATE_SEQ', timeout=1).data[0]
+            break
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+    assert read('SIM:MMS:21.PN', timeout=1).data == [b'SIM']
+    write('SIM:LENS:TFS:02:INSERT', [1], timeout=1)
+    write('SIM:LENS:BEAM:ENERGY', [9500.0], timeout=1)
+    deadline = time.monotonic() + 10
+    while read('SIM:LENS:TFS:02:STATE', timeout=1).data[0] != 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert read('SIM:LENS:PLC:UPDATE_SEQ', timeout=1).data[0] > seq
+    radius = read('SIM:LENS:BEAM:TFS_RADIUS', timeout=1).data[0]
+    assert radius == pytest.approx(tfs_lens_radii[0])
+    focus = read('SIM:LENS:TFS:02:FOCUS', timeout=1).data[0]
+    assert np.isfinite(focus) and focus > 0
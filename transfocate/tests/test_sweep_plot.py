@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from transfocate.sweep_plot import (POINT_FIELDS, LiveSweepPlot, SweepPlot,
+                                    classify_points)
+from transfocate.tests.test_table_reconcile import make_scan
+
+
+@pytest.fixture
+def ax():
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig.add_subplot()
+
+
+def test_classify_points():
+    df = make_scan(3)
+    df.loc[0, "tfs_radius"] = 0.0
+    series = classify_points(df)
+    assert len(series["trip_low"][0]) == len(df)
+    assert len(series["no_fault"][0]) == (df.faulted == 0).sum()
+    assert len(series["table_fault"][0]) == (df.table_fault == 1).sum()
+    # Zero radius is shown at 1um on the log scale
+    assert 0.0 not in np.concatenate([y for name, (_, y) in series.items()
+                                      if not name.startswith("trip")])
+
+
+def test_sweep_plot_grows(ax):
+    df = make_scan(1)
+    df["xrt_radius"] = 750.0
+    plot = SweepPlot(1, ax, capacity=16)
+    assert plot.blit
+    for start in range(0, len(df), 50):
+        plot.add(df.iloc[start:start + 50])
+        plot.update()
+    assert len(plot) == len(df)
+    x, y = plot.lines["trip_high"].get_data()
+    assert np.array_equal(x, df.energy)
+    assert np.array_equal(y, df.trip_high)
+    assert plot.xrt_radius == 750.0
+    assert "750.00um" in ax.get_title()
+    plot.finish()
+    assert not plot.lines["no_fault"].get_animated()
+
+
+def test_live_sweep_plot(ax):
+    df = make_scan(2)
+    df["xrt_radius"] = 428.57
+    live = LiveSweepPlot(2, ax=ax, initial=df.iloc[:10], min_interval=0.0)
+    live("start", {"uid": "start", "time": 0.0})
+    for seq_num, (_, row) in enumerate(df.iloc[10:].iterrows(), 1):
+        data = {name: row[name] for name in POINT_FIELDS + ["xrt_radius"]}
+        live("event", {"data": data, "seq_num": seq_num, "descriptor": "d"})
+    live("stop", {"run_start": "start"})
+    assert len(live.plot) == len(df)
+    assert live.plot.xrt_radius == pytest.approx(428.57)
@@ -0,0 +1,100 @@
+import pytest
+
+from transfocate.table import codegen, info, ioc, plc_table
+
+
+@pytest.fixture(scope='module')
+def tables():
+    return dict(info.load_spreadsheet())
+
+
+def _iterrows_header(tables):
+    # The row formatting of the original generator
+    rows = {
+        name: ",\n        ".join(
+            "{{{energy:.6f}, {trip_min:.6f}, {trip_max:.6f}}}".format(**dict(row))
+            for _, row in df.iterrows()
+        )
+        for name, df in tables.items()
+    }
+    return rows
+
+
+def test_format_columns(tables):
+    df = tables['NO_LENS']
+    formatted = codegen.format_columns(df)
+    assert list(formatted) == info.COLUMNS
+    assert formatted['energy'][0] == f"{df.energy.iloc[0]:.6f}"
+    assert formatted['trip_max'][-1] == f"{df.trip_max.iloc[-1]:.6f}"
+
+
+def test_header_matches_row_format(tables):
+    header = ioc.generate_header(tables)
+    for name, rows in _iterrows_header(tables).items():
+        assert rows in header
+        assert f"TABLE_{name}" in header
+
+
+def test_plc_source(tables):
+    source = plc_table.generate_source(tables)
+    df = tables['LENS1_750']
+    last = len(df) - 1
+    assert (
+        f"stLENS1_750[{last}].fHigh := {df.trip_max.iloc[-1]:.6f};" in source
+    )
+    assert f"stLENS1_750 : ARRAY[0..{last}] OF ST_TableRow;" in source
+
+
+def test_tables_hash(tables):
+    assert codegen.tables_hash(tables) == codegen.tables_hash(dict(tables))
+    changed = dict(tables)
+    changed['NO_LENS'] = tables['NO_LENS'].copy()
+    changed['NO_LENS'].iloc[0, 1] += 1.0
+    assert codegen.tables_hash(changed) != codegen.tables_hash(tables)
+
+
+def test_generate_incremental(tables, tmp_path):
+    header = tmp_path / 'mfx_range_table.h'
+    plc = tmp_path / 'FB_EnergyTables.TcPOU'
+    written = codegen.generate(header=header, plc=plc, tables=tables)
+    assert all(written.values())
+    assert header.read_text() == ioc.generate_header(tables)
+    assert plc.read_text() == plc_table.generate_source(tables)
+
+    # Unchanged tables: nothing to do
+    mtime = header.stat().st_mtime_ns
+    written = codegen.generate(header=header, plc=plc, tables=tables)
+    assert not any(written.values())
+    assert header.stat().st_mtime_ns == mtime
+
+    # Forced, changed tables or a missing output regenerate
+    assert all(codegen.generate(header=header, plc=plc, tables=tables,
+                                force=True).values())
+    plc.unlink()
+    written = codegen.generate(header=header, plc=plc, tables=tables)
+    assert written == {str(header): False, str(plc): True}
+
+    changed = dict(tables)
+    changed['NO_LENS'] = tables['NO_LENS'].iloc[:-1]
+    assert all(codegen.generate(header=header, plc=plc, tables=changed).values())
+    assert header.read_text() == ioc.generate_header(changed)
+
+
+def test_main(tmp_path):
+    header = tmp_path / 'table.h'
+    written = codegen.main(['--header', str(header)])
+    assert written == {str(header): True}
+    assert header.exists()
+    assert codegen.main(['--header', str(header)]) == {str(header): False}
+    with pytest.raises(SystemExit):
+        codegen.main([])
+
+
+def test_generate_uniform(tables, tmp_path):
+    header = tmp_path / 'mfx_range_table.h'
+    codegen.generate(header=header, tables=tables)
+    # Changing the option regenerates
+    assert codegen.generate(header=header, tables=tables, uniform=True) == {
+        str(header): True
+    }
+    assert header.read_text() == ioc.generate_header(tables, uniform=True)
@@ -0,0 +1,97 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from transfocate.table import diff, info, ioc
+
+
+@pytest.fixture(scope='module')
+def tables():
+    return dict(info.load_spreadsheet())
+
+
+@pytest.fixture
+def revised(tables):
+    new = {name: df.copy() for name, df in tables.items()}
+    new['LENS2_428'].iloc[100:103, 1] *= 1.01
+    new['LENS1_750'] = new['LENS1_750'].iloc[:-5]
+    return new
+
+
+def make_table(energy, trip_min, trip_max):
+    return pd.DataFrame({'energy': energy, 'trip_min': trip_min,
+                         'trip_max': trip_max})
+
+
+def test_changed_ranges():
+    old = make_table([0.0, 10.0, 20.0, 30.0, 40.0], [1.0] * 5, [5.0] * 5)
+    new = old.copy()
+    new.loc[2, 'trip_max'] = 6.0
+    ranges = diff.changed_ranges(old, new)
+    assert ranges[['energy_low', 'energy_high']].values.tolist() == [[10.0, 30.0]]
+    assert ranges.trip_max_change[0] == 1.0
+    assert ranges.trip_min_change[0] == 0.0
+
+    # A new row which changes nothing, and a change at the end
+    new = make_table([0.0, 10.0, 15.0, 20.0, 30.0, 40.0], [1.0] * 6,
+                     [5.0] * 5 + [4.0])
+    ranges = diff.changed_ranges(old, new)
+    assert ranges[['energy_low', 'energy_high']].values.tolist() == [[30.0, np.inf]]
+    assert diff.changed_ranges(old, old).empty
+
+
+def test_diff_tables(tables, revised):
+    result = diff.diff_tables(tables, revised)
+    assert result.region.tolist() == ['LENS2_428', 'LENS1_750']
+    assert result.xrt_lens.tolist() == [2, 1]
+    energy = tables['LENS2_428'].energy
+    low, high = result.iloc[0][['energy_low', 'energy_high']]
+    assert low == energy.iloc[99] and high == energy.iloc[103]
+    assert diff.diff_tables(tables, tables).empty
+
+    removed = dict(revised)
+    del removed['NO_LENS']
+    result = diff.diff_tables(tables, removed)
+    assert result.iloc[0].region == 'NO_LENS'
+    assert result.iloc[0].energy_high == np.inf
+
+
+def test_sweep_ranges(tables, revised):
+    ranges = diff.sweep_ranges(diff.diff_tables(tables, revised), margin=100.0)
+    assert list(ranges) == [1, 2]
+    assert ranges[1][0][1] == 38000.0
+    energy = tables['LENS2_428'].energy
+    assert ranges[2] == [(energy.iloc[99] - 100.0, energy.iloc[103] + 100.0)]
+
+    merged = pd.DataFrame({'xrt_lens': [0, 0], 'energy_low': [1000.0, 1300.0],
+                           'energy_high': [1100.0, 1400.0]})
+    assert diff.sweep_ranges(merged, margin=100.0) == {0: [(900.0, 1500.0)]}
+
+
+def test_code_updates(tables, revised):
+    updates = diff.code_updates(tables, revised)
+    assert list(updates) == ['LENS2_428', 'LENS1_750']
+    assert updates['LENS2_428']['rows'] == [100, 101, 102]
+    assert updates['LENS2_428']['plc'].count('\n') == 2
+    assert updates['LENS2_428']['plc'].startswith('stLENS2_428[100].fEnergy')
+    assert updates['LENS2_428']['header'] in ioc.generate_header(revised)
+    assert updates['LENS1_750']['rows'] is None
+    assert updates['LENS1_750']['plc'].startswith(
+        f'stLENS1_750 : ARRAY[0..{len(revised["LENS1_750"]) - 1}]'
+    )
+    assert diff.code_updates(tables, tables) == {}
+
+
+def test_write_updates(tables, revised, tmp_path):
+    result = diff.diff_tables(tables, revised)
+    written = diff.write_updates(tmp_path, result,
+                                 diff.code_updates(tables, revised))
+    assert len(written) == 6
+    with open(tmp_path / 'sweep_ranges.json') as fp:
+        assert set(json.load(fp)) == {'1', '2'}
+    loaded = diff.load_sweep_ranges(tmp_path)
+    assert set(loaded) == {1, 2}
+    assert loaded == diff.load_sweep_ranges(tmp_path / 'sweep_ranges.json')
+    assert (tmp_path / 'LENS2_428.st').exists()
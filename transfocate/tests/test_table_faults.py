@@ -0,0 +1,39 @@
+import numpy as np
+
+from transfocate.table.faults import predict_faults, sweep_faults
+from transfocate.table.info import MIN_ENERGY, REQUIRES_LENS_RANGE
+from transfocate.table.interpolate import find_limits
+
+
+def test_min_fault():
+    for xrt_lens, min_energy in MIN_ENERGY.items():
+        faults = predict_faults([min_energy - 1, min_energy + 1], xrt_lens,
+                                10000.0)
+        assert list(faults["min_fault"]) == [True, False]
+
+
+def test_lens_required_fault():
+    low, high = REQUIRES_LENS_RANGE[2]
+    energy = [low - 1, low, (low + high) / 2, high, high + 1]
+    faults = predict_faults(energy, 2, 0.0)
+    assert list(faults["lens_required_fault"]) == [False, True, True, True, False]
+    assert not predict_faults(energy, 2, 1000.0)["lens_required_fault"].any()
+    assert not predict_faults(energy, 0, 0.0)["lens_required_fault"].any()
+
+
+def test_table_fault():
+    energy = 15000.0
+    trip_low, trip_high = find_limits(energy, 0)
+    radius = [trip_low - 1, (trip_low + trip_high) / 2, trip_high + 1]
+    faults = predict_faults(energy, 0, radius)
+    assert list(faults["table_fault"]) == [False, True, False]
+    assert list(faults["violated"]) == [False, True, False]
+    assert np.all(faults["trip_low"] == trip_low)
+
+
+def test_sweep_faults():
+    df = sweep_faults(np.linspace(0, 38000, 100))
+    assert set(df.xrt_lens) == {0, 1, 2, 3}
+    assert df.violated.any() and not df.violated.all()
+    assert (df.violated == (df.min_fault | df.lens_required_fault
+                            | df.table_fault)).all()
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from transfocate.table import harness, info
+
+pytestmark = pytest.mark.skipif(harness.find_compiler() is None,
+                                reason='No C compiler')
+
+
+@pytest.fixture(scope='module')
+def tables():
+    return dict(info.load_spreadsheet())
+
+
+def test_check_header(tables):
+    energies = harness.dense_energies(tables, step=10.0)
+    report = harness.check_header(tables, energies=energies, repeats=1)
+    assert len(report) == len(tables) * len(harness.FUNCTIONS)
+    assert (report.lookups == len(energies)).all()
+    assert (report.mismatches == 0).all()
+    assert (report.lookups_per_second > 0).all()
+
+
+def test_check_header_mismatch(tables, tmp_path):
+    # An implementation using the row below, without interpolating
+    source = tmp_path / 'find_limits.c'
+    source.write_text(
+        harness.REFERENCE_SOURCE.replace('* offset + low->low', '* 0.0 + low->low')
+    )
+    energies = np.array([6000.5, 12345.6, 30000.1])
+    report = harness.check_header(tables, energies=energies, source=source,
+                                  repeats=1).set_index('function')
+    assert (report.loc['find_limits', 'mismatches'] > 0).all()
+    assert (report.loc['find_limits_uniform', 'mismatches'] == 0).all()
+
+
+def test_dense_energies(tables):
+    energies = harness.dense_energies(tables, step=100.0, margin=500.0)
+    assert np.all(np.diff(energies) > 0)
+    for df in tables.values():
+        assert np.isin(df.energy.to_numpy(), energies).all()
+    assert energies.max() > max(df.energy.max() for df in tables.values())
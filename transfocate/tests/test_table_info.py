@@ -0,0 +1,58 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from transfocate.table import info
+
+
+@pytest.fixture(scope='function')
+def spreadsheet(tmp_path):
+    path = tmp_path / 'tables.xlsx'
+    shutil.copy(info.SPREADSHEET, path)
+    return path
+
+
+def test_read_spreadsheet():
+    tables = dict(info.read_spreadsheet())
+    assert list(tables) == list(info.REGIONS)
+    for df in tables.values():
+        assert list(df.columns) == info.COLUMNS
+        assert df.index.name == 'energy'
+        assert df.energy.is_monotonic_increasing
+        assert df.trip_max.max() <= 1e4
+
+
+def test_data_is_lazy(spreadsheet):
+    data = info.SpreadsheetData(spreadsheet)
+    assert data._tables is None
+    assert list(data) == list(info.REGIONS)
+    assert data._tables is not None
+
+
+def test_load_spreadsheet_cache(spreadsheet, monkeypatch):
+    tables = info.load_spreadsheet(spreadsheet)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("Spreadsheet should not be parsed")
+
+    # Unchanged file is read from the cache
+    monkeypatch.setattr(info, 'read_spreadsheet', fail)
+    cached = info.load_spreadsheet(spreadsheet)
+    for name, df in tables.items():
+        pd.testing.assert_frame_equal(df, cached[name])
+    # Touching the file keeps the cache valid, as the contents are the same
+    stat = os.stat(spreadsheet)
+    os.utime(spreadsheet, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    info.load_spreadsheet(spreadsheet)
+    # ... and records the new modification time, so it is not hashed again
+    monkeypatch.setattr(info, '_file_hash', fail)
+    info.load_spreadsheet(spreadsheet)
+    monkeypatch.undo()
+    monkeypatch.setattr(info, 'read_spreadsheet', fail)
+    # Modified contents are parsed again
+    with open(spreadsheet, 'ab') as fp:
+        fp.write(b'\0')
+    with pytest.raises(RuntimeError):
+        info.load_spreadsheet(spreadsheet)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from transfocate.table.info import XRT_LENS_TABLES
+from transfocate.table.info import data as spreadsheet_data
+from transfocate.table.interpolate import LimitTables, find_limits
+
+
+def test_find_limits_at_knots():
+    for xrt_lens, name in XRT_LENS_TABLES.items():
+        df = spreadsheet_data[name]
+        trip_min, trip_max = find_limits(df.energy, xrt_lens)
+        assert np.array_equal(trip_min, df.trip_min)
+        assert np.array_equal(trip_max, df.trip_max)
+
+
+def test_find_limits_vectorized():
+    rng = np.random.default_rng(0)
+    energy = rng.uniform(0, 40e3, 1000)
+    xrt_lens = rng.integers(0, 4, 1000)
+    trip_min, trip_max = find_limits(energy, xrt_lens)
+    assert trip_min.shape == energy.shape
+    # Compare against interpolating each point on its own
+    for idx in range(0, 1000, 37):
+        df = spreadsheet_data[XRT_LENS_TABLES[xrt_lens[idx]]]
+        assert trip_min[idx] == np.interp(energy[idx], df.energy, df.trip_min)
+        assert trip_max[idx] == np.interp(energy[idx], df.energy, df.trip_max)
+    # Broadcast a single lens against many energies
+    low, high = find_limits(energy, 2)
+    assert low.shape == energy.shape
+
+
+def test_find_limits_bad_lens():
+    with pytest.raises(ValueError):
+        LimitTables().find_limits([9000.0], [4])
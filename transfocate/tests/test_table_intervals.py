@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from transfocate.table.faults import predict_faults
+from transfocate.table.intervals import (AllowedEnergyIndex, allowed_intervals,
+                                         limit_crossings)
+
+
+@pytest.fixture(scope='module')
+def index():
+    return AllowedEnergyIndex()
+
+
+def test_limit_crossings():
+    energy = np.array([1000.0, 2000.0, 3000.0])
+    limit = np.array([10.0, 30.0, 20.0])
+    low, middle, high = limit_crossings(energy, limit, [5.0, 25.0, 40.0])
+    assert not len(low) and not len(high)
+    assert np.allclose(middle, [1750.0, 2500.0])
+    assert np.allclose(np.interp(middle, energy, limit), 25.0)
+
+
+def test_allowed_intervals_match_faults():
+    radii = [0.0, 50.0, 125.0, 500.0]
+    energy = np.linspace(0, 40000, 4001)
+    for xrt_lens in range(4):
+        for radius, intervals in zip(radii, allowed_intervals(xrt_lens, radii)):
+            expected = ~predict_faults(energy, xrt_lens, radius)['violated']
+            inside = np.zeros(energy.shape, dtype=bool)
+            for low, high in intervals:
+                inside |= (energy >= low) & (energy <= high)
+            # Only the breakpoints themselves may disagree
+            assert np.sum(inside != expected) <= 2 * len(intervals)
+
+
+def test_allowed_energy_index(index):
+    assert len(index) == 4 * 2 ** 9
+    for energy in (7000.0, 10000.0, 20000.0):
+        mask = index.allowed_mask(energy)
+        predicted = predict_faults(energy, index.xrt_index, index.tfs_radius)
+        assert np.sum(mask != ~predicted['violated']) == 0
+        assert np.array_equal(index.allowed_at(energy), np.flatnonzero(mask))
+
+
+def test_allowed_energy_index_stays_allowed(index):
+    combo = index.allowed_at(20000.0)[0]
+    intervals = index.intervals_for(combo)
+    low, high = next((low, high) for low, high in intervals
+                     if low <= 20000.0 <= high)
+    assert index.stays_allowed(combo, low, min(high, 40000.0))
+    if low > 0:
+        assert not index.stays_allowed(combo, low - 100.0, 20000.0)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from transfocate.table.faults import predict_faults
+from transfocate.table.reconcile import reconcile, reconciliation_summary
+
+
+def make_scan(xrt_lens, radius=100.0):
+    energy = np.linspace(1000.0, 30000.0, 300)
+    predicted = predict_faults(energy, xrt_lens, radius)
+    df = pd.DataFrame({"energy": energy, "tfs_radius": radius})
+    df["trip_low"] = predicted["trip_low"]
+    df["trip_high"] = predicted["trip_high"]
+    for name in ["min_fault", "lens_required_fault", "table_fault", "violated"]:
+        df[name] = predicted[name].astype(int)
+    df["faulted"] = df["violated"]
+    return df
+
+
+def test_reconcile_agrees():
+    for xrt_lens in range(4):
+        result = reconcile(make_scan(xrt_lens), xrt_lens)
+        assert not result.discrepancy.any()
+
+
+def test_reconcile_discrepancies():
+    df = make_scan(3)
+    df.loc[10, "trip_low"] += 5.0
+    flipped = np.flatnonzero(~reconcile(df, 3).ambiguous)[20]
+    df.loc[flipped, "table_fault"] = 1 - df.loc[flipped, "table_fault"]
+    result = reconcile(df, 3)
+    assert result.discrepancy.sum() == 2
+    assert result.trip_low_mismatch.tolist().index(True) == 10
+    assert np.flatnonzero(result.table_fault_mismatch).tolist() == [flipped]
+
+
+def test_reconcile_ambiguous():
+    df = make_scan(3)
+    # Exactly at the minimum energy, the PLC may go either way
+    df.loc[0, "energy"] = 9500.0
+    df.loc[0, "min_fault"] = 1
+    result = reconcile(df, 3)
+    assert result.ambiguous[0]
+    assert not result.discrepancy[0]
+
+
+def test_reconciliation_summary():
+    df = make_scan(1)
+    df.loc[5, "trip_high"] = 0.0
+    summary = reconciliation_summary({1: reconcile(df, 1), 0: reconcile(make_scan(0), 0)})
+    assert summary.index.tolist() == [0, 1]
+    assert summary.loc[1, "points"] == len(df)
+    assert summary.loc[1, "trip_high"] == 1
+    assert summary.loc[1, "discrepancy"] == 1
+    assert summary.loc[0, "discrepancy"] == 0
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from transfocate.table import info, ioc, plc_table, uniform
+
+
+@pytest.fixture(scope='module')
+def tables():
+    return dict(info.load_spreadsheet())
+
+
+def test_locate_matches_search(tables):
+    energy = tables['LENS2_428'].energy.to_numpy()
+    index = uniform.UniformIndex(energy)
+    points = np.concatenate([
+        energy, np.nextafter(energy, -np.inf), np.nextafter(energy, np.inf),
+        np.random.default_rng(1).uniform(energy[0], energy[-1], 10000),
+    ])
+    points = np.clip(points, energy[0], energy[-1])
+    expected = np.clip(np.searchsorted(energy, points, side='right') - 1,
+                       0, len(energy) - 2)
+    np.testing.assert_array_equal(index.locate(points), expected)
+
+
+@pytest.mark.parametrize('name', list(info.REGIONS))
+def test_interpolate_matches_table(tables, name):
+    df = tables[name]
+    index = uniform.UniformIndex(df.energy.to_numpy())
+    points = np.linspace(0.0, 40000.0, 20001)
+    for column in ('trip_min', 'trip_max'):
+        np.testing.assert_allclose(
+            index.interpolate(points, df[column].to_numpy()),
+            np.interp(points, df.energy, df[column]),
+            rtol=1e-12,
+        )
+        assert index.max_error(df[column].to_numpy()) <= 1e-9
+
+
+def test_step_validation():
+    energy = [0.0, 1.0, 3.0]
+    assert len(uniform.UniformIndex(energy)) == 7
+    with pytest.raises(ValueError):
+        uniform.UniformIndex(energy, step=1.0)
+    with pytest.raises(ValueError):
+        uniform.UniformIndex([0.0, 1.0, 1.0])
+    with pytest.raises(ValueError):
+        uniform.UniformIndex([0.0])
+
+
+def test_uniform_indices(tables):
+    indices = uniform.uniform_indices(tables)
+    assert list(indices) == list(tables)
+    for name, index in indices.items():
+        assert index.step < np.diff(tables[name].energy).min()
+
+
+def test_run_lengths():
+    assert uniform.run_lengths([]) == []
+    assert uniform.run_lengths([0, 0, 1, 2, 2, 2]) == [(2, 0), (1, 1), (3, 2)]
+
+
+def test_generated_code(tables):
+    small = {
+        'NO_LENS': pd.DataFrame({'energy': [1000.0, 2000.0, 2500.0],
+                                 'trip_min': [1.0, 2.0, 3.0],
+                                 'trip_max': [10.0, 20.0, 30.0]}),
+    }
+    header = ioc.generate_header(small, uniform=True)
+    assert 'find_limits_uniform' in header
+    assert ('static const short UNIFORM_NO_LENS_BUCKETS[7] = {\n'
+            '    0, 0, 0, 0, 1, 1, 1\n};') in header
+    assert header.startswith(ioc.generate_header(small).rsplit('#endif', 1)[0])
+
+    source = plc_table.generate_source(small, uniform=True)
+    assert 'nNO_LENSBuckets : ARRAY[0..6] OF INT := [4(0), 3(1)];' in source
+    assert '<Method Name="M_FindLimits"' in source
+    assert '0: (* stNO_LENS *)' in source
+    assert 'M_FindLimits' not in plc_table.generate_source(small)
@@ -133,3 +133,23 @@ def test_constant_energy_bad_input(transfocator):
     with pytest.raises(AttributeError):
         wrapped_func = constant_energy(nothing)
         wrapped_func(transfocator, 'bad_input_string', 0.1)
+
+
+def test_transfocator_find_best_combo_interlock(transfocator):
+    assert transfocator.xrt_indices == [3, 2, 1]
+    # Below the minimum energy of every pre-focus lens
+    combo = transfocator.find_best_combo(312.5, interlock=True, energy=5000.0)
+    assert combo is None
+    combo = transfocator.find_best_combo(312.5, interlock=True, energy=5000.0,
+                                         include_prefocus=False)
+    assert combo is not None
+    assert all(lens in transfocator.tfs_lenses for lens in combo.lenses)
+
+
+def test_transfocator_focus_at_no_combo(transfocator):
+    with pytest.raises(ValueError, match='5000.0 eV'):
+        transfocator.focus_at(value=312.5, interlock=True, energy=5000.0)
+    # Nothing was commanded to move
+    for lens in transfocator.xrt_lenses + transfocator.tfs_lenses:
+        assert lens._insert.get() == 0
+        assert lens._remove.get() == 0
@@ -8,7 +8,11 @@ from ophyd.status import wait as status_wait
 from pcdsdevices.device_types import IMS
 
 from .calculator import Calculator
+from .chromatic import CombinationTable
+from .combinations import combination_index
+from .focus_map import FocusMap
 from .lens import Lens, LensConnect, LensTripLimits
+from .schedule import plan_focus_schedule
 
 logger = logging.getLogger(__name__)
 
@@ -121,6 +125,7 @@ class Transfocator(Device):
 
     def __init__(self, prefix, *, nominal_sample=399.88103, **kwargs):
         self.nominal_sample = nominal_sample
+        self.focus_map = None
         super().__init__(prefix, **kwargs)
 
     @property
@@ -145,6 +150,13 @@ class Transfocator(Device):
         """
         return [lens for lens in self.lenses if 'TFS' in lens.prefix]
 
+    @property
+    def xrt_indices(self):
+        """
+        Index of each XRT lens in the interlock tables
+        """
+        return [int(lens.prefix.rsplit(':', 1)[-1]) for lens in self.xrt_lenses]
+
     @property
     def current_focus(self):
         """
@@ -163,10 +175,40 @@ class Transfocator(Device):
         # Calculate the image from this set of lenses
         return LensConnect(*inserted).image(0.0) - self.nominal_sample
 
-    def find_best_combo(self, target=None, show=True, **kwargs):
+    def load_focus_map(self, path):
+        """
+        Use a precomputed focus map in :meth:`.find_best_combo`
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            File written by :func:`.build_focus_map`
+
+        Raises
+        ------
+        ValueError
+            If the map was computed for a different lens geometry
+        """
+        focus_map = FocusMap.load(path)
+        combinations = CombinationTable.from_lenses(
+            self.xrt_lenses, self.tfs_lenses, z_obj=focus_map.metadata['z_obj']
+        )
+        if focus_map.geometry_hash != combinations.geometry_hash:
+            raise ValueError(f"Focus map {path} was computed for a different "
+                             f"lens geometry")
+        self.focus_map = focus_map
+        return focus_map
+
+    def find_best_combo(self, target=None, show=True, energy=None,
+                        refine=False, interlock=False, **kwargs):
         """
         Calculate the best lens array to hit the nominal sample point
 
+        If a focus map has been loaded with :meth:`.load_focus_map` the
+        combination is looked up in the map instead of being calculated,
+        unless the energy or target lies outside of the map or the map has
+        no valid combination there.
+
         Parameters
         ----------
         target : float, optional
@@ -176,18 +218,109 @@ class Transfocator(Device):
         show : bool, optional
             Print a table of the of the calculated lens combination
 
+        energy : float, optional
+            Photon energy used for the focus map lookup and the interlock
+            check. By default this is the current `beam_energy`
+
+        refine : bool, optional
+            Choose among the combinations of the neighbouring cells of the
+            focus map using the image calculated from the current focal
+            length of each lens
+
+        interlock : bool, optional
+            Only consider combinations that the interlock allows at the
+            photon energy. If none of the focus map candidates are allowed,
+            the combination is calculated instead
+
         kwargs:
-            Passed to :meth:`.Calculator.find_solution`
+            Passed to :meth:`.Calculator.find_solution`. Ignored when using a
+            focus map, which uses the settings it was computed with
         """
         target = target or self.nominal_sample
-        calc = Calculator(self.xrt_lenses, self.tfs_lenses)
-        combo = calc.find_solution(target, **kwargs)
+        if energy is None and (interlock or self.focus_map is not None):
+            energy = self.beam_energy.get()
+        calc = Calculator(self.xrt_lenses, self.tfs_lenses,
+                          xrt_indices=self.xrt_indices)
+        use_map = self.focus_map is not None
+        if use_map and not self.focus_map.covers(energy, target):
+            logger.warning("%s eV and %s m are outside of the focus map, "
+                           "calculating a combination", energy, target)
+            use_map = False
+        if use_map:
+            combo = self._lookup_combo(target, energy, refine,
+                                       calc if interlock else None)
+            if combo is None:
+                logger.info("No usable focus map candidate, calculating a "
+                            "combination")
+                combo = calc.find_solution(target,
+                                           energy=energy if interlock else None,
+                                           **kwargs)
+        else:
+            combo = calc.find_solution(target,
+                                       energy=energy if interlock else None,
+                                       **kwargs)
         if combo:
             combo.show_info()
         else:
             logger.error("Unable to find a valid solution for target")
         return combo
 
+    def _lookup_combo(self, target, energy, refine, calc=None):
+        """Find the best combination in the focus map"""
+        combinations = self.focus_map.combinations
+        if refine:
+            indices = self.focus_map.neighbours(energy, target)
+        else:
+            index, _ = self.focus_map.lookup(energy, target)
+            indices = [index] if index >= 0 else []
+        combos = [combinations.to_lens_connect(index, self.xrt_lenses,
+                                               self.tfs_lenses)
+                  for index in indices]
+        # Remove the candidates the interlock would fault on
+        if calc is not None and combos:
+            allowed = calc.allowed(combos, energy)
+            combos = [combo for combo, ok in zip(combos, allowed) if ok]
+        if not combos:
+            return None
+        z_obj = self.focus_map.metadata['z_obj']
+        return min(combos, key=lambda combo: abs(combo.image(z_obj) - target))
+
+    def plan_energy_scan(self, energies, tolerance, target=None, **kwargs):
+        """
+        Plan the lens combinations to keep the focus during an energy scan
+
+        The schedule minimizes the number of lens motions starting from the
+        currently inserted lenses, see :func:`.plan_focus_schedule`
+
+        Parameters
+        ----------
+        energies : array_like
+            Photon energy of each step of the scan in eV
+
+        tolerance : float
+            Allowed distance between the image and the target
+
+        target : float, optional
+            The target image of the lens array. By default this is
+            `nominal_sample`
+
+        kwargs:
+            Passed to :func:`.plan_focus_schedule`
+
+        Returns
+        -------
+        FocusSchedule
+        """
+        target = target or self.nominal_sample
+        combinations = CombinationTable.from_lenses(self.xrt_lenses,
+                                                    self.tfs_lenses)
+        inserted = [lens for lens in self.lenses if lens.inserted]
+        kwargs.setdefault('initial', combination_index(self.xrt_lenses,
+                                                       self.tfs_lenses,
+                                                       inserted))
+        return plan_focus_schedule(combinations, energies, target, tolerance,
+                                   **kwargs)
+
     def set(self, value, **kwargs):
         """
         Set the Transfocator focus
@@ -212,16 +345,29 @@ class Transfocator(Device):
             Timeout for motion
 
         kwargs:
-            All passed to :meth:`.find_best_combo`
+            All passed to :meth:`.find_best_combo`, e.g. ``interlock=True``
+            to only command combinations the interlock allows
 
         Returns
         -------
         StateStatus
             Status that represents whether the move is complete
+
+        Raises
+        ------
+        ValueError
+            If no combination is found, e.g. because the interlock allows
+            none at the photon energy. No lens is moved
         """
         # Find the best combination of lenses to match the target image
         plane = value or self.nominal_sample
         best_combo = self.find_best_combo(target=plane, **kwargs)
+        if best_combo is None:
+            energy = kwargs.get('energy')
+            if energy is None:
+                energy = self.beam_energy.get()
+            raise ValueError(f"No valid lens combination focuses at {plane} "
+                             f"at {energy} eV")
         # Collect status to combine
         statuses = list()
         # Only tell one XRT lens to insert